@@ -1,43 +1,34 @@
 import os
 import csv
-from scipy.integrate import cumtrapz
+import numpy as np
 from scipy import signal
-import matplotlib.pyplot as plt
-from scipy.signal import butter
-import statistics
+from ChatterCore import decimation_factor, classic_window_indicator
 
 directory = "VibrationData/HurcoVMX42SRTi/4140SteelCutsAlongX"
+CHANNELS=[1,2] #Columns of the acceleration channels that are analyzed together. Use [1,2,3] to include Z.
+ANALYSIS_RATE=None #Rate, in Hz, every window is decimated to before integration, e.g. 2000. None analyzes every reading.
+PRECISION=np.float64 #Type the readings are analyzed in. np.float32 halves their memory, see PrecisionReport.py.
 
 for filename in os.listdir(directory):
     f = os.path.join(directory, filename)
     # checking if it is a file
     if os.path.isfile(f):
 
-        accelX=[]
         timeXF=[] #Stores the time at which sensor readings have been taken.
-        accelY=[]
-        timeYF=[] #Stores the time at which sensor readings have been taken.
+        accel=[] #Stores the readings of every channel, one row per reading.
 
         filename=f
         with open(filename,mode="r") as file:
             csvFile = csv.reader(file)
             for lines in csvFile:
                 try: #Skip the lines of data at the beginning that do not contain sensor readings.
-                    timeXF.append(float(lines[0]))
-                    accelX.append(float(lines[1]))
+                    row=[float(lines[column]) for column in [0]+CHANNELS]
                 except:
-                    pass
-        with open(filename,mode="r") as file:
-            csvFile = csv.reader(file)
-            for lines in csvFile:
-                try: #Skip the lines of data at the beginning that do not contain sensor readings.
-                    timeYF.append(float(lines[0]))
-                    accelY.append(float(lines[2]))
-                except:
-                    pass
-
-        accelX=signal.detrend(accelX,type="constant")
-        accelY=signal.detrend(accelY,type="constant")
+                    continue
+                timeXF.append(row[0])
+                accel.append(row[1:])
+        timeXF=np.array(timeXF)
+        accel=signal.detrend(np.array(accel,dtype=PRECISION).T,type="constant",axis=-1) #One row per channel.
 
         PCB_RATE=8000 #Sampling frequency of PCB wired sensor.
         EBI_RATE=1600 #Sampling frequency of EBI bluetooth sensor.
@@ -59,23 +50,17 @@ for filename in os.listdir(directory):
 
         f_pass=200 #Pass frequency in Hz.
         f_stop=150 #Stop frequency in Hz.
-        wp=f_pass/(f_sample/2) #Calculated omega pass frequency for analog filtering.
-        ws=f_stop/(f_sample/2) #Calculated omega stop frequency for analog filtering.
+        decimation=decimation_factor(f_sample,ANALYSIS_RATE) #See DecimationReport.py for how closely decimated windows follow the full rate.
+        wp=f_pass/(f_sample/decimation/2) #Calculated omega pass frequency for analog filtering.
+        ws=f_stop/(f_sample/decimation/2) #Calculated omega stop frequency for analog filtering.
         g_pass=3 #Pass loss in dB.
         g_stop=40 #Stop attenuation in dB.
         N,Wn=signal.buttord(wp,ws,g_pass,g_stop)
 
-        def butter_highpass(N, Wn): #Helper function to apply Butterworth filter to data.
-            return butter(N,Wn,'high',output="sos")
-
-        def butter_highpass_filter(data, N,Wn): #Function to apply Butterworth filter to data.
-            sos = butter_highpass(N,Wn)
-            y = signal.sosfilt(sos, data)
-            return y
+        sos=signal.butter(N,Wn,'high',output="sos")
 
         windowTime=0.3 #A range of 0.3 seconds of data will be analyzed at a time.
         revolutionTime=60/SPINDLE_RPM #Time it takes for the spindle to rotate a full term. Used to approximate bisection point timings.
-        poincare=6.9 #The specific time of the poincare section that will be graphed so bisection point and trajectory plotting can be verified.
         packageResolution=0.1 #Every 0.1 seconds, a new window of data will be analyzed.
         lens=int(len(timeXF)/timeXF[-1]*packageResolution) #Calculates how many readings will be analyzed at a time.
 
@@ -91,56 +76,12 @@ for filename in os.listdir(directory):
                 break
 
             timeX=timeXF[startW:endW] #Creating a new array that will temporarily store the times for the readings in the analysis window.
-            timeY=timeYF[startW:endW] #Creating a new array that will temporarily store the times for the readings in the analysis window.
-
-            filtaccelX=accelX[startW:endW]
-            filtaccelX=signal.detrend(filtaccelX, type="linear")
-            filtaccelX=butter_highpass_filter(filtaccelX,N,Wn)
-
-            filtaccelY=accelY[startW:endW]
-            filtaccelY=signal.detrend(filtaccelY, type="linear")
-            filtaccelY=butter_highpass_filter(filtaccelY,N,Wn)
-
-            veloX=cumtrapz(filtaccelX,timeX,initial=0.0)
-            veloY=cumtrapz(filtaccelY,timeY,initial=0.0)
-            veloX=signal.detrend(veloX, type="linear")
-            veloY=signal.detrend(veloY, type="linear")
-            dispX=cumtrapz(veloX,timeX,initial=0.0)
-            dispY=cumtrapz(veloY,timeY,initial=0.0)
-
-            prevTim=timeX[0]
-            bisX=[] #Stores X-value of bisection points.
-            bisY=[] #Stores Y-value of bisection points.
-            for tindex in range(len(timeX)):
-                if timeX[tindex]>=(prevTim+revolutionTime): #Checks to see if enough time has passed for a full rotation,
-                    bisX.append(dispX[tindex])              #meaning that the bisection point would ideally be in the same position again.
-                    bisY.append(dispY[tindex])
-                    prevTim=timeX[tindex]
-            if windex==(poincare*10-windowTime/packageResolution):
-                """
-                plt.figure(1)
-                plt.clf()
-                plt.plot(timeX,filtaccelX,label="accelerationX")
-                plt.plot(timeY,filtaccelY,label="accelerationY")
-                plt.legend(facecolor = 'gray', title = 'Legend',loc = 'upper left')
-                plt.figure(2)
-                plt.clf()
-                plt.plot(timeX,veloX,label="velocityX")
-                plt.plot(timeY,veloY,label="velocityY")
-                plt.legend(facecolor = 'gray', title = 'Legend',loc = 'upper left')
-                plt.figure(3)
-                plt.clf()
-                plt.plot(timeX,dispX,label="displacementX")
-                plt.plot(timeY,dispY,label="displacementY")
-                plt.legend(facecolor = 'gray', title = 'Legend',loc = 'upper left')
-                """
-
-            #Taking the standard deviation of the bisection points and of the overall trajectory, then calculating the chatter indicator from them.
-            sX=statistics.stdev(bisX)
-            sY=statistics.stdev(bisY)
-            tX=statistics.stdev(dispX)
-            tY=statistics.stdev(dispY)
-            chatterIndicator=sX*sY/(tX*tY)
+
+            #Every channel is decimated, detrended, filtered and integrated twice in one batch. A bisection point is taken
+            #every time enough time has passed for a full rotation, meaning that the bisection point would ideally be in
+            #the same position again. The chatter indicator compares the spread of the bisection points with the spread
+            #of the overall trajectory.
+            chatterIndicator=classic_window_indicator(accel[:,startW:endW],timeX,sos,revolutionTime,decimation)
             chatsT.append(windex*packageResolution+windowTime+2*timeXF[0]-timeXF[1])
             chatsI.append(chatterIndicator)
 
@@ -0,0 +1,187 @@
+"""
+Anomaly detector for chatter based on a small autoencoder, written with NumPy only.
+The model is trained on windows of stable cutting and learns to reconstruct their log-magnitude
+spectrum. Windows it cannot reconstruct well, such as windows where chatter frequencies appear, get a
+high loss. Losses are divided by the 99th percentile of the training losses, so a loss above 1 means
+the window looks unlike anything seen during stable cutting.
+
+Scoring is vectorized over batches of windows (one FFT and two matrix products per batch), so it can
+run inside the live detector at 8 kHz on a CPU. The model is saved as a small .npz file.
+"""
+
+import os
+import numpy as np
+from ChatterCore import LazyModule, load_recording, load_column
+
+plt=LazyModule("matplotlib.pyplot")
+
+DEFAULT_MODEL=os.path.join(os.path.dirname(os.path.abspath(__file__)),"ChatterAutoEncoder.npz")
+
+
+def sliding_windows(accel, window, hop):
+    #Returns a (windows x channels x window) view of a (channels x readings) array without copying.
+    if accel.shape[1]<window:
+        return np.empty((0,accel.shape[0],window),dtype=accel.dtype),np.empty(0,dtype=int)
+    view=np.lib.stride_tricks.sliding_window_view(accel,window,axis=1)[:,::hop]
+    starts=np.arange(view.shape[1])*hop
+    return view.transpose(1,0,2),starts
+
+
+class ChatterAutoEncoder:
+    def __init__(self, modelPath=DEFAULT_MODEL, hidden=16):
+        self.modelPath=modelPath
+        self.hidden=hidden #Size of the bottleneck layer.
+        self.window=None #Readings per analyzed window.
+        self.f_sample=None #Sampling frequency the model was trained at.
+        self.channels="XY"
+        self.taper=None
+        self.featureMean=None
+        self.featureStd=None
+        self.W1=None
+        self.b1=None
+        self.W2=None
+        self.b2=None
+        self.lossScale=1.0 #99th percentile of the training losses.
+
+        self.filename=None
+        self.times=None
+        self.accel=None
+        self.lossT=None #Centre time of every scored window.
+        self.lossW=None #Normalized loss of every scored window.
+        self.lossV=None #Normalized loss spread back onto every reading.
+        self.chatter=None #True for readings whose loss is above 1.
+        if modelPath is not None and os.path.exists(modelPath):
+            self.load(modelPath)
+
+    def features(self, windows):
+        #Log-magnitude spectrum of every channel of every window, standardized with the training statistics.
+        spectrum=np.abs(np.fft.rfft(windows*self.taper,axis=-1))
+        feats=np.log1p(spectrum).reshape(len(windows),-1)
+        if self.featureMean is None:
+            return feats
+        return (feats-self.featureMean)/self.featureStd
+
+    def _forward(self, feats):
+        hidden=np.tanh(feats@self.W1+self.b1)
+        return hidden,hidden@self.W2+self.b2
+
+    def score_windows(self, windows):
+        #Normalized reconstruction loss of a (windows x channels x window) batch.
+        feats=self.features(np.asarray(windows,dtype=np.float64))
+        _,recon=self._forward(feats)
+        return np.mean((recon-feats)**2,axis=1)/self.lossScale
+
+    def score_latest(self, accel):
+        #Loss of the most recent full window of a (channels x readings) buffer, for use in a live loop.
+        accel=np.asarray(accel,dtype=np.float64)
+        return float(self.score_windows(accel[None,:,-self.window:])[0])
+
+    def fit(self, windows, f_sample, epochs=60, batch_size=256, learning_rate=1e-3, seed=0):
+        #Trains on a (windows x channels x window) array of stable-cut readings with minibatch Adam.
+        windows=np.asarray(windows,dtype=np.float64)
+        self.window=windows.shape[-1]
+        self.f_sample=f_sample
+        self.taper=np.hanning(self.window)
+        self.featureMean=None
+        feats=self.features(windows)
+        self.featureMean=feats.mean(axis=0)
+        self.featureStd=feats.std(axis=0)+1e-6
+        feats=(feats-self.featureMean)/self.featureStd
+
+        rng=np.random.default_rng(seed)
+        inputs=feats.shape[1]
+        params=[rng.normal(0,1/np.sqrt(inputs),(inputs,self.hidden)),np.zeros(self.hidden),
+                rng.normal(0,1/np.sqrt(self.hidden),(self.hidden,inputs)),np.zeros(inputs)]
+        self.W1,self.b1,self.W2,self.b2=params
+        firstMoment=[np.zeros_like(p) for p in params]
+        secondMoment=[np.zeros_like(p) for p in params]
+        step=0
+        for _ in range(epochs):
+            order=rng.permutation(len(feats))
+            for batchStart in range(0,len(feats),batch_size):
+                batch=feats[order[batchStart:batchStart+batch_size]]
+                hidden,recon=self._forward(batch)
+                gradRecon=2*(recon-batch)/batch.size
+                gradHidden=(gradRecon@self.W2.T)*(1-hidden**2)
+                grads=[batch.T@gradHidden,gradHidden.sum(axis=0),hidden.T@gradRecon,gradRecon.sum(axis=0)]
+                step+=1
+                for p,g,m,v in zip(params,grads,firstMoment,secondMoment):
+                    m*=0.9
+                    m+=0.1*g
+                    v*=0.999
+                    v+=0.001*g*g
+                    p-=learning_rate*(m/(1-0.9**step))/(np.sqrt(v/(1-0.999**step))+1e-8)
+        self.lossScale=1.0
+        trainLoss=self.score_windows(windows)
+        self.lossScale=float(np.percentile(trainLoss,99))
+        return trainLoss/self.lossScale
+
+    def train(self, filenames, column_order="TXYZ", window=200, hop=None, stableCI=0.9, **fitOptions):
+        #Collects stable windows from recordings and trains on them. Recordings with a "CI Value" column
+        #(written by CI_Generator.py) only contribute readings whose indicator is below stableCI.
+        hop=hop or window//2
+        batches=[]
+        f_sample=None
+        for filename in filenames:
+            times,accel=load_recording(filename,column_order,self.channels,drop_first=False)
+            f_sample=f_sample or int(len(times)/(times[-1]-times[0]))
+            windows,starts=sliding_windows(accel,window,hop)
+            ci=load_column(filename,"CI Value",drop_first=False) #None when the recording has no labels.
+            if ci is not None:
+                windowCI=np.lib.stride_tricks.sliding_window_view(ci,window)[::hop].max(axis=1) if len(starts) else np.empty(0)
+                windows=windows[windowCI<stableCI]
+            batches.append(np.array(windows))
+        losses=self.fit(np.concatenate(batches),f_sample,**fitOptions)
+        self.save(self.modelPath)
+        return losses
+
+    def save(self, modelPath):
+        np.savez_compressed(modelPath,window=self.window,f_sample=self.f_sample,channels=self.channels,
+                            featureMean=self.featureMean,featureStd=self.featureStd,W1=self.W1,b1=self.b1,
+                            W2=self.W2,b2=self.b2,lossScale=self.lossScale)
+
+    def load(self, modelPath):
+        with np.load(modelPath) as model:
+            self.window=int(model["window"])
+            self.f_sample=float(model["f_sample"])
+            self.channels=str(model["channels"])
+            self.featureMean=model["featureMean"]
+            self.featureStd=model["featureStd"]
+            self.W1,self.b1,self.W2,self.b2=model["W1"],model["b1"],model["W2"],model["b2"]
+            self.lossScale=float(model["lossScale"])
+            self.hidden=self.W1.shape[1]
+        self.taper=np.hanning(self.window)
+
+    def load_data(self, filename, column_order="TXYZ", window=200):
+        #Loads a recording to score with the trained model. No model is fitted on the recording itself, as
+        #every recording starts with the tool in the air and its first seconds are not stable cutting.
+        if self.W1 is None:
+            raise FileNotFoundError("No trained model at "+str(self.modelPath)+", train one on stable recordings with ChatterAutoEncoder.train first")
+        self.filename=filename
+        self.times,self.accel=load_recording(filename,column_order,self.channels,drop_first=False)
+        f_sample=len(self.times)/(self.times[-1]-self.times[0])
+        if abs(f_sample-self.f_sample)>0.1*self.f_sample:
+            print("Warning: model trained at %0.0f Hz but data is sampled at %0.0f Hz." % (self.f_sample,f_sample))
+        if window!=self.window:
+            print("Warning: model trained on windows of %i readings, not %i; scoring with %i." % (self.window,window,self.window))
+
+    def predict_chatter(self, step_size=0.1, batch=4096):
+        #Scores a window every step_size seconds and spreads the losses back onto every reading.
+        f_sample=len(self.times)/(self.times[-1]-self.times[0])
+        hop=max(1,int(step_size*f_sample))
+        windows,starts=sliding_windows(self.accel,self.window,hop)
+        self.lossW=np.concatenate([self.score_windows(windows[k:k+batch]) for k in range(0,len(windows),batch)]) if len(windows) else np.empty(0)
+        self.lossT=self.times[starts+self.window//2]
+        self.lossV=np.interp(self.times,self.lossT,self.lossW) if len(self.lossW) else np.full(len(self.times),np.nan)
+        self.chatter=self.lossV>1.0
+        return self.lossV
+
+    def plot_chatter(self, figure_number=None):
+        #Plots the loss of every reading against the limit of 1 and returns the losses.
+        plt.figure(figure_number)
+        plt.plot(self.times,self.lossV)
+        plt.plot(self.lossT,np.ones(len(self.lossT)))
+        plt.yscale("log")
+        plt.xlabel("Time (s)")
+        plt.ylabel("Reconstruction Loss")
+        return self.lossV
@@ -0,0 +1,121 @@
+import numpy as np
+from ChatterCore.Processing import signal, highpass_sos, decimation_factor, decimate_readings, integrate_displacement, bisection_mask, window_starts, modified_chatter_indicator
+from ChatterCore.Recording import load_recording
+from ChatterCore.Gaps import GapIndex
+from ChatterCore.Spectrogram import StreamingSTFT
+
+
+def preprocess_recording(filepath, column_order="TXYZ", f_pass=50, f_stop=49, channels="XY", analysis_rate=None, dtype=np.float64):
+    #Loads a recording and returns every signal that does not depend on the spindle speed or the windows.
+    #Signals are (channels x readings) arrays with one row per letter of channels. Given an analysis_rate in
+    #Hz, the readings are decimated to it (or just above it) before filtering and integration. With dtype
+    #np.float32 the signals are loaded, filtered and integrated in float32; times stay float64.
+    times,accel=load_recording(filepath,column_order,channels,dtype=dtype)
+    #Missing readings (NaN, or the LJM skipped-sample marker in older files) are bridged before filtering
+    #so they cannot spread through the filter. Windows that contain them are handled by gap_policy.
+    gaps=GapIndex.find(accel)
+    gaps.interpolate(accel)
+    factor=decimation_factor(len(times)/(times[-1]-times[0]),analysis_rate)
+    times,accel=decimate_readings(times,accel,factor)
+    gaps=gaps.decimate(factor)
+    f_sample=int(len(times)/(times[-1]-times[0]))
+    velo,disp=integrate_displacement(accel,times,highpass_sos(f_sample,f_pass,f_stop))
+    return {"times":times,"accel":accel,"velo":velo,"disp":disp,"gapStarts":gaps.starts,"gapLengths":gaps.lengths,
+            "f_sample":f_sample}
+
+
+def _channel(signal, name):
+    #Read-only view of one channel of a (channels x readings) signal, e.g. dispX for row "X" of disp.
+    return property(lambda self: getattr(self,signal)[self.channels.index(name)],doc=signal+" of channel "+name)
+
+
+class ChatterAnalysis:
+    #All data belongs to the instance, so several recordings can be analyzed at once without sharing state.
+    #accel, velo and disp hold one row per channel; accelX, dispY and so on are views of single rows.
+    __slots__=("filename","channels","timeF","accel","velo","disp","bisectionTimes",
+               "chatsT","chatsI","threshold","f_sample","revolution_time","gaps")
+    accelX,accelY,accelZ=_channel("accel","X"),_channel("accel","Y"),_channel("accel","Z")
+    veloX,veloY,veloZ=_channel("velo","X"),_channel("velo","Y"),_channel("velo","Z")
+    dispX,dispY,dispZ=_channel("disp","X"),_channel("disp","Y"),_channel("disp","Z")
+
+
+    def __init__(self,filepath, spindle_speed, column_order="TXYZ", f_pass=50, f_stop=49, cache=None, channels="XY", analysis_rate=None, dtype=np.float64):
+        #cache is an optional PreprocessCache; the filtered and integrated signals only depend on the recording
+        #and the filter, so they can be shared between analyses with different windows or spindle speeds.
+        #channels picks the accelerometer axes to analyze together, e.g. "XYZ" for the CutsAlongXYZ recordings.
+        #analysis_rate decimates the readings before integration and dtype sets their precision, see preprocess_recording.
+        self.filename=filepath
+        self.channels=channels
+        if cache is None:
+            arrays=preprocess_recording(filepath,column_order,f_pass,f_stop,channels,analysis_rate,dtype)
+        else:
+            arrays=cache.load(filepath,column_order,f_pass,f_stop,channels,analysis_rate,dtype)
+        self.timeF=arrays["times"]
+        self.accel=arrays["accel"]
+        self.velo=arrays["velo"]
+        self.disp=arrays["disp"]
+        self.gaps=GapIndex(arrays["gapStarts"],arrays["gapLengths"])
+        self.f_sample=int(arrays["f_sample"])
+        self.revolution_time=60/spindle_speed
+        self.bisectionTimes=bisection_mask(self.timeF,self.revolution_time)
+        self.chatsT=np.empty(0) #Stores the time at which chatter indicators are calculated.
+        self.chatsI=np.empty(0) #Stores the value of calculated chatter indicators.
+        self.threshold=np.empty(0)
+
+
+    def calculate_chatter_indicator(self, time_window, step_size, gap_policy="interpolate", max_gap=0.005, normalization="recording", warmup=20, halflife=100):
+        #gap_policy "interpolate" keeps windows whose gaps are no longer than max_gap seconds and skips the rest;
+        #"skip" skips every window with a missing reading. Skipped windows have a NaN indicator.
+        #normalization, warmup and halflife pick the whole-recording or a causal baseline, see modified_chatter_indicator.
+        w_length=int(self.f_sample*time_window) #Calculates how many readings will be analyzed at a time.
+        s_length=int(self.f_sample*step_size)
+        starts=window_starts(len(self.timeF),w_length,s_length)
+        gaps=self.gaps if gap_policy=="skip" else self.gaps.longer_than(int(max_gap*self.f_sample))
+        valid=~gaps.overlaps(starts,w_length)
+        self.chatsI=modified_chatter_indicator(self.disp,self.bisectionTimes,starts,w_length,valid,normalization,warmup,halflife)
+        self.chatsT=self.timeF[starts+int(0.5*w_length)]
+        self.threshold=np.full(len(starts),0.1)
+        return [self.chatsT,self.chatsI]
+
+
+    def butter_highpass(self,N, Wn): #Helper function to apply Butterworth filter to data.
+        return signal.butter(N,Wn,'high',output="sos")
+
+
+    def butter_highpass_filter(self,data, N,Wn): #Function to apply Butterworth filter to data.
+        sos = self.butter_highpass(N,Wn)
+        y = signal.sosfilt(sos, data, axis=-1)
+        return y
+
+
+    def spectrogram(self, window=256, hop=64, history=2048, block=1<<16):
+        #Streams the acceleration through a StreamingSTFT a block at a time and returns it.
+        stft=StreamingSTFT(self.f_sample,window,hop,channels=len(self.accel),history=history,start_time=self.timeF[0])
+        for start in range(0,len(self.timeF),block):
+            stft.update(self.accel[:,start:start+block])
+        return stft
+
+
+    def window_bisections(self,w_start,w_end):
+        #Indices of the bisection points that fall inside a window.
+        return w_start+np.flatnonzero(self.bisectionTimes[w_start:w_end])
+
+
+def _analyze_recording(job):
+    filepath,spindle_speed,column_order,time_window,step_size,channels,dtype=job
+    helper=ChatterAnalysis(filepath,spindle_speed,column_order=column_order,channels=channels,dtype=dtype)
+    return helper.calculate_chatter_indicator(time_window,step_size)
+
+
+def analyze_recordings(recordings, time_window=0.3, step_size=0.1, max_workers=None, use_processes=True, channels="XY", dtype=np.float64):
+    #Analyzes several recordings concurrently. Each entry is (filepath, spindle_speed) or
+    #(filepath, spindle_speed, column_order); results come back in the same order as [chatsT, chatsI].
+    jobs=[]
+    for recording in recordings:
+        filepath,spindle_speed=recording[0],recording[1]
+        column_order=recording[2] if len(recording)>2 else "TXYZ"
+        jobs.append((filepath,spindle_speed,column_order,time_window,step_size,channels,dtype))
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor #Imported here to keep the package import light.
+    executor=ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with executor(max_workers=max_workers) as pool:
+        return list(pool.map(_analyze_recording,jobs))
@@ -0,0 +1,213 @@
+"""
+Compressed archive format for recordings, with random access by time.
+Every column of a recording is quantized to a fixed step, delta encoded (twice for the time column, whose
+steps are nearly constant) and stored in compressed chunks of a fixed number of readings. An index at the
+end of the file gives the offset of every chunk of every column and the time span each chunk covers, so a
+reader only decompresses the columns and chunks a time range needs.
+
+The default steps are 1e-9 for times and 1e-6 for everything else, well below the 2.4e-3 m/s^2 resolution
+of the LabJack readings, so the largest change to any value is half of that. Missing (NaN) readings are
+kept as they are. The recordings under VibrationData shrink about ten times compared to the CSV files.
+
+Run "python -m ChatterCore.Archive [directory or recording ...]" to archive CSV recordings next to the
+originals. load_recording and iter_recording_chunks read archives as well as CSV files.
+"""
+
+import os
+import sys
+import zlib
+import numpy as np
+from ChatterCore.Lazy import LazyModule
+
+pd=LazyModule("pandas")
+lzma=LazyModule("lzma")
+
+ARCHIVE_SUFFIX=".vbz"
+MAGIC=b"VBZ1"
+TIME_QUANTUM=1e-9
+VALUE_QUANTUM=1e-6
+
+
+def archive_filename(filename):
+    #Archive written next to a CSV recording, e.g. Cut.csv -> Cut.vbz.
+    return os.path.splitext(filename)[0]+ARCHIVE_SUFFIX
+
+
+def _compress(data, codec, level):
+    if codec=="zlib":
+        return zlib.compress(data,level)
+    if codec=="lzma":
+        return lzma.compress(data,preset=level)
+    raise ValueError("Unknown codec "+codec)
+
+
+def _decompress(data, codec):
+    return zlib.decompress(data) if codec=="zlib" else lzma.decompress(data)
+
+
+def encode_column(values, quantum, order):
+    #Quantized, delta encoded values as bytes. Deltas are zigzag encoded so small negative steps stay small
+    #and the bytes are grouped by significance, which leaves long runs of zeros for the compressor.
+    steps=np.round(np.nan_to_num(values)/quantum)
+    if np.abs(steps).max(initial=0)>=2**62:
+        raise ValueError("Values too large for a quantum of "+str(quantum))
+    steps=steps.astype(np.int64)
+    for _ in range(order):
+        steps=np.diff(steps,prepend=0)
+    zigzag=((steps<<1)^(steps>>63)).astype("<u8")
+    return zigzag.view(np.uint8).reshape(-1,8).T.tobytes()
+
+
+def decode_column(data, quantum, order):
+    zigzag=np.frombuffer(data,dtype=np.uint8).reshape(8,-1).T.copy().view("<u8")[:,0]
+    steps=(zigzag>>np.uint64(1)).astype(np.int64)^-(zigzag&np.uint64(1)).astype(np.int64)
+    for _ in range(order):
+        steps=np.cumsum(steps)
+    return steps*quantum
+
+
+class ArchiveWriter:
+    #Writes readings appended in blocks of any size as chunks of chunk_rows readings. quanta maps column
+    #names to their quantization step; columns not in it use the defaults.
+    def __init__(self, path, columns, quanta=None, chunk_rows=1<<16, codec="zlib", level=6):
+        self.path=path
+        self.columns=list(columns)
+        quanta=quanta or {}
+        self.quanta=[quanta.get(name,TIME_QUANTUM if name.startswith("Time") else VALUE_QUANTUM) for name in self.columns]
+        self.orders=[2 if name.startswith("Time") else 1 for name in self.columns]
+        self.chunk_rows=chunk_rows
+        self.codec=codec
+        self.level=level
+        self.chunks=[]
+        self.rows=0
+        self.pending=np.empty((0,len(self.columns)))
+        self.partial=path+"."+str(os.getpid())+".tmp" #Renamed into place on close so readers never see half a file.
+        self.handle=open(self.partial,"wb")
+        self.handle.write(MAGIC)
+
+    def append(self, block):
+        #Adds (readings x columns) values.
+        self.pending=np.concatenate((self.pending,np.asarray(block,dtype=np.float64)))
+        while len(self.pending)>=self.chunk_rows:
+            self._write_chunk(self.pending[:self.chunk_rows])
+            self.pending=self.pending[self.chunk_rows:]
+
+    def _write_chunk(self, block):
+        chunk={"row":self.rows,"rows":len(block),"start":float(block[0,0]),"end":float(block[-1,0]),"columns":[],"nan":[]}
+        for values,quantum,order in zip(block.T,self.quanta,self.orders):
+            data=_compress(encode_column(values,quantum,order),self.codec,self.level)
+            chunk["columns"].append([self.handle.tell(),len(data)])
+            chunk["nan"].append(np.flatnonzero(np.isnan(values)).tolist())
+            self.handle.write(data)
+        self.chunks.append(chunk)
+        self.rows+=len(block)
+
+    def close(self):
+        import json #Imported here to keep the package import light.
+        if len(self.pending):
+            self._write_chunk(self.pending)
+        index=json.dumps({"columns":self.columns,"quanta":self.quanta,"orders":self.orders,"codec":self.codec,
+                          "rows":self.rows,"chunk_rows":self.chunk_rows,"chunks":self.chunks}).encode()
+        offset=self.handle.tell()
+        self.handle.write(index)
+        self.handle.write(offset.to_bytes(8,"little"))
+        self.handle.close()
+        os.replace(self.partial,self.path)
+
+
+class RecordingArchive:
+    def __init__(self, path):
+        import json #Imported here to keep the package import light.
+        self.path=path
+        self.handle=open(path,"rb")
+        if self.handle.read(len(MAGIC))!=MAGIC:
+            raise ValueError(path+" is not a recording archive")
+        self.handle.seek(-8,os.SEEK_END)
+        end=self.handle.tell()
+        offset=int.from_bytes(self.handle.read(8),"little")
+        self.handle.seek(offset)
+        index=json.loads(self.handle.read(end-offset))
+        self.columns=index["columns"]
+        self.quanta=index["quanta"]
+        self.orders=index["orders"]
+        self.codec=index["codec"]
+        self.rows=index["rows"]
+        self.chunk_rows=index["chunk_rows"]
+        self.chunks=index["chunks"]
+        self.chunkStarts=np.array([chunk["start"] for chunk in self.chunks])
+        self.chunkEnds=np.array([chunk["end"] for chunk in self.chunks])
+
+    def _column_indices(self, columns):
+        if columns is None:
+            return list(range(len(self.columns)))
+        return [self.columns.index(name) if isinstance(name,str) else name for name in columns]
+
+    def _read_chunk(self, chunk, indices):
+        block=np.empty((chunk["rows"],len(indices)))
+        for k,index in enumerate(indices):
+            offset,length=chunk["columns"][index]
+            self.handle.seek(offset)
+            block[:,k]=decode_column(_decompress(self.handle.read(length),self.codec),self.quanta[index],self.orders[index])
+            block[chunk["nan"][index],k]=np.nan
+        return block
+
+    def iter_chunks(self, columns=None):
+        #Yields the stored chunks one at a time as (readings x columns) arrays.
+        indices=self._column_indices(columns)
+        for chunk in self.chunks:
+            yield self._read_chunk(chunk,indices)
+
+    def read_rows(self, start=0, stop=None, columns=None):
+        #Readings start to stop as a (readings x columns) array, decompressing only the chunks they are in.
+        stop=self.rows if stop is None else min(stop,self.rows)
+        indices=self._column_indices(columns)
+        blocks=[self._read_chunk(chunk,indices)[max(start-chunk["row"],0):stop-chunk["row"]] for chunk in self.chunks
+                if chunk["row"]<stop and chunk["row"]+chunk["rows"]>start]
+        return np.concatenate(blocks) if blocks else np.empty((0,len(indices)))
+
+    def read(self, start_time=None, end_time=None, columns=None):
+        #Readings with start_time <= time <= end_time, in the file's own time, as a (readings x columns) array.
+        #The time column is always read to cut the range and is left out of the result unless asked for.
+        indices=self._column_indices(columns)
+        first=0 if start_time is None else int(np.searchsorted(self.chunkEnds,start_time,side="left"))
+        last=len(self.chunks) if end_time is None else int(np.searchsorted(self.chunkStarts,end_time,side="right"))
+        if first>=last:
+            return np.empty((0,len(indices)))
+        block=np.concatenate([self._read_chunk(chunk,[0]+indices) for chunk in self.chunks[first:last]])
+        lower=0 if start_time is None else np.searchsorted(block[:,0],start_time,side="left")
+        upper=len(block) if end_time is None else np.searchsorted(block[:,0],end_time,side="right")
+        return block[lower:upper,1:]
+
+    def close(self):
+        self.handle.close()
+
+
+def write_archive(source, destination=None, quanta=None, chunk_rows=1<<16, codec="zlib", level=6, read_rows=1<<18):
+    #Archives a CSV recording, reading it in pieces so recordings of any length can be converted.
+    destination=destination or archive_filename(source)
+    writer=ArchiveWriter(destination,list(pd.read_csv(source,nrows=0)),quanta,chunk_rows,codec,level)
+    for frame in pd.read_csv(source,chunksize=read_rows):
+        writer.append(frame.to_numpy(dtype=np.float64))
+    writer.close()
+    return destination
+
+
+if __name__=="__main__":
+    sources=[]
+    for path in sys.argv[1:] or ["VibrationData"]:
+        if os.path.isdir(path):
+            sources+=sorted(os.path.join(directory,name) for directory,_,names in os.walk(path) for name in names if name.endswith(".csv"))
+        else:
+            sources.append(path)
+    before=0
+    after=0
+    for source in sources:
+        if not list(pd.read_csv(source,nrows=0))[0].startswith("Time"):
+            print("Skipping",source,"as it has no time column.")
+            continue
+        destination=write_archive(source)
+        before+=os.path.getsize(source)
+        after+=os.path.getsize(destination)
+        print(destination,round(os.path.getsize(source)/os.path.getsize(destination),1),"times smaller")
+    if after:
+        print("Archived",before,"bytes in",after,"bytes,",round(before/after,1),"times smaller.")
@@ -0,0 +1,53 @@
+import os
+import numpy as np
+from ChatterCore.Analysis import preprocess_recording
+
+
+class PreprocessCache:
+    #Keeps the output of preprocess_recording on disk, one .npz file per recording and filter design, so
+    #sweeps and repeated runs only filter and integrate each recording once. Entries are keyed on the file's
+    #size and modification time as well as its path, so an edited recording is processed again.
+    def __init__(self, directory="ChatterCache", memory_entries=4):
+        self.directory=directory
+        self.memory_entries=memory_entries #Most recent entries also kept in memory, 0 to disable.
+        self.memory={}
+        self.hits=0
+        self.misses=0
+        os.makedirs(directory,exist_ok=True)
+
+    def key(self, filepath, column_order, f_pass, f_stop, channels="XY", analysis_rate=None, dtype=np.float64):
+        import hashlib #Imported here to keep the package import light.
+        status=os.stat(filepath)
+        text="|".join(str(part) for part in (os.path.abspath(filepath),status.st_size,status.st_mtime_ns,column_order,f_pass,f_stop,channels,analysis_rate,np.dtype(dtype).name))
+        return hashlib.sha1(text.encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory,key+".npz")
+
+    def load(self, filepath, column_order="TXYZ", f_pass=50, f_stop=49, channels="XY", analysis_rate=None, dtype=np.float64):
+        key=self.key(filepath,column_order,f_pass,f_stop,channels,analysis_rate,dtype)
+        if key in self.memory:
+            self.hits+=1
+            return self.memory[key]
+        path=self.path(key)
+        if os.path.exists(path):
+            self.hits+=1
+            with np.load(path) as stored:
+                arrays={name:stored[name] for name in stored.files}
+        else:
+            self.misses+=1
+            arrays=preprocess_recording(filepath,column_order,f_pass,f_stop,channels,analysis_rate,dtype)
+            partial=path[:-4]+"."+str(os.getpid())+".tmp.npz" #Renamed into place so parallel workers never read half a file.
+            np.savez(partial,**arrays)
+            os.replace(partial,path)
+        if self.memory_entries:
+            if len(self.memory)>=self.memory_entries:
+                del self.memory[next(iter(self.memory))]
+            self.memory[key]=arrays
+        return arrays
+
+    def clear(self):
+        self.memory.clear()
+        for name in os.listdir(self.directory):
+            if name.endswith(".npz"):
+                os.remove(os.path.join(self.directory,name))
@@ -0,0 +1,220 @@
+"""
+SQLite catalog of the recordings under VibrationData.
+Everything known about a recording is written in its path, e.g.
+VibrationData/HurcoVMX42SRTi/4140SteelCutsAlongX/EBI_F20IN_T50_D0p125IN_4000RPM.csv is a cut on the
+HurcoVMX42SRTi in 4140 steel along X, measured with the EBI sensor at a 20 IN/min feed, T50, 0.125 IN deep
+and 4000 RPM. The catalog parses this once, adds the columns, sample count, duration and sampling rate
+read from the file, and keeps it up to date by only re-reading files whose size or modification time
+changed. Scripts then pick recordings with select() instead of hard-coding directories:
+
+    catalog=RecordingCatalog()
+    catalog.update()
+    catalog.select(material="4140%Steel", sensor="PCB", rpm=(3000,4000))
+
+Run "python -m ChatterCore.Catalog [filter=value ...]" to update the catalog and list the matches.
+"""
+
+import os
+import re
+import sys
+import numpy as np
+from ChatterCore.Lazy import LazyModule
+
+sqlite3=LazyModule("sqlite3")
+pd=LazyModule("pandas")
+
+DEFAULT_ROOT="VibrationData"
+DEFAULT_DATABASE=os.path.join(DEFAULT_ROOT,"Catalog.sqlite")
+
+FIELDS=[("path","TEXT PRIMARY KEY"),("size","INTEGER"),("mtime_ns","INTEGER"),("kind","TEXT"),("machine","TEXT"),
+        ("material","TEXT"),("axis","TEXT"),("sensor","TEXT"),("feed","REAL"),("tool","INTEGER"),("depth","REAL"),
+        ("rpm","INTEGER"),("rpm_end","INTEGER"),("tool_type","TEXT"),("tool_diameter","REAL"),("notes","TEXT"),
+        ("columns","TEXT"),("column_order","TEXT"),("samples","INTEGER"),("duration","REAL"),("f_sample","REAL")]
+
+
+def parse_recording_path(path):
+    #Metadata written in a recording's directories and file name. Units are IN/min for feed, IN for depth
+    #and millimetres for tool diameter. Anything missing is None.
+    meta={"machine":None,"material":None,"axis":None,"sensor":None,"feed":None,"tool":None,"depth":None,
+          "rpm":None,"rpm_end":None,"tool_type":None,"tool_diameter":None,"notes":None}
+    parts=os.path.normpath(path).split(os.sep)
+    for part in parts[:-1]:
+        if part.startswith("Hurco"):
+            meta["machine"]=part
+        match=re.match(r"(\d*)(Steel|Aluminum)",part)
+        if match:
+            meta["material"]=(match.group(1)+" "+match.group(2)).strip()
+        match=re.search(r"CutsAlong([XYZ]+)",part)
+        if match:
+            meta["axis"]=match.group(1)
+        if part.replace(" ","")=="EndMill":
+            meta["tool_type"]="End Mill"
+        match=re.fullmatch(r"(\d+)(?:p(\d+))?(MM|IN)",part)
+        if match:
+            diameter=float(match.group(1)+"."+(match.group(2) or "0"))
+            meta["tool_diameter"]=diameter*25.4 if match.group(3)=="IN" else diameter
+        match=re.fullmatch(r"(\d+)RPM",part)
+        if match:
+            meta["rpm"]=int(match.group(1))
+
+    tokens=os.path.splitext(parts[-1])[0].split("_")
+    notes=[]
+    for index,token in enumerate(tokens):
+        if index==0 and token in ("EBI","PCB","SKF"):
+            meta["sensor"]=token
+        elif re.fullmatch(r"F\d+(?:p\d+)?IN",token):
+            meta["feed"]=float(token[1:-2].replace("p","."))
+        elif re.fullmatch(r"T\d+",token):
+            meta["tool"]=int(token[1:])
+        elif re.fullmatch(r"D?\d+p\d+(?:IN)?\d*",token):
+            #Depth, with or without the D and IN; a digit after IN numbers repeated cuts.
+            meta["depth"]=float(re.match(r"D?(\d+p\d+)",token).group(1).replace("p","."))
+        elif re.fullmatch(r"\d+RPM(?:to\d+RPM)?",token):
+            speeds=re.findall(r"\d+",token)
+            meta["rpm"]=int(speeds[0])
+            meta["rpm_end"]=int(speeds[1]) if len(speeds)>1 else None
+        elif token=="5AVZ":
+            meta["axis"]="Z"
+            notes.append(token)
+        elif token=="5AXYZ":
+            meta["axis"]="XYZ"
+            notes.append(token)
+        else:
+            notes.append(token)
+    meta["notes"]="_".join(notes) or None
+    return meta
+
+
+def column_order_from_header(columns):
+    #Builds the column_order string load_recording expects: T for time, X/Y/Z for acceleration channels and
+    #"-" for anything else, e.g. "TXY-----" for Time, Accel X, Accel Y, four load columns and CI Value.
+    order=""
+    for name in columns:
+        match=re.search(r"(?:Accel ([XYZ])|([XYZ]) (?:Accel|Axis))",name)
+        if name.startswith("Time"):
+            order+="T"
+        elif match:
+            order+=match.group(1) or match.group(2)
+        else:
+            order+="-"
+    return order
+
+
+def inspect_recording(path):
+    #Columns, kind and timing of a file. Times are read on their own to keep this quick.
+    columns=list(pd.read_csv(path,nrows=0))
+    column_order=column_order_from_header(columns)
+    if re.search(r"[XYZ]",column_order):
+        kind="acceleration"
+    elif "CI" in columns:
+        kind="indicator"
+    elif os.path.basename(path).startswith("Stability_Lobe"):
+        kind="lobe"
+    else:
+        kind="other"
+    info={"kind":kind,"columns":",".join(columns),"column_order":column_order,"samples":None,"duration":None,"f_sample":None}
+    if column_order.startswith("T"):
+        times=pd.read_csv(path,usecols=[0]).to_numpy(dtype=np.float64)[:,0]
+        info["samples"]=len(times)
+        if len(times)>1:
+            info["duration"]=float(times[-1]-times[0])
+            info["f_sample"]=(len(times)-1)/info["duration"] if info["duration"]>0 else None
+    return info
+
+
+class RecordingCatalog:
+    def __init__(self, database=DEFAULT_DATABASE, root=DEFAULT_ROOT):
+        self.database=database
+        self.root=root
+        self.connection=sqlite3.connect(database)
+        self.connection.row_factory=sqlite3.Row
+        self.connection.execute("CREATE TABLE IF NOT EXISTS recordings ("+",".join(name+" "+kind for name,kind in FIELDS)+")")
+
+    def update(self):
+        #Adds new files, re-reads changed ones and forgets deleted ones. Returns (added or changed, removed).
+        known={row["path"]:(row["size"],row["mtime_ns"]) for row in self.connection.execute("SELECT path, size, mtime_ns FROM recordings")}
+        seen=set()
+        changed=0
+        for directory,_,names in os.walk(self.root):
+            for name in sorted(names):
+                if not name.endswith(".csv"):
+                    continue
+                path=os.path.join(directory,name)
+                status=os.stat(path)
+                seen.add(path)
+                if known.get(path)==(status.st_size,status.st_mtime_ns):
+                    continue
+                row={"path":path,"size":status.st_size,"mtime_ns":status.st_mtime_ns}
+                row.update(parse_recording_path(path))
+                try:
+                    row.update(inspect_recording(path))
+                except Exception as error: #An unreadable file is still catalogued so it is not retried every update.
+                    print("Could not read",path,":",error)
+                    row["kind"]="unreadable"
+                self.connection.execute("INSERT OR REPLACE INTO recordings VALUES ("+",".join("?"*len(FIELDS))+")",
+                                        [row.get(field) for field,_ in FIELDS])
+                changed+=1
+        removed=[path for path in known if path not in seen]
+        self.connection.executemany("DELETE FROM recordings WHERE path=?",[(path,) for path in removed])
+        self.connection.commit()
+        return changed,len(removed)
+
+    def query(self, where="1", parameters=()):
+        #Rows matching an SQL condition on the catalog columns, as dictionaries.
+        return [dict(row) for row in self.connection.execute("SELECT * FROM recordings WHERE "+where+" ORDER BY path",parameters)]
+
+    def select(self, **filters):
+        #Rows matching every filter. Strings match case-insensitively and may use % as a wildcard, (low, high)
+        #pairs select a range and None selects missing values; anything else must match exactly.
+        clauses=[]
+        parameters=[]
+        for field,value in filters.items():
+            if field not in dict(FIELDS):
+                raise ValueError("Unknown catalog field "+field)
+            if value is None:
+                clauses.append(field+" IS NULL")
+            elif isinstance(value,str):
+                clauses.append(field+" LIKE ?")
+                parameters.append(value)
+            elif isinstance(value,(tuple,list)):
+                clauses.append(field+" BETWEEN ? AND ?")
+                parameters+=list(value)
+            else:
+                clauses.append(field+"=?")
+                parameters.append(value)
+        return self.query(" AND ".join(clauses) or "1",parameters)
+
+    def recordings(self, channels="XY", **filters):
+        #(path, spindle speed, column order) of matching recordings that have every channel and a known spindle
+        #speed, as analyze_recordings and ParameterSweep.run_sweep take them.
+        filters.setdefault("kind","acceleration")
+        return [(row["path"],row["rpm"],row["column_order"]) for row in self.select(**filters)
+                if row["rpm"] is not None and all(channel in row["column_order"] for channel in channels)]
+
+    def close(self):
+        self.connection.close()
+
+
+def parse_filters(arguments):
+    #Turns command line filters such as material=4140%Steel or rpm=3000-4000 into select() keywords.
+    filters={}
+    for argument in arguments:
+        field,value=argument.split("=",1)
+        if field not in dict(FIELDS):
+            raise ValueError("Unknown catalog field "+repr(field)+", expected one of "+", ".join(name for name,_ in FIELDS))
+        numeric=dict(FIELDS)[field] in ("INTEGER","REAL")
+        if numeric and re.fullmatch(r"[\d.]+-[\d.]+",value):
+            filters[field]=tuple(float(bound) for bound in value.split("-"))
+        elif numeric:
+            filters[field]=float(value)
+        else:
+            filters[field]=value
+    return filters
+
+
+if __name__=="__main__":
+    catalog=RecordingCatalog()
+    changed,removed=catalog.update()
+    print("Catalog updated:",changed,"added or changed,",removed,"removed.")
+    for row in catalog.select(**parse_filters(sys.argv[1:])):
+        print(row["path"],row["rpm"],row["samples"],row["duration"])
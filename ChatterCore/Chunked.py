@@ -0,0 +1,236 @@
+"""
+Out-of-core version of ChatterAnalysis for recordings that do not fit in memory.
+The file is read in chunks and every processing stage is carried across chunk boundaries: the
+Butterworth filter keeps its section state, the integrals keep their running constant, and the linear
+detrends use least-squares lines accumulated over the whole recording in an earlier pass. Intermediate
+signals are spilled to scratch files, so memory use depends on the chunk size and not on the
+recording length.
+
+Windows that straddle a chunk seam need no overlap buffer. The path length is accumulated over the
+whole recording, so each window only needs the path length at its start and at its bisection points,
+and only those values are kept.
+
+With a well-conditioned filter (for example f_pass=200, f_stop=150) the indicator matches ChatterAnalysis
+to about 1e-12. The default 50/49 Hz design gives a Butterworth filter of order 200 or more, whose output
+changes visibly with last-bit changes to its input, so no re-ordering of the arithmetic can reproduce the
+in-memory result exactly with that design.
+
+With dtype np.float32 the velocity and displacement scratch files are stored in float32, halving the
+scratch space and the reads of passes 3 and 4. The running sums and trends are still kept in float64.
+"""
+
+import os
+import numpy as np
+from ChatterCore.Processing import signal, highpass_sos, NORMALIZATIONS, CausalBaseline, causal_scale
+from ChatterCore.Recording import iter_recording_chunks
+from ChatterCore.Gaps import GapIndex
+
+
+class LinearTrend:
+    #Least-squares line against the reading index for every channel, accumulated block by block.
+    #Blocks are merged with centred sums, which stay accurate for very long recordings.
+    def __init__(self, channels):
+        self.n=0
+        self.meanI=0.0
+        self.meanX=np.zeros(channels)
+        self.comoment=np.zeros(channels)
+
+    def update(self, block):
+        m=block.shape[1]
+        index=np.arange(self.n,self.n+m,dtype=np.float64)
+        blockMeanI=index.mean()
+        blockMeanX=block.mean(axis=1)
+        blockComoment=(block-blockMeanX[:,None])@(index-blockMeanI)
+        total=self.n+m
+        deltaI=blockMeanI-self.meanI
+        deltaX=blockMeanX-self.meanX
+        self.comoment+=blockComoment+deltaI*deltaX*self.n*m/total
+        self.meanI+=deltaI*m/total
+        self.meanX+=deltaX*m/total
+        self.n=total
+
+    def coefficients(self):
+        #Sum of squared index deviations is known exactly for 0..n-1.
+        slope=self.comoment/(self.n*(self.n**2-1)/12.0)
+        return self.meanX-slope*self.meanI,slope
+
+    def remove(self, block, start):
+        intercept,slope=self.coefficients()
+        index=np.arange(start,start+block.shape[1],dtype=np.float64)
+        return block-(intercept[:,None]+slope[:,None]*index)
+
+
+class RunningIntegral:
+    #Cumulative trapezoidal integral that continues from the end of the previous block.
+    def __init__(self, channels):
+        self.lastT=None
+        self.lastY=np.zeros(channels)
+        self.total=np.zeros(channels)
+
+    def update(self, times, block):
+        if self.lastT is None:
+            steps=np.zeros_like(block)
+            steps[:,1:]=0.5*(block[:,1:]+block[:,:-1])*np.diff(times)
+        else:
+            dt=np.diff(np.concatenate(([self.lastT],times)))
+            previous=np.concatenate((self.lastY[:,None],block[:,:-1]),axis=1)
+            steps=0.5*(block+previous)*dt
+        out=self.total[:,None]+np.cumsum(steps,axis=1)
+        self.lastT=times[-1]
+        self.lastY=block[:,-1].copy()
+        self.total=out[:,-1].copy()
+        return out
+
+
+class ScratchArray:
+    #Append-only (readings x columns) file that is read back through a memory map.
+    def __init__(self, path, columns, dtype=np.float64):
+        self.path=path
+        self.columns=columns
+        self.dtype=np.dtype(dtype)
+        self.rows=0
+        self.handle=open(path,"wb")
+        self.map=None
+
+    def append(self, block):
+        np.ascontiguousarray(block,dtype=self.dtype).tofile(self.handle)
+        self.rows+=len(block)
+
+    def close(self):
+        self.handle.close()
+        self.map=np.memmap(self.path,dtype=self.dtype,mode="r",shape=(self.rows,self.columns))
+
+    def chunks(self, chunk_rows):
+        for start in range(0,self.rows,chunk_rows):
+            yield start,np.array(self.map[start:start+chunk_rows])
+
+
+class ChunkedChatterAnalysis:
+    def __init__(self,filepath, spindle_speed, column_order="TXYZ", f_pass=50, f_stop=49, chunk_rows=1<<18, scratch_dir=None, channels="XY", dtype=np.float64):
+        self.filename=filepath
+        self.channels=channels
+        self.chunk_rows=chunk_rows
+        self.revolution_time=60/spindle_speed
+        import tempfile #Imported here to keep the package import light.
+        self.scratch=tempfile.TemporaryDirectory(dir=scratch_dir) #Removed when the analysis is garbage collected.
+        self.chatsT=np.empty(0) #Stores the time at which chatter indicators are calculated.
+        self.chatsI=np.empty(0) #Stores the value of calculated chatter indicators.
+        self.threshold=np.empty(0)
+
+        #Pass 1: copy the readings to a binary scratch file and index the missing readings.
+        raw=None
+        timeOffset=None
+        self.gaps=GapIndex()
+        for times,accel in iter_recording_chunks(filepath,column_order,channels,chunk_rows):
+            if raw is None:
+                raw=ScratchArray(os.path.join(self.scratch.name,"raw.bin"),1+len(accel))
+                timeOffset=times[0]
+            self.gaps.extend(GapIndex.find(accel),raw.rows)
+            raw.append(np.column_stack((times-timeOffset,accel.T)))
+        raw.close()
+        if len(self.gaps):
+            #Bridging the gaps in place only touches the readings next to each gap.
+            raw.map=np.memmap(raw.path,dtype=np.float64,mode="r+",shape=(raw.rows,raw.columns))
+            self.gaps.interpolate(raw.map[:,1:].T)
+            raw.map.flush()
+        self.raw=raw
+        self.readings=raw.rows
+        self.duration=float(raw.map[-1,0]-raw.map[0,0])
+        self.f_sample=int(self.readings/self.duration)
+        width=raw.columns-1
+        accelTrend=LinearTrend(width)
+        for start,block in raw.chunks(chunk_rows):
+            accelTrend.update(block[:,1:].T)
+        sos=highpass_sos(self.f_sample,f_pass,f_stop)
+
+        #Pass 2: filter with the section state carried over and integrate to velocity.
+        velocity=ScratchArray(os.path.join(self.scratch.name,"velo.bin"),width,dtype)
+        veloTrend=LinearTrend(width)
+        state=np.zeros((sos.shape[0],width,2))
+        integral=RunningIntegral(width)
+        for start,block in raw.chunks(chunk_rows):
+            accel=accelTrend.remove(block[:,1:].T,start)
+            filtaccel,state=signal.sosfilt(sos,accel,axis=-1,zi=state)
+            velo=integral.update(block[:,0],filtaccel)
+            velocity.append(velo.T)
+            veloTrend.update(velo)
+        velocity.close()
+
+        #Pass 3: detrend velocity and integrate to displacement.
+        displacement=ScratchArray(os.path.join(self.scratch.name,"disp.bin"),width,dtype)
+        self.dispTrend=LinearTrend(width)
+        integral=RunningIntegral(width)
+        for (start,block),(_,velo) in zip(raw.chunks(chunk_rows),velocity.chunks(chunk_rows)):
+            disp=integral.update(block[:,0],veloTrend.remove(velo.T,start))
+            displacement.append(disp.T)
+            self.dispTrend.update(disp)
+        displacement.close()
+        self.displacement=displacement
+
+
+    def iter_displacement(self):
+        #Yields (start index, times, detrended displacement) blocks.
+        for (start,block),(_,disp) in zip(self.raw.chunks(self.chunk_rows),self.displacement.chunks(self.chunk_rows)):
+            yield start,block[:,0],self.dispTrend.remove(disp.T,start)
+
+
+    def calculate_chatter_indicator(self, time_window, step_size, gap_policy="interpolate", max_gap=0.005, normalization="recording", warmup=20, halflife=100):
+        #Gaps and normalization are handled as in ChatterAnalysis.calculate_chatter_indicator.
+        if normalization not in NORMALIZATIONS:
+            raise ValueError("Unknown normalization "+repr(normalization)+", expected one of "+", ".join(NORMALIZATIONS))
+        w_length=int(self.f_sample*time_window) #Calculates how many readings will be analyzed at a time.
+        s_length=int(self.f_sample*step_size)
+        starts=np.arange(0,self.readings-w_length,s_length)
+        gaps=self.gaps if gap_policy=="skip" else self.gaps.longer_than(int(max_gap*self.f_sample))
+        valid=~gaps.overlaps(starts,w_length)
+        centres=starts+int(0.5*w_length)
+        startPath=np.empty(len(starts)) #Path length at every window start.
+        self.chatsT=np.empty(len(starts))
+        bisections=[]
+        bisectionPath=[]
+        nextBisection=None #Time at which the next bisection point is due.
+        pathTotal=0.0
+        lastDisp=None
+        for start,times,disp in self.iter_displacement():
+            stop=start+len(times)
+            if nextBisection is None:
+                nextBisection=times[0]+self.revolution_time
+            steps=np.diff(disp,axis=-1) if lastDisp is None else np.diff(np.column_stack((lastDisp,disp)),axis=-1)
+            steps=np.hypot(steps[0],steps[1]) if len(steps)==2 else np.sqrt(np.sum(steps*steps,axis=0))
+            path=pathTotal+np.cumsum(steps)
+            if lastDisp is None:
+                path=np.concatenate(([0.0],path))
+            index=np.searchsorted(times,nextBisection,side="left")
+            while index<len(times):
+                bisections.append(start+index)
+                bisectionPath.append(path[index])
+                index=np.searchsorted(times,times[index]+self.revolution_time,side="left")
+            if bisections and bisections[-1]>=start:
+                nextBisection=times[bisections[-1]-start]+self.revolution_time
+            inside=(starts>=start)&(starts<stop)
+            startPath[inside]=path[starts[inside]-start]
+            inside=(centres>=start)&(centres<stop)
+            self.chatsT[inside]=times[centres[inside]-start]
+            pathTotal=path[-1]
+            lastDisp=disp[:,-1]
+
+        bisections=np.array(bisections,dtype=np.int64)
+        bisectionPath=np.array(bisectionPath)
+        first=np.searchsorted(bisections,starts)
+        last=np.searchsorted(bisections,starts+w_length)
+        metricVar=np.full(len(starts),np.nan) #Windows with fewer than two bisection points have no indicator.
+        metricSum=0.0
+        metricCount=0
+        for k in np.flatnonzero(valid):
+            metric=np.diff(np.concatenate(([startPath[k]],bisectionPath[first[k]:last[k]])))
+            metricSum+=metric.sum()
+            metricCount+=len(metric)
+            if len(metric)>1:
+                metricVar[k]=np.var(metric,ddof=1)
+        if normalization=="recording":
+            scaler=metricSum/metricCount if metricCount else np.nan
+        else:
+            scaler=causal_scale(bisectionPath,bisections,starts+w_length,CausalBaseline(warmup,halflife if normalization=="ewma" else None))
+        self.chatsI=metricVar/(scaler**2)
+        self.threshold=np.full(len(starts),0.1)
+        return [self.chatsT,self.chatsI]
@@ -0,0 +1,130 @@
+import csv
+import numpy as np
+
+SKIPPED_SAMPLE=-9999.0 #Value LJM puts in place of scans lost to a stream buffer overflow.
+
+
+class GapIndex:
+    #Start index and length of every run of missing readings in a recording. A reading is missing when any
+    #channel holds the LJM skipped-sample marker or NaN.
+    __slots__=("starts","lengths")
+
+    def __init__(self, starts=(), lengths=()):
+        self.starts=np.asarray(starts,dtype=np.int64)
+        self.lengths=np.asarray(lengths,dtype=np.int64)
+
+    @classmethod
+    def find(cls, data, sentinel=SKIPPED_SAMPLE):
+        #data is (channels x readings) or a single channel. Runs are found from the edges of the missing mask.
+        data=np.atleast_2d(data)
+        missing=np.any((data==sentinel)|np.isnan(data),axis=0)
+        edges=np.diff(np.concatenate(([0],missing.view(np.int8),[0])))
+        starts=np.flatnonzero(edges==1)
+        return cls(starts,np.flatnonzero(edges==-1)-starts)
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def ends(self):
+        return self.starts+self.lengths
+
+    def extend(self, other, offset):
+        #Appends the gaps of a block that starts at reading offset, joining a gap that runs across the seam.
+        starts=other.starts+offset
+        lengths=other.lengths.copy()
+        if len(self) and len(other) and self.ends[-1]==starts[0]:
+            self.lengths[-1]+=lengths[0]
+            starts=starts[1:]
+            lengths=lengths[1:]
+        self.starts=np.concatenate((self.starts,starts))
+        self.lengths=np.concatenate((self.lengths,lengths))
+
+    def crop(self, start, stop):
+        #Gaps inside readings start..stop-1, re-indexed from start.
+        ends=np.minimum(self.ends,stop)
+        starts=np.maximum(self.starts,start)
+        keep=ends>starts
+        return GapIndex(starts[keep]-start,ends[keep]-starts[keep])
+
+    def decimate(self, factor):
+        #The same gaps after keeping every factor-th reading. Any kept reading that was inside a gap stays marked.
+        starts=-(-self.starts//factor)
+        ends=-(-self.ends//factor)
+        keep=ends>starts
+        return GapIndex(starts[keep],ends[keep]-starts[keep])
+
+    def longer_than(self, readings):
+        keep=self.lengths>readings
+        return GapIndex(self.starts[keep],self.lengths[keep])
+
+    def mask(self, readings):
+        edges=np.zeros(readings+1,dtype=np.int64)
+        np.add.at(edges,np.minimum(self.starts,readings),1)
+        np.add.at(edges,np.minimum(self.ends,readings),-1)
+        return np.cumsum(edges[:-1])>0
+
+    def overlaps(self, w_starts, w_length):
+        #True for every window [w_start, w_start+w_length) that contains at least one missing reading.
+        w_starts=np.asarray(w_starts)
+        before=np.searchsorted(self.starts,w_starts+w_length,side="left")
+        finished=np.searchsorted(self.ends,w_starts,side="right")
+        return before>finished
+
+    def interpolate(self, data):
+        #Fills every gap in place by joining the readings on either side with a straight line. Gaps at the
+        #ends of the recording take the nearest valid reading. Works on arrays and memory maps alike.
+        data=np.atleast_2d(data)
+        readings=data.shape[-1]
+        for start,end in zip(self.starts,self.ends):
+            before=data[:,start-1] if start>0 else None
+            after=data[:,end] if end<readings else None
+            if before is None and after is None:
+                data[:,start:end]=0.0
+            elif before is None:
+                data[:,start:end]=after[:,None]
+            elif after is None:
+                data[:,start:end]=before[:,None]
+            else:
+                weight=np.arange(1,end-start+1)/(end-start+1)
+                data[:,start:end]=before[:,None]+(after-before)[:,None]*weight
+        return data
+
+    def statistics(self, readings, f_sample):
+        missing=int(self.lengths.sum())
+        return {"Gaps":len(self),
+                "Missing Readings":missing,
+                "Missing Fraction":missing/readings if readings else 0.0,
+                "Longest Gap (s)":float(self.lengths.max())/f_sample if len(self) else 0.0}
+
+    def save(self, path, readings, f_sample, times=None):
+        #Writes the gap statistics followed by one row per gap.
+        with open(path,'w',newline="") as csvfile:
+            csvwriter=csv.writer(csvfile)
+            for name,value in self.statistics(readings,f_sample).items():
+                csvwriter.writerow([name,value])
+            csvwriter.writerow([])
+            csvwriter.writerow(["Start Index","Length","Start Time (s)","Duration (s)"])
+            for start,length in zip(self.starts,self.lengths):
+                startTime=times[start] if times is not None else ""
+                duration=length/f_sample
+                csvwriter.writerow([int(start),int(length),startTime,duration])
+
+    @classmethod
+    def load(cls, path):
+        starts=[]
+        lengths=[]
+        with open(path,mode="r") as file:
+            csvFile=csv.reader(file)
+            for lines in csvFile: #Skipping the statistics at the top of the file.
+                if lines and lines[0]=="Start Index":
+                    break
+            for lines in csvFile:
+                starts.append(int(lines[0]))
+                lengths.append(int(lines[1]))
+        return cls(starts,lengths)
+
+
+def gap_filename(recording):
+    #The gap index of a recording is stored next to it, e.g. PCB_6_29_10_51_3000_Gaps.csv.
+    return recording[:-4]+"_Gaps.csv"
@@ -0,0 +1,44 @@
+"""
+Measures the cold import time of the core package in fresh interpreters.
+Usage: python -m ChatterCore.ImportTime [budget in milliseconds]
+The budget is for the time spent on top of importing NumPy, which the core cannot do without. Exits
+with a non-zero status when the median is over budget or a heavy back-end was loaded by the import.
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES=["matplotlib","pandas","scipy","imageio","labjack","RestfulAPIBase","concurrent.futures"]
+
+
+def _probe(module):
+    return ("import sys,time;t=time.perf_counter();import "+module+";t=time.perf_counter()-t;"
+            "print(t);print(','.join(m for m in "+repr(HEAVY_MODULES)+" if m in sys.modules))")
+
+
+def measure_import_time(module="ChatterCore", repeats=7):
+    #Returns the import time, in seconds, of each run and the heavy modules that got loaded.
+    root=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    times=[]
+    loaded=set()
+    for _ in range(repeats):
+        output=subprocess.run([sys.executable,"-c",_probe(module)],cwd=root,capture_output=True,text=True,check=True).stdout.split("\n")
+        times.append(float(output[0]))
+        loaded.update(name for name in output[1].split(",") if name)
+    return times,sorted(loaded)
+
+
+if __name__=="__main__":
+    budget=float(sys.argv[1]) if len(sys.argv)>1 else 25.0
+    numpyTimes,_=measure_import_time("numpy")
+    coreTimes,loaded=measure_import_time("ChatterCore")
+    numpyMedian=statistics.median(numpyTimes)*1000
+    coreMedian=statistics.median(coreTimes)*1000
+    print("Cold import of numpy:       median %0.1f ms" % numpyMedian)
+    print("Cold import of ChatterCore: median %0.1f ms (%0.1f ms on top of numpy, budget %0.0f ms)" %
+          (coreMedian,coreMedian-numpyMedian,budget))
+    if loaded:
+        print("Heavy modules loaded at import: "+", ".join(loaded))
+    sys.exit(1 if coreMedian-numpyMedian>budget or loaded else 0)
@@ -0,0 +1,21 @@
+import importlib
+
+
+class LazyModule:
+    #Stands in for a module and only imports it the first time one of its attributes is used.
+    #This keeps plotting, hardware and heavy numerical back-ends out of processes that never touch them.
+    def __init__(self, name):
+        self._name=name
+        self._module=None
+
+    def _load(self):
+        if self._module is None:
+            self._module=importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(),attribute)
+
+    def __repr__(self):
+        state="loaded" if self._module is not None else "not loaded"
+        return "<lazy module '"+self._name+"' ("+state+")>"
@@ -0,0 +1,185 @@
+import numpy as np
+from ChatterCore.Lazy import LazyModule
+
+signal=LazyModule("scipy.signal")
+integrate=LazyModule("scipy.integrate")
+
+
+def highpass_sos(f_sample, f_pass, f_stop, g_pass=3, g_stop=40):
+    #Designs the Butterworth highpass filter used before integration, as second-order sections.
+    wp=f_pass/(f_sample/2) #Calculated omega pass frequency for analog filtering.
+    ws=f_stop/(f_sample/2) #Calculated omega stop frequency for analog filtering.
+    N,Wn=signal.buttord(wp,ws,g_pass,g_stop)
+    return signal.butter(N,Wn,'high',output="sos")
+
+
+def butter_highpass_filter(data, sos): #Function to apply Butterworth filter to data along its last axis.
+    #The sections are cast to the data's type, so float32 readings are filtered in float32.
+    return signal.sosfilt(np.asarray(sos,dtype=data.dtype) if data.dtype==np.float32 else sos,data,axis=-1)
+
+
+def decimation_factor(f_sample, analysis_rate):
+    #Largest whole factor that keeps the rate at or above analysis_rate; 1 (no decimation) when it is None.
+    if not analysis_rate:
+        return 1
+    return max(1,int(f_sample//analysis_rate))
+
+
+def decimate_readings(times, accel, factor):
+    #Keeps every factor-th reading of a (channels x readings) array after a zero-phase FIR lowpass below the
+    #new Nyquist frequency, so nothing above it aliases into the band the indicator looks at. Displacement
+    #is dominated by low frequencies anyway, so integrating at the lower rate loses very little.
+    if factor<=1:
+        return times,accel
+    return times[::factor],signal.decimate(accel,factor,ftype="fir",axis=-1,zero_phase=True).astype(accel.dtype,copy=False)
+
+
+def cumulative_trapezoid(values, times):
+    #Running trapezoidal integral along the last axis, starting at 0. float64 values go through SciPy;
+    #float32 values stay float32, with the steps taken from the float64 times.
+    if values.dtype!=np.float32:
+        return integrate.cumulative_trapezoid(values,times,initial=0.0,axis=-1)
+    result=np.empty_like(values)
+    result[...,0]=0
+    np.cumsum((values[...,1:]+values[...,:-1])*(np.diff(times)*0.5).astype(np.float32),axis=-1,out=result[...,1:])
+    return result
+
+
+def integrate_displacement(accel, times, sos, detrend_displacement=True):
+    #Takes a (channels x readings) acceleration array and returns velocity and displacement of the same shape.
+    #The first detrend is done per channel because high order filters amplify last-bit differences.
+    #float32 acceleration is processed in float32 throughout; anything else in float64.
+    accel=np.atleast_2d(accel)
+    filtaccel=np.vstack([signal.detrend(row,type="linear") for row in accel])
+    filtaccel=butter_highpass_filter(filtaccel,sos)
+    velo=cumulative_trapezoid(filtaccel,times)
+    velo=signal.detrend(velo,type="linear",axis=-1)
+    disp=cumulative_trapezoid(velo,times)
+    if detrend_displacement:
+        disp=signal.detrend(disp,type="linear",axis=-1)
+    return velo,disp
+
+
+def bisection_mask(times, revolution_time):
+    #Marks the first reading at least one revolution after the previous bisection point.
+    #Only one searchsorted call is made per revolution instead of one comparison per reading.
+    mask=np.zeros(len(times),dtype=bool)
+    if len(times)==0:
+        return mask
+    index=np.searchsorted(times,times[0]+revolution_time,side="left")
+    while index<len(times):
+        mask[index]=True
+        index=np.searchsorted(times,times[index]+revolution_time,side="left")
+    return mask
+
+
+def path_length(disp):
+    #Distance travelled along the trajectory up to each reading, for any number of channels.
+    #The running sum is always float64: bisection distances are differences of it, and a float32 sum over a
+    #whole recording would lose most of their digits.
+    steps=np.diff(disp,axis=-1)
+    if steps.shape[0]==2:
+        steps=np.hypot(steps[0],steps[1])
+    else:
+        steps=np.sqrt(np.sum(steps*steps,axis=0))
+    return np.concatenate(([0.0],np.cumsum(steps,dtype=np.float64)))
+
+
+def window_starts(readings, w_length, s_length):
+    return np.arange(0,readings-w_length,s_length)
+
+
+def bisection_distances(pathLength, bisections, starts, w_length):
+    #Distance travelled between consecutive bisection points in every window, the first one measured from
+    #the window start. Returns one array per window.
+    first=np.searchsorted(bisections,starts)
+    last=np.searchsorted(bisections,starts+w_length)
+    return [np.diff(pathLength[np.concatenate(([w_start],bisections[first[k]:last[k]]))]) for k,w_start in enumerate(starts)]
+
+
+NORMALIZATIONS=("recording","expanding","ewma")
+
+
+class CausalBaseline:
+    #Running estimate of the distance travelled per revolution that only uses the bisection points seen so far,
+    #so the modified indicator can be normalized as readings arrive. Without a halflife it is the mean of every
+    #distance so far, which converges to the whole-recording mean. With a halflife in revolutions, the first
+    #warmup distances are averaged and the baseline then follows an exponentially weighted mean. Each distance
+    #costs O(1) and no history is kept.
+    def __init__(self, warmup=20, halflife=None):
+        self.warmup=max(int(warmup),1)
+        self.alpha=None if halflife is None else 1-0.5**(1/halflife)
+        self.count=0
+        self.value=np.nan
+
+    def update(self, distances):
+        #Adds distances in the order they were travelled and returns the baseline after each of them.
+        distances=np.asarray(distances,dtype=np.float64)
+        result=np.empty(len(distances))
+        n=len(distances) if self.alpha is None else min(max(self.warmup-self.count,0),len(distances))
+        if n:
+            total=(self.value*self.count if self.count else 0.0)+np.cumsum(distances[:n])
+            result[:n]=total/(self.count+np.arange(1,n+1))
+        rest=distances[n:]
+        if len(rest):
+            previous=result[n-1] if n else self.value
+            result[n:]=signal.lfilter([self.alpha],[1,self.alpha-1],rest,zi=[(1-self.alpha)*previous])[0]
+        self.count+=len(distances)
+        if len(distances):
+            self.value=result[-1]
+        return result
+
+
+def causal_scale(bisectionPath, bisections, ends, baseline):
+    #Baseline at the end of every window from the bisection points before it, ends being exclusive reading
+    #indices. Windows that end before the second bisection point have no baseline yet and give NaN.
+    values=np.concatenate(([np.nan],baseline.update(np.diff(bisectionPath))))
+    last=np.searchsorted(bisections,ends)-1
+    return np.where(last>=0,values[np.maximum(last,0)],np.nan)
+
+
+def modified_chatter_indicator(disp, mask, starts, w_length, valid=None, normalization="recording", warmup=20, halflife=100):
+    #Variance of the distance travelled between bisection points, normalized by the squared mean distance.
+    #normalization "recording" takes the mean over the whole recording, so no value is final before its end.
+    #"expanding" and "ewma" take a CausalBaseline at the end of each window, the mean of every revolution so
+    #far or, after warmup revolutions, an exponentially weighted mean with the given halflife in revolutions.
+    #Windows with fewer than two bisection points, or not marked valid, give NaN.
+    if normalization not in NORMALIZATIONS:
+        raise ValueError("Unknown normalization "+repr(normalization)+", expected one of "+", ".join(NORMALIZATIONS))
+    metricVar=np.full(len(starts),np.nan)
+    if valid is None:
+        valid=np.ones(len(starts),dtype=bool)
+    pathLength=path_length(disp)
+    bisections=np.flatnonzero(mask)
+    metrics=bisection_distances(pathLength,bisections,starts[valid],w_length)
+    metricVar[valid]=[np.var(metric,ddof=1) if len(metric)>1 else np.nan for metric in metrics]
+    if normalization=="recording":
+        scaler=np.mean(np.concatenate(metrics)) if metrics else np.nan
+    else:
+        baseline=CausalBaseline(warmup,halflife if normalization=="ewma" else None)
+        scaler=causal_scale(pathLength[bisections],bisections,starts+w_length,baseline)
+    return metricVar/(scaler**2)
+
+
+def bisection_points(disp, times, bisection_times):
+    #Displacement of every channel at the given times, interpolated linearly between readings.
+    return np.vstack([np.interp(bisection_times,times,row) for row in disp])
+
+
+def classic_chatter_indicator(disp, mask=None, bisections=None):
+    #Product of the spread of the bisection points over the product of the spread of the whole trajectory.
+    #The bisection points are the readings picked by mask, or given directly as (channels x points).
+    bis=disp[:,mask] if bisections is None else bisections
+    return float(np.prod(np.std(bis,axis=-1,ddof=1))/np.prod(np.std(disp,axis=-1,ddof=1)))
+
+
+def classic_window_indicator(accel, times, sos, revolution_time, decimation=1):
+    #ChatterDetector's indicator for one window of (channels x readings) acceleration, with sos designed for
+    #the rate after decimation. The bisection points are always picked on the full rate times; a decimated
+    #window's displacement is interpolated at them, which follows the full rate indicator far more closely
+    #than picking the nearest decimated reading.
+    mask=bisection_mask(times,revolution_time)
+    decimatedT,decimated=decimate_readings(times,accel,decimation)
+    velo,disp=integrate_displacement(decimated,decimatedT,sos,detrend_displacement=False)
+    bisections=disp[:,mask] if decimation<=1 else bisection_points(disp,decimatedT,times[mask])
+    return classic_chatter_indicator(disp,bisections=bisections)
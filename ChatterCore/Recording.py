@@ -0,0 +1,66 @@
+import numpy as np
+from ChatterCore.Lazy import LazyModule
+from ChatterCore.Archive import ARCHIVE_SUFFIX, RecordingArchive
+
+pd=LazyModule("pandas")
+
+
+def load_recording(filepath, column_order="TXYZ", channels="XY", drop_first=True, dtype=np.float64):
+    #Reads a recording and returns (times, accel) with accel shaped (channels x readings).
+    #column_order names the columns of the file, e.g. "TZXY" when Z is stored before X and Y.
+    #By default the first reading is dropped, as the original analysis scripts did. Time starts from zero.
+    #Compressed archives written by ChatterCore.Archive are read the same way. accel has the given dtype,
+    #e.g. np.float32 to halve its memory; times are always float64, as float32 cannot resolve a sampling
+    #period once a recording is a few minutes long.
+    if filepath.endswith(ARCHIVE_SUFFIX):
+        archive=RecordingArchive(filepath)
+        data=archive.read_rows(columns=[column_order.find(name) for name in "T"+channels])[1 if drop_first else 0:]
+        archive.close()
+    else:
+        data_accel=pd.read_csv(filepath)
+        col_list=list(data_accel)
+        columns=[col_list[column_order.find(name)] for name in "T"+channels]
+        data=data_accel[columns].to_numpy(dtype=np.float64)[1 if drop_first else 0:]
+    times=data[:,0]-data[0,0]
+    accel=np.ascontiguousarray(data[:,1:].T,dtype=dtype)
+    return times,accel
+
+
+def iter_recording_chunks(filepath, column_order="TXYZ", channels="XY", chunk_rows=1<<18, drop_first=True, dtype=np.float64):
+    #Reads a recording piece by piece, yielding (times, accel) blocks of at most chunk_rows readings with
+    #accel shaped (channels x readings). Times are left as stored in the file.
+    #Archives are read a stored chunk at a time, whatever chunk_rows is.
+    skip=drop_first
+    if filepath.endswith(ARCHIVE_SUFFIX):
+        archive=RecordingArchive(filepath)
+        blocks=archive.iter_chunks([column_order.find(name) for name in "T"+channels])
+    else:
+        header=list(pd.read_csv(filepath,nrows=0))
+        columns=[header[column_order.find(name)] for name in "T"+channels]
+        blocks=(frame[columns].to_numpy(dtype=np.float64) for frame in pd.read_csv(filepath,usecols=columns,chunksize=chunk_rows))
+    for data in blocks:
+        if skip:
+            data=data[1:]
+            skip=False
+        if len(data):
+            yield data[:,0],np.ascontiguousarray(data[:,1:].T,dtype=dtype)
+    if filepath.endswith(ARCHIVE_SUFFIX):
+        archive.close()
+
+
+def load_column(filepath, name, drop_first=True):
+    #Values of the column with the given header name, e.g. "CI Value", or None when the recording has no such
+    #column. Archives are read the same way, and the first reading is dropped as in load_recording.
+    if filepath.endswith(ARCHIVE_SUFFIX):
+        archive=RecordingArchive(filepath)
+        try:
+            if name not in archive.columns:
+                return None
+            values=archive.read_rows(columns=[name])[:,0]
+        finally:
+            archive.close()
+    else:
+        if name not in list(pd.read_csv(filepath,nrows=0)):
+            return None
+        values=pd.read_csv(filepath,usecols=[name])[name].to_numpy(dtype=np.float64)
+    return values[1 if drop_first else 0:]
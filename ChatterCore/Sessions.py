@@ -0,0 +1,172 @@
+"""
+Append-only SQLite store of everything ChatterDetector measures, kept across sessions.
+Every cut gets a row with its parameters, and its indicator series, threshold crossings and stability lobe
+points are added as they are measured. Fitted lobe constants are kept with the time span of the points
+they were fitted to. Rows are never changed, except that a cut's end time, reading counts and recording
+file are filled in when it finishes, and never deleted, so months of history can be queried and lobes
+re-fitted without reading any recording. Times are Unix times in seconds; indicator and event times are
+seconds from the start of their cut.
+
+Indicator rows are committed at most every commit_interval seconds, and the database runs in
+write-ahead-log mode, so storing a cut costs the acquisition loop next to nothing.
+
+Run "python -m ChatterCore.Sessions [database]" to list the most recent cuts.
+"""
+
+import os
+import sys
+import time
+import numpy as np
+from ChatterCore.Lazy import LazyModule
+
+sqlite3=LazyModule("sqlite3")
+
+DEFAULT_DATABASE="ChatterSessions.sqlite"
+
+SCHEMA="""
+CREATE TABLE IF NOT EXISTS cuts (id INTEGER PRIMARY KEY, started REAL, ended REAL, machine TEXT, rpm REAL,
+    sampling_frequency REAL, time_window REAL, time_resolution REAL, threshold REAL, channels TEXT,
+    readings INTEGER, skipped INTEGER, recording TEXT);
+CREATE TABLE IF NOT EXISTS indicators (cut INTEGER REFERENCES cuts(id), t REAL, value REAL);
+CREATE TABLE IF NOT EXISTS events (cut INTEGER REFERENCES cuts(id), t REAL, value REAL, threshold REAL, chattering INTEGER);
+CREATE TABLE IF NOT EXISTS lobe_points (id INTEGER PRIMARY KEY, cut INTEGER REFERENCES cuts(id), recorded REAL,
+    machine TEXT, rpm REAL, depth REAL);
+CREATE TABLE IF NOT EXISTS lobe_fits (id INTEGER PRIMARY KEY, created REAL, machine TEXT, points INTEGER,
+    first_point REAL, last_point REAL, constants TEXT);
+CREATE INDEX IF NOT EXISTS cuts_started ON cuts (started);
+CREATE INDEX IF NOT EXISTS cuts_machine ON cuts (machine, started);
+CREATE INDEX IF NOT EXISTS cuts_rpm ON cuts (rpm);
+CREATE INDEX IF NOT EXISTS indicators_cut ON indicators (cut, t);
+CREATE INDEX IF NOT EXISTS events_cut ON events (cut, t);
+CREATE INDEX IF NOT EXISTS lobe_points_machine ON lobe_points (machine, recorded);
+CREATE INDEX IF NOT EXISTS lobe_points_rpm ON lobe_points (rpm);
+CREATE INDEX IF NOT EXISTS lobe_fits_machine ON lobe_fits (machine, created);
+"""
+
+
+def unique_filename(filename):
+    #filename, or filename with _2, _3, ... added before the extension if that file already exists, so two
+    #cuts in the same minute no longer overwrite each other.
+    stem,extension=os.path.splitext(filename)
+    candidate=filename
+    number=2
+    while os.path.exists(candidate):
+        candidate=stem+"_"+str(number)+extension
+        number+=1
+    return candidate
+
+
+def _range_clause(field, low, high, clauses, parameters):
+    if low is not None:
+        clauses.append(field+">=?")
+        parameters.append(low)
+    if high is not None:
+        clauses.append(field+"<=?")
+        parameters.append(high)
+
+
+class SessionStore:
+    def __init__(self, database=DEFAULT_DATABASE, commit_interval=1.0):
+        self.database=database
+        self.commit_interval=commit_interval #Longest time, in seconds, that added indicators stay uncommitted.
+        self.connection=sqlite3.connect(database)
+        self.connection.row_factory=sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.lastCommit=time.monotonic()
+
+    def _insert(self, table, row):
+        cursor=self.connection.execute("INSERT INTO "+table+" ("+",".join(row)+") VALUES ("+",".join("?"*len(row))+")",list(row.values()))
+        return cursor.lastrowid
+
+    def _maybe_commit(self):
+        if time.monotonic()-self.lastCommit>=self.commit_interval:
+            self.commit()
+
+    def commit(self):
+        self.connection.commit()
+        self.lastCommit=time.monotonic()
+
+    def start_cut(self, machine, rpm, sampling_frequency, time_window, time_resolution, threshold, channels, started=None):
+        #Adds a cut and returns its id.
+        cut=self._insert("cuts",{"started":time.time() if started is None else started,"machine":machine,"rpm":rpm,
+                                 "sampling_frequency":sampling_frequency,"time_window":time_window,
+                                 "time_resolution":time_resolution,"threshold":threshold,"channels":",".join(channels)})
+        self.commit()
+        return cut
+
+    def add_indicator(self, cut, t, value):
+        self._insert("indicators",{"cut":cut,"t":t,"value":value})
+        self._maybe_commit()
+
+    def add_event(self, cut, t, value, threshold, chattering):
+        self._insert("events",{"cut":cut,"t":t,"value":value,"threshold":threshold,"chattering":int(chattering)})
+        self.commit()
+
+    def add_lobe_point(self, cut, machine, rpm, depth, recorded=None):
+        self._insert("lobe_points",{"cut":cut,"recorded":time.time() if recorded is None else recorded,"machine":machine,"rpm":rpm,"depth":depth})
+        self.commit()
+
+    def finish_cut(self, cut, readings, skipped, recording, ended=None):
+        self.connection.execute("UPDATE cuts SET ended=?, readings=?, skipped=?, recording=? WHERE id=? AND ended IS NULL",
+                                (time.time() if ended is None else ended,readings,skipped,recording,cut))
+        self.commit()
+
+    def add_lobe_fit(self, machine, constants, points, first_point, last_point, created=None):
+        import json #Imported here to keep the package import light.
+        fit=self._insert("lobe_fits",{"created":time.time() if created is None else created,"machine":machine,"points":points,
+                                      "first_point":first_point,"last_point":last_point,"constants":json.dumps([float(c) for c in constants])})
+        self.commit()
+        return fit
+
+    def cuts(self, machine=None, rpm=None, since=None, until=None):
+        #Cuts as dictionaries, oldest first. rpm is a value or a (low, high) range.
+        clauses=[]
+        parameters=[]
+        if machine is not None:
+            clauses.append("machine=?")
+            parameters.append(machine)
+        low,high=rpm if isinstance(rpm,(tuple,list)) else (rpm,rpm)
+        _range_clause("rpm",low,high,clauses,parameters)
+        _range_clause("started",since,until,clauses,parameters)
+        return [dict(row) for row in self.connection.execute("SELECT * FROM cuts WHERE "+(" AND ".join(clauses) or "1")+" ORDER BY started",parameters)]
+
+    def indicators(self, cut):
+        #(times, values) of a cut's indicator series.
+        rows=self.connection.execute("SELECT t, value FROM indicators WHERE cut=? ORDER BY t",(cut,)).fetchall()
+        data=np.array(rows,dtype=np.float64).reshape(-1,2)
+        return data[:,0],data[:,1]
+
+    def events(self, cut):
+        return [dict(row) for row in self.connection.execute("SELECT * FROM events WHERE cut=? ORDER BY t",(cut,))]
+
+    def lobe_points(self, machine=None, since=None, until=None):
+        #(rpm, depth, recorded) arrays of the stored lobe points.
+        clauses=[]
+        parameters=[]
+        if machine is not None:
+            clauses.append("machine=?")
+            parameters.append(machine)
+        _range_clause("recorded",since,until,clauses,parameters)
+        rows=self.connection.execute("SELECT rpm, depth, recorded FROM lobe_points WHERE "+(" AND ".join(clauses) or "1")+" ORDER BY recorded",parameters).fetchall()
+        data=np.array(rows,dtype=np.float64).reshape(-1,3)
+        return data[:,0],data[:,1],data[:,2]
+
+    def lobe_fits(self, machine=None):
+        import json #Imported here to keep the package import light.
+        rows=self.connection.execute("SELECT * FROM lobe_fits WHERE ?1 IS NULL OR machine=?1 ORDER BY created",(machine,))
+        return [dict(row,constants=json.loads(row["constants"])) for row in rows]
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+
+if __name__=="__main__":
+    store=SessionStore(sys.argv[1] if len(sys.argv)>1 else DEFAULT_DATABASE)
+    for cut in store.cuts()[-20:]:
+        events=store.events(cut["id"])
+        print(time.strftime("%Y-%m-%d %H:%M:%S",time.localtime(cut["started"])),cut["machine"],cut["rpm"],"RPM",
+              len(store.indicators(cut["id"])[0]),"indicators",sum(event["chattering"] for event in events),"chatter events",cut["recording"])
+    store.close()
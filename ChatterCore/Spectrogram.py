@@ -0,0 +1,141 @@
+"""
+Streaming short-time Fourier transform for following the chatter frequency through a cut.
+Readings are fed in blocks of any size. The last window-hop readings of each block are kept and put in
+front of the next one, so the frames are exactly those of a single STFT over the whole recording, without
+the recording ever being held in memory. Frames are power spectral densities per channel, and frames that
+contain a missing (NaN) reading are dropped.
+
+Every frame goes into a SpectrogramHistory of fixed size that averages neighbouring frames pairwise when
+it fills up, so a whole session is kept at a resolution that coarsens as it grows. chatter_features()
+turns frames into per-frame detection features.
+"""
+
+import numpy as np
+from ChatterCore.Recording import iter_recording_chunks
+
+
+class SpectrogramHistory:
+    #Keeps at most capacity frames of (channels x bins) power. Once full, neighbouring frames are averaged
+    #pairwise and the number of frames per stored column doubles.
+    def __init__(self, capacity, channels, bins):
+        self.capacity=capacity-capacity%2
+        self.t=np.empty(self.capacity)
+        self.power=np.empty((self.capacity,channels,bins))
+        self.count=0
+        self.stride=1 #Number of incoming frames averaged into one stored column.
+        self.pendingT=0.0
+        self.pendingPower=np.zeros((channels,bins))
+        self.pendingN=0
+
+    def extend(self, times, power):
+        for t,frame in zip(times,power):
+            if self.pendingN==0:
+                self.pendingT=t
+            self.pendingPower+=frame
+            self.pendingN+=1
+            if self.pendingN>=self.stride:
+                self.t[self.count]=self.pendingT
+                self.power[self.count]=self.pendingPower/self.pendingN
+                self.count+=1
+                self.pendingPower.fill(0.0)
+                self.pendingN=0
+                if self.count==self.capacity:
+                    half=self.count//2
+                    self.t[:half]=self.t[0:self.count:2]
+                    self.power[:half]=0.5*(self.power[0:self.count:2]+self.power[1:self.count:2])
+                    self.count=half
+                    self.stride*=2
+
+    def arrays(self):
+        #Returns the stored columns, including the partially filled one at the end.
+        if self.pendingN==0:
+            return self.t[:self.count],self.power[:self.count]
+        return (np.append(self.t[:self.count],self.pendingT),
+                np.concatenate((self.power[:self.count],(self.pendingPower/self.pendingN)[None])))
+
+
+class StreamingSTFT:
+    def __init__(self, f_sample, window=256, hop=64, channels=2, history=2048, start_time=0.0):
+        self.f_sample=f_sample
+        self.window=window
+        self.hop=hop
+        self.start_time=start_time #Time of the first reading fed in.
+        self.taper=np.hanning(window)
+        self.scale=2.0/(f_sample*np.sum(self.taper**2)) #One-sided power spectral density.
+        self.freqs=np.fft.rfftfreq(window,1/f_sample)
+        self.carry=np.empty((channels,0))
+        self.consumed=0 #Index of the first reading still held in carry.
+        self.history=SpectrogramHistory(history,channels,len(self.freqs))
+        self.last_power=None #Most recent complete frame, for use in a live loop.
+
+    def update(self, block):
+        #Adds a (channels x readings) block and returns the times and (frames x channels x bins) power of the
+        #frames it completed.
+        data=np.concatenate((self.carry,np.atleast_2d(block)),axis=1)
+        frames=(data.shape[1]-self.window)//self.hop+1 if data.shape[1]>=self.window else 0
+        if frames<=0:
+            self.carry=data
+            return np.empty(0),np.empty((0,data.shape[0],len(self.freqs)))
+        view=np.lib.stride_tricks.sliding_window_view(data,self.window,axis=1)[:,::self.hop][:,:frames]
+        offsets=np.arange(frames)*self.hop
+        valid=~np.isnan(view).any(axis=(0,2))
+        power=np.abs(np.fft.rfft(view[:,valid]*self.taper,axis=-1))**2*self.scale
+        power=power.transpose(1,0,2)
+        times=self.start_time+(self.consumed+offsets[valid]+0.5*self.window)/self.f_sample
+        self.carry=data[:,frames*self.hop:].copy()
+        self.consumed+=frames*self.hop
+        if len(times):
+            self.history.extend(times,power)
+            self.last_power=power[-1]
+        return times,power
+
+    def export(self, max_columns=None, max_bins=None):
+        #History averaged down to at most max_columns frames and max_bins frequencies, for plots and files.
+        times,power=self.history.arrays()
+        freqs=self.freqs
+        if max_columns and len(times)>max_columns:
+            group=-(-len(times)//max_columns)
+            edges=np.arange(0,len(times),group)
+            times=times[edges]
+            power=np.add.reduceat(power,edges,axis=0)/np.diff(np.append(edges,len(power)))[:,None,None]
+        if max_bins and len(freqs)>max_bins:
+            group=-(-len(freqs)//max_bins)
+            edges=np.arange(0,len(freqs),group)
+            freqs=freqs[edges]
+            power=np.add.reduceat(power,edges,axis=2)/np.diff(np.append(edges,self.history.power.shape[2]))
+        return times,freqs,power
+
+    def save(self, path, max_columns=None, max_bins=None):
+        times,freqs,power=self.export(max_columns,max_bins)
+        np.savez_compressed(path,times=times,freqs=freqs,power=power,f_sample=self.f_sample,window=self.window,hop=self.hop)
+
+
+def chatter_features(power, freqs, spindle_speed, f_min=50.0, tolerance=None):
+    #Per-frame features from (frames x channels x bins) power. Forced vibration sits on multiples of the
+    #spindle frequency, chatter does not, so the features look at the power away from those harmonics:
+    #"ratio" is its share of the power above f_min and "frequency" the strongest such frequency.
+    #tolerance is how close, in Hz, a bin has to be to a harmonic to count as one. By default it is one bin
+    #width, capped at a quarter of the spindle frequency; the window needs to be long enough for its bins to
+    #resolve the harmonics for the features to mean much.
+    power=np.atleast_3d(power).sum(axis=1)
+    spindle=spindle_speed/60
+    tolerance=tolerance if tolerance is not None else min(freqs[1]-freqs[0],0.25*spindle)
+    distance=np.abs((freqs+0.5*spindle)%spindle-0.5*spindle) #Distance to the nearest spindle harmonic.
+    band=freqs>=f_min
+    off=band&(distance>tolerance)
+    total=power[:,band].sum(axis=1)
+    offPower=power[:,off]
+    ratio=np.divide(offPower.sum(axis=1),total,out=np.full(len(power),np.nan),where=total>0)
+    frequency=freqs[off][np.argmax(offPower,axis=1)] if off.any() else np.full(len(power),np.nan)
+    return {"ratio":ratio,"frequency":frequency}
+
+
+def recording_spectrogram(filepath, column_order="TXYZ", channels="XY", window=256, hop=64, history=2048, chunk_rows=1<<18):
+    #Streams a recording from disk through a StreamingSTFT and returns it.
+    stft=None
+    for times,accel in iter_recording_chunks(filepath,column_order,channels,chunk_rows):
+        if stft is None:
+            f_sample=(len(times)-1)/(times[-1]-times[0]) if len(times)>1 else 1.0
+            stft=StreamingSTFT(f_sample,window,hop,len(accel),history,start_time=times[0])
+        stft.update(accel)
+    return stft
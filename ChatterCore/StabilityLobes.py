@@ -0,0 +1,116 @@
+"""
+Analytic stability lobes from a tool's frequency response function (FRF), after Tlusty as given by
+Schmitz and Smith. For every chatter frequency where the real part of the oriented FRF is negative, the
+limiting depth of cut is
+
+    b_lim = -1 / (2 Ks mu Nt* Re[G(f)])
+
+and the spindle speeds at which it applies are
+
+    rpm = 60 f / (Nt (k + epsilon / 2 pi)),  epsilon = 2 pi - 2 atan(Re[G] / Im[G]),  k = 0, 1, 2, ...
+
+with Ks the specific cutting force, mu the directional orientation factor, Nt the number of teeth and Nt*
+the mean number of teeth in the cut. All frequencies and lobe numbers are evaluated as one array, and the
+diagram on an RPM grid is the lowest lobe at every speed, so a full diagram takes a few milliseconds.
+
+The FRF comes from a tap test (load_frf) or from modal parameters (modal_frf). Units are SI: FRF in m/N,
+Ks in N/m^2 and depths in metres. LobeCache keeps diagrams per machine and tool on disk.
+"""
+
+import os
+import numpy as np
+
+
+def modal_frf(freqs, natural_frequencies, damping_ratios, stiffnesses):
+    #FRF in m/N of a sum of single degree of freedom modes, evaluated at freqs in Hz.
+    ratio=np.asarray(freqs,dtype=np.float64)[:,None]/np.asarray(natural_frequencies,dtype=np.float64)
+    modes=1/(np.asarray(stiffnesses,dtype=np.float64)*(1-ratio**2+2j*np.asarray(damping_ratios,dtype=np.float64)*ratio))
+    return modes.sum(axis=1)
+
+
+def load_frf(path):
+    #Tap test FRF from a CSV of frequency in Hz and the real and imaginary parts in m/N, with a header row.
+    data=np.loadtxt(path,delimiter=",",skiprows=1,usecols=(0,1,2))
+    return data[:,0],data[:,1]+1j*data[:,2]
+
+
+def mean_teeth_in_cut(teeth, radial_immersion):
+    #Average number of teeth engaged for a radial depth of radial_immersion times the tool diameter.
+    swept=np.arccos(1-2*min(max(radial_immersion,0.0),1.0)) #Angle each tooth spends in the cut.
+    return teeth*swept/(2*np.pi)
+
+
+def stability_lobes(freqs, frf, teeth, cutting_coefficient, teeth_in_cut=None, orientation=1.0, lobes=30):
+    #Returns (rpm, depth), both (lobes x frequencies), with NaN where the FRF cannot chatter (Re[G] >= 0).
+    #Row k is lobe number k, the one with k full tooth vibration periods between passes.
+    freqs=np.asarray(freqs,dtype=np.float64)
+    frf=np.asarray(frf,dtype=np.complex128)
+    teeth_in_cut=teeth/2 if teeth_in_cut is None else teeth_in_cut #Half immersion unless told otherwise.
+    unstable=frf.real<0
+    depth=np.full(len(freqs),np.nan)
+    depth[unstable]=-1/(2*cutting_coefficient*orientation*teeth_in_cut*frf.real[unstable])
+    epsilon=2*np.pi-2*np.arctan2(frf.real,frf.imag) #Phase between the inner and outer modulation.
+    epsilon=np.mod(epsilon,2*np.pi)
+    k=np.arange(lobes)[:,None]
+    rpm=60*freqs/(teeth*(k+epsilon/(2*np.pi)))
+    rpm[:,~unstable]=np.nan
+    return rpm,np.broadcast_to(depth,rpm.shape)
+
+
+def lobe_envelope(rpm, depth, rpm_grid):
+    #Critical depth at every speed of rpm_grid: the lowest of the lobes from stability_lobes there.
+    rpm_grid=np.asarray(rpm_grid,dtype=np.float64)
+    envelope=np.full(len(rpm_grid),np.inf)
+    for lobeRPM,lobeDepth in zip(rpm,depth):
+        keep=~np.isnan(lobeRPM)
+        if np.count_nonzero(keep)<2:
+            continue
+        order=np.argsort(lobeRPM[keep])
+        x=lobeRPM[keep][order]
+        y=lobeDepth[keep][order]
+        inside=(rpm_grid>=x[0])&(rpm_grid<=x[-1])
+        np.minimum(envelope,np.where(inside,np.interp(rpm_grid,x,y),np.inf),out=envelope)
+    envelope[np.isinf(envelope)]=np.nan
+    return envelope
+
+
+def lobe_diagram(freqs, frf, teeth, cutting_coefficient, rpm_grid, teeth_in_cut=None, orientation=1.0, lobes=None):
+    #Critical depth of cut in metres over rpm_grid. By default enough lobes are used to reach the lowest speed.
+    if lobes is None:
+        lobes=int(np.ceil(60*np.max(freqs)/(teeth*max(np.min(rpm_grid),1.0))))+1
+    rpm,depth=stability_lobes(freqs,frf,teeth,cutting_coefficient,teeth_in_cut,orientation,lobes)
+    return lobe_envelope(rpm,depth,rpm_grid)
+
+
+class LobeCache:
+    #Keeps lobe diagrams on disk, one .npz file per machine, tool, FRF and set of cutting parameters, so a
+    #diagram is only computed again when the tap test or the parameters change.
+    def __init__(self, directory=os.path.join("ChatterCache","Lobes")):
+        self.directory=directory
+        self.memory={}
+        os.makedirs(directory,exist_ok=True)
+
+    def key(self, machine, tool, freqs, frf, *parameters):
+        import hashlib #Imported here to keep the package import light.
+        sha=hashlib.sha1("|".join(str(part) for part in (machine,tool)+parameters).encode())
+        sha.update(np.ascontiguousarray(freqs,dtype=np.float64).tobytes())
+        sha.update(np.ascontiguousarray(frf,dtype=np.complex128).tobytes())
+        return str(machine)+"_"+str(tool)+"_"+sha.hexdigest()[:16]
+
+    def load(self, machine, tool, freqs, frf, teeth, cutting_coefficient, rpm_grid, teeth_in_cut=None, orientation=1.0):
+        #Returns the critical depth over rpm_grid, computing and storing it if needed.
+        rpm_grid=np.asarray(rpm_grid,dtype=np.float64)
+        key=self.key(machine,tool,freqs,frf,teeth,cutting_coefficient,teeth_in_cut,orientation,rpm_grid[0],rpm_grid[-1],len(rpm_grid))
+        if key in self.memory:
+            return self.memory[key]
+        path=os.path.join(self.directory,key+".npz")
+        if os.path.exists(path):
+            with np.load(path) as stored:
+                depth=stored["depth"]
+        else:
+            depth=lobe_diagram(freqs,frf,teeth,cutting_coefficient,rpm_grid,teeth_in_cut,orientation)
+            partial=path[:-4]+"."+str(os.getpid())+".tmp.npz"
+            np.savez(partial,rpm=rpm_grid,depth=depth)
+            os.replace(partial,path)
+        self.memory[key]=depth
+        return depth
@@ -0,0 +1,23 @@
+"""
+Headless signal-processing core of the chatter detection program.
+Importing this package only loads NumPy. SciPy and pandas are imported the first time a function needs
+them, and nothing here touches matplotlib, imageio, the LabJack library or the machine's REST interface,
+so batch and worker processes can import it cheaply. Run "python -m ChatterCore.ImportTime" to check
+the cold import time.
+"""
+
+from ChatterCore.Lazy import LazyModule
+from ChatterCore.Processing import (highpass_sos, decimation_factor, decimate_readings, butter_highpass_filter,
+                                    integrate_displacement, bisection_mask, path_length, window_starts, bisection_distances,
+                                    modified_chatter_indicator, bisection_points, classic_chatter_indicator,
+                                    classic_window_indicator, NORMALIZATIONS, CausalBaseline, causal_scale)
+from ChatterCore.Archive import ARCHIVE_SUFFIX, ArchiveWriter, RecordingArchive, write_archive, archive_filename
+from ChatterCore.Recording import load_recording, iter_recording_chunks, load_column
+from ChatterCore.Gaps import SKIPPED_SAMPLE, GapIndex, gap_filename
+from ChatterCore.Analysis import ChatterAnalysis, analyze_recordings, preprocess_recording
+from ChatterCore.Cache import PreprocessCache
+from ChatterCore.Catalog import RecordingCatalog, parse_recording_path
+from ChatterCore.Chunked import ChunkedChatterAnalysis
+from ChatterCore.Spectrogram import StreamingSTFT, SpectrogramHistory, chatter_features, recording_spectrogram
+from ChatterCore.Sessions import SessionStore, unique_filename
+from ChatterCore.StabilityLobes import modal_frf, load_frf, mean_teeth_in_cut, stability_lobes, lobe_envelope, lobe_diagram, LobeCache
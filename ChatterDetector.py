@@ -36,24 +36,30 @@ Note:
 from datetime import datetime
 import sys
 import numpy as np
-from scipy.integrate import cumtrapz
-from scipy import signal
-import matplotlib.pyplot as plt
 import time
-from labjack import ljm
-from scipy.signal import butter
-from scipy.optimize import curve_fit
 import csv
-import RestfulAPIBase as Base
 from math import tan, pi
-import statistics
+from ChatterCore import LazyModule, highpass_sos, decimation_factor, classic_window_indicator, GapIndex, SKIPPED_SAMPLE, gap_filename, StreamingSTFT, chatter_features, SessionStore, unique_filename, LobeCache, load_frf, mean_teeth_in_cut
+from LiveDashboard import LiveDashboard
+from MessageBus import ResultPublisher
+from ToolpathModel import ToolpathModel
+from RealTimeProfile import JitterMonitor
+
+#The hardware, machine and plotting back-ends are only imported once they are first used.
+ljm=LazyModule("labjack.ljm")
+Base=LazyModule("RestfulAPIBase")
+plt=LazyModule("matplotlib.pyplot")
+signal=LazyModule("scipy.signal")
+optimize=LazyModule("scipy.optimize")
 
 class ChatterDetector:
     def __init__(self):
-        self.X_AXIS_SENSITIVITY=0.001156 #Obtained from sensor callibration sheet.
-        self.X_AXIS_OFFSET=-290.337933013119 #Calculated experimentally from X-axis readings.
-        self.Y_AXIS_SENSITIVITY=0.001055 #Obtained from sensor callibration sheet.
-        self.Y_AXIS_OFFSET=-366.66280307069917 #Calculated experimentally from Y-axis readings.
+        #One entry per accelerometer channel: (axis name, LabJack input, sensitivity, offset). Sensitivities are
+        #obtained from the sensor callibration sheet and offsets calculated experimentally from the readings.
+        #Every channel is scaled, filtered, integrated and analyzed together, so adding the Z accelerometer only
+        #takes one more entry, e.g. ("Z","AIN1",sensitivity,offset).
+        self.channels=[("X","AIN0",0.001156,-290.337933013119),
+                       ("Y","AIN3",0.001055,-366.66280307069917)]
 
         self.samplingFrequency=8000 #The frequency, in Hz, that sensor data is being read at.
         self.timeWindow=0.3 #Length of the period of time that will be analyzed for chatter.
@@ -61,25 +67,57 @@ class ChatterDetector:
         self.start=-999 #Time at which a batch of readings begins.
         self.end=-999 #Time at which a batch of readings ends.
         self.recording=False #Variable that determines if vibration measurements will be taken.
+        self.maxGap=0.005 #Longest run of skipped scans, in seconds, that is interpolated over instead of skipping the window.
+        self.analysisRate=None #Rate, in Hz, each window is decimated to before integration, e.g. 2000. None analyzes every reading.
+        self.spectrumWindow=1024 #Readings per spectrogram frame, long enough to resolve the spindle harmonics.
+        self.precision=np.float64 #Type of the acceleration buffers, windows and saved readings. np.float32 halves their memory, see PrecisionReport.py.
 
         self.handle=None
         self.aScanListNames=[]
         self.numAddresses=0
         self.scanRate=0
+        self.scansPerRead=0
         self.totSkip=0
         self.totScans=0
+        self.restartTimeout=2.0 #Seconds a failed stream is retried for before the cut is ended.
+        self.restartInterval=0.05 #Seconds between stream restart attempts.
+        self.streamRestarts=0
 
         self.interface=None
         self.MachineOffsetX=431.85 #Offset of the machine coordinate along X from the part zero. Unit is in millimetres.
         self.MachineOffsetZ=-492.277 #Offset of the machine coordinate along Z from the part zero. Unit is in millimetres.
         self.MaterialLengthX=4.12*25.4 #Length of the workpiece in millimetres.
         self.inclineAngle=7 #This measure is in degrees.
+        self.feedRate=20*25.4 #Programmed feed of the test cuts in millimetres per minute.
+        self.toolpathFile=None #Part program or JSON toolpath config the depth of cut is looked up in. None models the ramp above.
+        self.toolpath=None
 
         self.lobeRPM=[]
         self.lobeDepth=[]
+        self.cutTransitions=[] #(time, depth one window earlier, depth, chattering) of every change inside the workpiece in the last cut. Depths in inches.
+        self.cutRPM=None #Spindle speed measured at the start of the last cut, or None if it was not recorded.
+
+        self.liveView=True #Shows the cut in a non-blocking live dashboard instead of a plot at the end of the cut.
+        self.dashboard=None
+        self.publishResults=True #Publishes indicators, threshold events and loads over UDP for other systems on the shop floor.
+        self.busHost="127.0.0.1" #Address the publisher listens on. Subscribers are not authenticated, so only set "0.0.0.0" on a trusted shop floor network.
+        self.busPort=5005 #Port subscribers send their subscriptions to.
+        self.publisher=None
+        self.machineName="HurcoVMX42SRTi" #Recorded with every cut and lobe point in the session store.
+        self.sessionDatabase="ChatterSessions.sqlite" #Session store that keeps every cut, indicator and lobe point.
+        self.store=None
+        self.chatterThreshold=0.9 #Chatter indicator value above which the cut is considered to be chattering.
+        self.toolName="T25" #Predicted lobes are cached per machine and tool.
+        self.frfFile=None #Tap test of the tool as frequency (Hz), real and imaginary (m/N) columns. Overlays predicted lobes when set.
+        self.toolTeeth=4
+        self.cuttingCoefficient=2.0e9 #Specific cutting force of the workpiece material in N/m^2.
+        self.radialImmersion=1.0 #Radial depth of cut over the tool diameter.
+        self.lobeCache=None
+        self.realTimeProfile=None #RealTimeProfile applied to the acquisition loop during every cut, e.g. RealTimeProfile(cores={3}). None leaves scheduling to the OS.
+        self.jitter=None #JitterMonitor of the last cut.
 
     def butter_highpass(self,N, Wn): #Helper function to apply Butterworth filter to data.
-        return butter(N,Wn,'high',output="sos")
+        return signal.butter(N,Wn,'high',output="sos")
 
     def butter_highpass_filter(self,data, N,Wn): #Function to apply Butterworth filter to data.
         sos = self.butter_highpass(N,Wn)
@@ -90,6 +128,7 @@ class ChatterDetector:
         self.interface=Base.RestfulInterface()
 
     def ConnectDAQ(self):
+        self.start=-999 #Only set again once the stream has started.
         # Open first found LabJack
         self.handle = ljm.openS("ANY", "ANY", "ANY")  # Any device, Any connection, Any identifier
         #handle = ljm.openS("T7", "ANY", "ANY")  # T7 device, Any connection, Any identifier
@@ -101,51 +140,8 @@ class ChatterDetector:
             "Serial number: %i, IP address: %s, Port: %i,\nMax bytes per MB: %i" %
             (info[0], info[1], info[2], ljm.numberToIP(info[3]), info[4], info[5]))
 
-        deviceType = info[0]
-
-        # Stream Configuration
-        self.aScanListNames = ["AIN0","AIN3"]  # Scan list names to stream
-        self.numAddresses = len(self.aScanListNames)
-        aScanList = ljm.namesToAddresses(self.numAddresses, self.aScanListNames)[0]
-        self.scanRate = self.samplingFrequency #Ideally, the sampling frequency would be this value in Hz.
-        scansPerRead = int(self.scanRate / 2)
-
         try:
-            # When streaming, negative channels and ranges can be configured for
-            # individual analog inputs, but the stream has only one settling time and
-            # resolution.
-
-            if deviceType == ljm.constants.dtT4:
-                # LabJack T4 configuration
-
-                # AIN0 and AIN1 ranges are +/-10 V, stream settling is 0 (default) and
-                # stream resolution index is 0 (default).
-                aNames = ["AIN0_RANGE", "AIN1_RANGE", "STREAM_SETTLING_US",
-                        "STREAM_RESOLUTION_INDEX"]
-                aValues = [10.0, 10.0, 0, 0]
-            else:
-                # LabJack T7 and other devices configuration
-
-                # Ensure triggered stream is disabled.
-                ljm.eWriteName(self.handle, "STREAM_TRIGGER_INDEX", 0)
-
-                # Enabling internally-clocked stream.
-                ljm.eWriteName(self.handle, "STREAM_CLOCK_SOURCE", 0)
-
-                # All negative channels are single-ended, AIN0 and AIN1 ranges are
-                # +/-10 V, stream settling is 0 (default) and stream resolution index
-                # is 0 (default).
-                aNames = ["AIN_ALL_NEGATIVE_CH", "AIN0_RANGE", "AIN3_RANGE",
-                        "STREAM_SETTLING_US", "STREAM_RESOLUTION_INDEX"]
-                aValues = [ljm.constants.GND, 10.0, 10.0, 0, 0]
-            # Write the analog inputs' negative channels (when applicable), ranges,
-            # stream settling time and stream resolution configuration.
-            numFrames = len(aNames)
-            ljm.eWriteNames(self.handle, numFrames, aNames, aValues)
-
-            # Configure and start stream
-            self.scanRate = ljm.eStreamStart(self.handle, scansPerRead, self.numAddresses, aScanList, self.scanRate)
-            print("\nStream started with a scan rate of %0.0f Hz." % self.scanRate)
+            self.StartStream(info[0])
 
             print("\nPerforming stream reads.")
             self.start = datetime.now()
@@ -157,48 +153,193 @@ class ChatterDetector:
             e = sys.exc_info()[1]
             print(e)
 
+    def StartStream(self, deviceType):
+        #Configures the analog inputs and starts streaming them. Errors are raised to the caller, which is either
+        #ConnectDAQ or RestartStream.
+        # Stream Configuration
+        self.aScanListNames = [address for _,address,_,_ in self.channels]  # Scan list names to stream
+        self.numAddresses = len(self.aScanListNames)
+        aScanList = ljm.namesToAddresses(self.numAddresses, self.aScanListNames)[0]
+        self.scanRate = self.samplingFrequency #Ideally, the sampling frequency would be this value in Hz.
+        self.scansPerRead = int(self.scanRate / 2)
+
+        # When streaming, negative channels and ranges can be configured for
+        # individual analog inputs, but the stream has only one settling time and
+        # resolution.
+
+        if deviceType == ljm.constants.dtT4:
+            # LabJack T4 configuration
+
+            # Every streamed input's range is +/-10 V, stream settling is 0 (default) and
+            # stream resolution index is 0 (default).
+            aNames = [address+"_RANGE" for address in self.aScanListNames] + ["STREAM_SETTLING_US",
+                    "STREAM_RESOLUTION_INDEX"]
+            aValues = [10.0]*self.numAddresses + [0, 0]
+        else:
+            # LabJack T7 and other devices configuration
+
+            # Ensure triggered stream is disabled.
+            ljm.eWriteName(self.handle, "STREAM_TRIGGER_INDEX", 0)
+
+            # Enabling internally-clocked stream.
+            ljm.eWriteName(self.handle, "STREAM_CLOCK_SOURCE", 0)
+
+            # All negative channels are single-ended, every streamed input's range is
+            # +/-10 V, stream settling is 0 (default) and stream resolution index
+            # is 0 (default).
+            aNames = ["AIN_ALL_NEGATIVE_CH"] + [address+"_RANGE" for address in self.aScanListNames] + [
+                    "STREAM_SETTLING_US", "STREAM_RESOLUTION_INDEX"]
+            aValues = [ljm.constants.GND] + [10.0]*self.numAddresses + [0, 0]
+        # Write the analog inputs' negative channels (when applicable), ranges,
+        # stream settling time and stream resolution configuration.
+        numFrames = len(aNames)
+        ljm.eWriteNames(self.handle, numFrames, aNames, aValues)
+
+        # Configure and start stream
+        self.scanRate = ljm.eStreamStart(self.handle, self.scansPerRead, self.numAddresses, aScanList, self.scanRate)
+        print("\nStream started with a scan rate of %0.0f Hz." % self.scanRate)
+
+    def RestartStream(self):
+        #Stops the failed stream and starts it again, first on the open handle and then by reopening the LabJack,
+        #retrying until restartTimeout seconds have passed. Returns when the new stream started, or None if it
+        #could not be restarted in time.
+        deadline=time.monotonic()+self.restartTimeout
+        reopen=False
+        while True:
+            try:
+                if self.handle is not None:
+                    try:
+                        ljm.eStreamStop(self.handle)
+                    except ljm.LJMError:
+                        pass #The stream has usually stopped by itself already.
+                if reopen and self.handle is not None:
+                    try:
+                        ljm.close(self.handle)
+                    except ljm.LJMError:
+                        pass
+                    self.handle=None #Not closed twice if the LabJack cannot be opened again.
+                if self.handle is None:
+                    self.handle=ljm.openS("ANY","ANY","ANY")
+                self.StartStream(ljm.getHandleInfo(self.handle)[0])
+                return datetime.now()
+            except Exception:
+                e = sys.exc_info()[1]
+                print("Stream restart failed:",e)
+            if time.monotonic()>=deadline:
+                return None
+            reopen=True
+            time.sleep(self.restartInterval)
+
     def RecordCut(self):
+        self.cutRPM=None
         while True:
             if self.Ready():
                 break
         while True:
             if self.interface.GetRapidPercentage()>0:
                 break
+        cycleStart=datetime.now() #Start of the part program, from which its schedule is timed.
+        #The helpers are started before the stream, so a failure to start them never leaves it running.
+        self.StartDashboard()
+        self.StartPublisher()
         self.ConnectDAQ()
-        times=[] #Stores the time at which sensor readings have been taken.
-        accelX=[] #Stores the acceleration readings on the X-axis.
-        accelY=[] #Stores the acceleration readings on the Y-axis.
+        if not isinstance(self.start,datetime):
+            print("The stream could not be started, the cut is not recorded.")
+            try:
+                ljm.close(self.handle)
+            except ljm.LJMError:
+                pass
+            self.recording=False
+            return
+        channelNames=[name for name,_,_,_ in self.channels]
+        sensitivity=np.array([[scale] for _,_,scale,_ in self.channels],dtype=self.precision)
+        offset=np.array([[shift] for _,_,_,shift in self.channels],dtype=self.precision)
+        accel=np.empty((len(self.channels),int(self.samplingFrequency*60)),dtype=self.precision) #Stores the acceleration readings, one row per channel. Doubled in size when full.
+        times=np.empty(accel.shape[1]) #Stores the time at which sensor readings have been taken. Always float64, as float32 cannot resolve a scan period after a few minutes.
+        readings=0 #Number of readings stored so far.
         loadT=[] #Stores the time at which load percentages are recorded.
         loadS=[] #Stores the percent load on the given axis.
         loadX=[] #Stores the percent load on the given axis.
         loadY=[] #Stores the percent load on the given axis.
         loadZ=[] #Stores the percent load on the given axis.
+        gapIndex=GapIndex() #Start and length of every run of skipped scans.
         tChatter=[] #Stores the time at which chatter indicators were calculated.
         yChatter=[] #Stores the chatter indicator values calculated.
         startWindow=0 #Beginning index of the 0.3 second period that will be analyzed for chatter.
         endWindow=0 #Ending index of the 0.3 second window that will be analyzed for chatter.
-        addCI=True #Variable that determines if a calculated chatter indicator will be used for stability lobe creation.
+        chattering=False #Whether the last indicator was above the threshold, so only crossings are published as events.
+        chatteringInBounds=False #Whether the cut was chattering inside the workpiece at the last window, for the lobe transitions.
+        self.cutTransitions=[]
         timeIndex=5 #Index at which chatter detection program will begin, so as to avoid skipped scans in data.
 
-        N,Wn=signal.buttord(0.05,0.0375,3,40) #Calculating the parameters for a Butterworth filter for processing the sensor data.
+        decimation=decimation_factor(self.samplingFrequency,self.analysisRate)
+        sos=highpass_sos(self.samplingFrequency/decimation,200,150) #Butterworth filter for processing the sensor data, designed for the analysis rate.
 
         spindleSpeed=self.interface.GetSpindleSpeed()
+        self.cutRPM=spindleSpeed
         revolutionTime=60/spindleSpeed #Calculates how long, in seconds, a revolution of the spindle takes.
+        toolpath=self.LoadToolpath()
+        if toolpath.programmed:
+            toolpath.AnchorStart((cycleStart-self.start).total_seconds())
+        else:
+            toolpath.Anchor(self.interface.GetMachinePositionX()-self.MachineOffsetX,(datetime.now()-self.start).total_seconds())
+        confirmed=False #Whether the anchor has been corrected with the position of the tool in the part.
+        if self.dashboard is not None:
+            self.dashboard.NewCut("Cut at "+str(int(spindleSpeed))+" RPM")
+        if self.publisher is not None:
+            self.publisher.PublishCut(0.0,spindleSpeed)
+        if self.store is None:
+            self.store=SessionStore(self.sessionDatabase)
+        cut=self.store.start_cut(self.machineName,spindleSpeed,self.samplingFrequency,self.timeWindow,self.timeResolution,self.chatterThreshold,channelNames)
+        stft=StreamingSTFT(self.samplingFrequency,self.spectrumWindow,self.spectrumWindow//4,channels=len(self.channels)) #Follows the vibration frequencies through the cut.
+        self.jitter=JitterMonitor(self.scansPerRead/self.scanRate)
+        if self.realTimeProfile is not None:
+            #Applied last, so the buffers above are locked and the helpers are already running.
+            self.realTimeProfile.BeginCut(helperThreads=[self.publisher.thread.native_id] if self.publisher is not None else [],
+                                          helperProcesses=[self.dashboard.process.pid] if self.dashboard is not None else [])
+            print(self.realTimeProfile.Describe())
 
         i = 1
+        lastRead=datetime.now() #When the last block was read, and how many scans were still buffered then.
+        backlog=0
         try:
             while self.recording:
                 self.CheckForStop()
-                ret = ljm.eStreamRead(self.handle)
+                try:
+                    ret = ljm.eStreamRead(self.handle)
+                    lastRead=datetime.now()
+                    backlog=ret[1]+ret[2]
+                    self.jitter.BlockRead(backlog)
+                except ljm.LJMError:
+                    #A stream error, e.g. a dropped USB or Ethernet connection or a full LJM buffer, only costs the
+                    #scans between the last read and the restarted stream. They are stitched in as skipped scans,
+                    #so the readings stay on one time base and the windows around them are skipped like any gap.
+                    ljme = sys.exc_info()[1]
+                    print(ljme)
+                    restarted=self.RestartStream()
+                    if restarted is None:
+                        print("The stream could not be restarted within %0.1f s, ending the cut." % self.restartTimeout)
+                        break
+                    self.streamRestarts+=1
+                    lost=backlog+int(round((restarted-lastRead).total_seconds()*self.samplingFrequency))
+                    print("Stream restarted, %i scans lost." % lost)
+                    lastRead=restarted
+                    backlog=0
+                    if lost<=0:
+                        self.jitter.BlockDone()
+                        continue
+                    ret=(np.full(lost*self.numAddresses,SKIPPED_SAMPLE),0,0)
 
                 aData = ret[0] #The variable aData will contain alternating readings from both channels since it scans in order.
                 scans = len(aData) / self.numAddresses
                 self.totScans += scans
 
-                # Count the skipped samples which are indicated by -9999 values. Missed
-                # samples occur after a device's stream buffer overflows and are
-                # reported after auto-recover mode ends.
-                curSkip = aData.count(-9999.0)
+                # Skipped samples are indicated by -9999 values. Missed samples occur after a
+                # device's stream buffer overflows and are reported after auto-recover mode ends.
+                # They are indexed as gaps and stored as NaN rather than scaled into large spikes.
+                block=np.asarray(aData,dtype=self.precision).reshape(-1,self.numAddresses).T #One row per channel, in scan list order.
+                blockGaps=GapIndex.find(block)
+                curSkip = int(np.count_nonzero(block==SKIPPED_SAMPLE))
                 self.totSkip += curSkip
 
                 print("\neStreamRead %i" % i)
@@ -208,71 +349,85 @@ class ChatterDetector:
                 print("  1st scan out of %i: %s" % (scans, ainStr))
                 print("  Scans Skipped = %0.0f, Scan Backlogs: Device = %i, LJM = "
                     "%i" % (curSkip/self.numAddresses, ret[1], ret[2]))
-                xBuf=aData[0::2] #Separating out the readings from AIN0, which will be along the X axis.
-                yBuf=aData[1::2] #Separating out the readings from AIN3, which will be along the Y axis.
-                tBuf=[]
-                intervalTime=0.5/len(xBuf)
-                for j in range(len(xBuf)):
-                    tBuf.append(intervalTime*j+0.5*(i-1))
-                    xBuf[j]=xBuf[j]/self.X_AXIS_SENSITIVITY-self.X_AXIS_OFFSET
-                    yBuf[j]=yBuf[j]/self.Y_AXIS_SENSITIVITY-self.Y_AXIS_OFFSET
-                accelX+=xBuf
-                accelY+=yBuf
-                times+=tBuf
+                gapIndex.extend(blockGaps,readings)
+                scaled=block/sensitivity-offset #Every channel is calibrated in one operation.
+                scaled[:,blockGaps.mask(block.shape[1])]=np.nan
+                stft.update(scaled)
+                tBuf=(readings+np.arange(block.shape[1]))/self.samplingFrequency
+                while readings+block.shape[1]>accel.shape[1]:
+                    accel=np.concatenate((accel,np.empty_like(accel)),axis=1)
+                    times=np.concatenate((times,np.empty_like(times)))
+                accel[:,readings:readings+block.shape[1]]=scaled
+                times[readings:readings+block.shape[1]]=tBuf
+                readings+=block.shape[1]
                 loadT.append(tBuf[-1])
                 loadS.append(self.interface.GetSpindleLoad())
                 loadX.append(self.interface.GetAxisXLoad())
                 loadY.append(self.interface.GetAxisYLoad())
                 loadZ.append(self.interface.GetAxisZLoad())
+                if self.dashboard is not None:
+                    self.dashboard.PushAcceleration(tBuf[0],self.samplingFrequency,scaled)
+                    self.dashboard.PushLoad(tBuf[-1],[loadS[-1],loadX[-1],loadY[-1],loadZ[-1]])
+                if self.publisher is not None:
+                    self.publisher.PublishLoad(tBuf[-1],[loadS[-1],loadX[-1],loadY[-1],loadZ[-1]])
                 i += 1
 
                 while True:
                     startWindow=timeIndex*self.samplingFrequency*self.timeResolution
                     endWindow=startWindow+self.timeWindow*self.samplingFrequency
-                    if endWindow>=len(times):
+                    if endWindow>=readings:
                         break
                     startWindow=int(startWindow)
                     endWindow=int(endWindow)
+                    windowGaps=gapIndex.crop(startWindow,endWindow)
+                    if len(windowGaps.longer_than(int(self.maxGap*self.samplingFrequency))):
+                        print("Skipping the window at %0.1f s because of skipped scans." % (timeIndex*self.timeResolution+self.timeWindow))
+                        timeIndex+=1
+                        continue
                     filtTime=times[startWindow:endWindow]
-
-                    filtaccelX=accelX[startWindow:endWindow]
-                    filtaccelX=signal.detrend(filtaccelX,type="linear")
-                    filtaccelX=self.butter_highpass_filter(filtaccelX,N,Wn)
-                    veloX=cumtrapz(filtaccelX,filtTime,initial=0.0)
-                    veloX=signal.detrend(veloX, type="linear")
-                    dispX=cumtrapz(veloX,filtTime,initial=0.0)
-
-                    filtaccelY=accelY[startWindow:endWindow]
-                    filtaccelY=signal.detrend(filtaccelY,type="linear")
-                    filtaccelY=self.butter_highpass_filter(filtaccelY,N,Wn)
-                    veloY=cumtrapz(filtaccelY,filtTime,initial=0.0)
-                    veloY=signal.detrend(veloY, type="linear")
-                    dispY=cumtrapz(veloY,filtTime,initial=0.0)
-
-                    prevTim=filtTime[0]
-                    bisX=[] #Stores X-value of bisection points.
-                    bisY=[] #Stores Y-value of bisection points.
-                    for tindex in range(len(filtTime)):
-                        if filtTime[tindex]>=(prevTim+revolutionTime): #Checks to see if enough time has passed for a full rotation,
-                            bisX.append(dispX[tindex])                 #meaning that the bisection point would ideally be in the same position again.
-                            bisY.append(dispY[tindex])
-                            prevTim=filtTime[tindex]
-
-                    #Taking the standard deviation of the bisection points and of the overall trajectory, then calculating the chatter indicator from them.
-                    sX=statistics.stdev(bisX)
-                    sY=statistics.stdev(bisY)
-                    tX=statistics.stdev(dispX)
-                    tY=statistics.stdev(dispY)
-                    chatterIndicator=sX*sY/(tX*tY)
+                    window=accel[:,startWindow:endWindow].copy()
+                    windowGaps.interpolate(window) #Short gaps are bridged so the filter never sees a missing reading.
+
+                    #All channels are decimated to the analysis rate, filtered and integrated at once. A bisection point is
+                    #taken every time enough time has passed for a full rotation, meaning that the bisection point would
+                    #ideally be in the same position again. The chatter indicator compares the spread of the bisection
+                    #points with the spread of the overall trajectory.
+                    chatterIndicator=classic_window_indicator(window,filtTime,sos,revolutionTime,decimation)
                     tChatter.append(timeIndex*self.timeResolution+self.timeWindow)
                     yChatter.append(chatterIndicator)
-                    if chatterIndicator>0.9 and self.InBounds():
+                    if self.dashboard is not None:
+                        self.dashboard.PushIndicator(tChatter[-1],chatterIndicator)
+                    self.store.add_indicator(cut,tChatter[-1],chatterIndicator)
+                    if self.publisher is not None:
+                        self.publisher.PublishIndicator(tChatter[-1],chatterIndicator)
+                    if (chatterIndicator>self.chatterThreshold)!=chattering:
+                        chattering=not chattering
+                        self.store.add_event(cut,tChatter[-1],chatterIndicator,self.chatterThreshold,chattering)
+                        if self.publisher is not None:
+                            self.publisher.PublishEvent(tChatter[-1],chatterIndicator,self.chatterThreshold,chattering)
+                    if not confirmed and toolpath.InBoundsAtTime(tChatter[-1]):
+                        #Re-anchored once with the position at the first window the model places in the part, which
+                        #corrects for rapids, plunges, dwells, acceleration and feed override before it.
+                        position=self.interface.GetMachinePositionX()-self.MachineOffsetX
+                        toolpath.Anchor(position,(datetime.now()-self.start).total_seconds())
+                        confirmed=toolpath.InBoundsAt(position)
+                    inBounds=self.InBounds(tChatter[-1])
+                    if chatterIndicator>self.chatterThreshold and inBounds:
                         print("Hit Stop Cycle")
-                        if addCI and self.InBounds():
+                        if stft.last_power is not None:
+                            print("Strongest vibration away from the spindle harmonics: %0.0f Hz" % chatter_features(stft.last_power[None],stft.freqs,spindleSpeed)["frequency"][0])
+                    #Every change between stable and chattering inside the workpiece is kept for the cut planner, and
+                    #every onset of chatter becomes a stability lobe point, not just the first one of the cut.
+                    if inBounds and (chatterIndicator>self.chatterThreshold)!=chatteringInBounds:
+                        chatteringInBounds=not chatteringInBounds
+                        depth=self.GetDepthOfCut(type="incline",t=tChatter[-1])
+                        self.cutTransitions.append((tChatter[-1],self.GetDepthOfCut(type="incline",t=tChatter[-1]-self.timeResolution),depth,chatteringInBounds))
+                        if chatteringInBounds:
                             self.lobeRPM.append(self.interface.GetSpindleSpeed())
-                            self.lobeDepth.append(self.GetDepthOfCut(type="incline"))
-                            addCI=False
+                            self.lobeDepth.append(depth)
+                            self.store.add_lobe_point(cut,self.machineName,self.lobeRPM[-1],self.lobeDepth[-1])
                     timeIndex+=1
+                self.jitter.BlockDone()
 
             self.end = datetime.now()
 
@@ -283,6 +438,8 @@ class ChatterDetector:
             print("Timed Scan Rate = %f scans/second" % (self.totScans / tt)) #The actual sampling frequency.
             print("Timed Sample Rate = %f samples/second" % (self.totScans * self.numAddresses / tt))
             print("Skipped scans = %0.0f" % (self.totSkip / self.numAddresses))
+            print("Stream restarts = %i" % self.streamRestarts)
+            self.jitter.Print()
 
         except ljm.LJMError:
             ljme = sys.exc_info()[1]
@@ -290,42 +447,81 @@ class ChatterDetector:
         except Exception:
             e = sys.exc_info()[1]
             print(e)
-
-        try:
-            print("\nStop Stream")
-            ljm.eStreamStop(self.handle)
-        except ljm.LJMError:
-            ljme = sys.exc_info()[1]
-            print(ljme)
-        except Exception:
-            e = sys.exc_info()[1]
-            print(e)
-
-        ljm.close(self.handle)
+        finally:
+            if self.realTimeProfile is not None:
+                self.realTimeProfile.EndCut() #Even if the cut is interrupted, and before the export and plots, which must not run at real-time priority.
+
+        #The handle is None when the stream could not be restarted, and a failure to close it must not cost the recording.
+        if self.handle is not None:
+            try:
+                print("\nStop Stream")
+                ljm.eStreamStop(self.handle)
+            except ljm.LJMError:
+                ljme = sys.exc_info()[1]
+                print(ljme)
+            except Exception:
+                e = sys.exc_info()[1]
+                print(e)
+            try:
+                ljm.close(self.handle)
+            except Exception:
+                e = sys.exc_info()[1]
+                print(e)
+            self.handle=None
 
         #Removing first second of bad data and aligning the acceleration readings to start and end at 0.
-        times=times[int(self.scanRate):]
-        accelX=accelX[int(self.scanRate):]
-        accelY=accelY[int(self.scanRate):]
-        accelX=signal.detrend(accelX,type="linear")
-        accelY=signal.detrend(accelY,type="linear")
+        #Gaps are bridged for the detrend and then put back as NaN, so the file shows where scans were lost.
+        gapIndex=gapIndex.crop(int(self.scanRate),readings)
+        times=times[int(self.scanRate):readings]
+        accel=accel[:,int(self.scanRate):readings]
+        gapIndex.interpolate(accel)
+        accel=signal.detrend(accel,type="linear",axis=-1)
+        accel[:,gapIndex.mask(accel.shape[1])]=np.nan
         timestamp=datetime.now()
-        filename="PCB_"+str(timestamp.month)+"_"+str(timestamp.day)+"_"+str(timestamp.hour)+"_"+str(timestamp.minute)+"_"+str(int(spindleSpeed))+".csv"
+        filename=unique_filename("PCB_"+str(timestamp.month)+"_"+str(timestamp.day)+"_"+str(timestamp.hour)+"_"+str(timestamp.minute)+"_"+str(int(spindleSpeed))+".csv")
         loader=0
         with open(filename, 'w',newline="") as csvfile:
             csvwriter = csv.writer(csvfile)
-            for reading in range(len(accelX)):
+            for reading in range(accel.shape[1]):
                 if reading==0:
-                    csvwriter.writerow(["Time (s)","Accel X (m/s^2)","Accel Y (m/s^2)","Load S (%)","Load X (%)","Load Y (%)","Load Z (%)"])
+                    csvwriter.writerow(["Time (s)"]+["Accel "+name+" (m/s^2)" for name in channelNames]+["Load S (%)","Load X (%)","Load Y (%)","Load Z (%)"])
                 if times[reading]>loadT[loader] and loader<len(loadT):
                     loader+=1
-                csvwriter.writerow([times[reading],accelX[reading],accelY[reading],loadS[loader],loadX[loader],loadY[loader],loadZ[loader]])
-
-        #Plotting the raw voltage readings that will end up being calculated for acceleration data.
-        plt.figure(1)
-        plt.plot(tChatter,yChatter)
-        plt.plot(tChatter,yChatter,"ro")
-        plt.show()
+                values=accel[:,reading].tolist() if accel.dtype==np.float64 else ["%.8g" % value for value in accel[:,reading]] #Only the digits float32 holds.
+                csvwriter.writerow([times[reading]]+values+[loadS[loader],loadX[loader],loadY[loader],loadZ[loader]])
+        gapIndex.save(gap_filename(filename),len(times),self.samplingFrequency,times) #Gap statistics are kept next to the recording.
+        stft.save(filename[:-4]+"_Spectrogram.npz",max_columns=2000)
+        self.store.finish_cut(cut,len(times),int(gapIndex.lengths.sum()),filename)
+
+        if self.dashboard is None:
+            #Plotting the chatter indicators calculated during the cut. This blocks until the window is closed.
+            plt.figure(1)
+            plt.plot(tChatter,yChatter)
+            plt.plot(tChatter,yChatter,"ro")
+            plt.show()
+
+    def StartDashboard(self):
+        #The dashboard stays open between cuts, so it is only started once or after the operator closed it.
+        if not self.liveView:
+            self.dashboard=None
+            return
+        if self.dashboard is None or not self.dashboard.IsAlive():
+            self.dashboard=LiveDashboard(channelNames=[name for name,_,_,_ in self.channels])
+            self.dashboard.Start()
+
+    def StartPublisher(self):
+        #Like the dashboard, the publisher is kept between cuts so subscribers stay registered.
+        if not self.publishResults:
+            self.publisher=None
+            return
+        if self.publisher is None or not self.publisher.IsAlive():
+            self.publisher=ResultPublisher(host=self.busHost,port=self.busPort)
+            try:
+                self.publisher.Start()
+            except OSError as error: #E.g. the port is in use. The cut is recorded without publishing.
+                print("Results are not published:",error)
+                self.publisher.Stop()
+                self.publisher=None
 
     def PromptSpindleSpeedIncrease(self):
         print("Increase Spindle Speed by 5 percent.")
@@ -333,7 +529,22 @@ class ChatterDetector:
     def PromptSpindleSpeedDecrease(self):
         print("Decrease Spindle Speed by 5 percent.")
 
-    def GetDepthOfCut(self,type="flat"):
+    def LoadToolpath(self):
+        #Built once, from the part program or config in toolpathFile or else from the ramp settings.
+        if self.toolpath is None:
+            if self.toolpathFile is None:
+                self.toolpath=ToolpathModel.FromRamp(self.MaterialLengthX,self.inclineAngle,self.feedRate)
+            elif self.toolpathFile.endswith(".json"):
+                self.toolpath=ToolpathModel.FromConfig(self.toolpathFile)
+            else:
+                self.toolpath=ToolpathModel.FromPartProgram(self.toolpathFile)
+        return self.toolpath
+
+    def GetDepthOfCut(self,type="flat",t=None):
+        #Given the time t since the stream started, the depth is looked up in the toolpath model instead of
+        #asking the controller for the position.
+        if type=="incline" and t is not None and self.toolpath is not None and self.toolpath.IsAnchored():
+            return self.toolpath.DepthAtTime(t)/25.4 #Result will be in inches.
         if type=="incline":
             toolPositionX=self.interface.GetMachinePositionX()
             depthOfCut=tan(self.inclineAngle*pi/180.0)*(toolPositionX-self.MachineOffsetX)
@@ -347,26 +558,50 @@ class ChatterDetector:
         return 1/(2*x1*abs(np.minimum(np.real(-(x2+c2*1j)/(n**2*1j/(x3+c3*1j)+(x4+c4*1j)*1j*n/(x3+c3*1j)+1)),np.array([0 for kk in range(len(n))]))))
         #Above is the equation from the 2021 Brecher paper. Note how some of the constants are actually complex, so extra unknowns are added.
 
-    def CreateStabilityLobe(self):
+    def CreateStabilityLobe(self,since=None):
+        #Fits the lobe to the points found in this session or, given a Unix time, to every point stored for this
+        #machine since then.
+        if self.store is None:
+            self.store=SessionStore(self.sessionDatabase)
+        if since is None:
+            lobeRPM,lobeDepth=np.array(self.lobeRPM),np.array(self.lobeDepth)
+            first=last=time.time()
+        else:
+            lobeRPM,lobeDepth,recorded=self.store.lobe_points(self.machineName,since=since)
+            first,last=(recorded[0],recorded[-1]) if len(recorded) else (since,since)
         timestamp=datetime.now()
-        filename="Stability_Lobe_Points_For_"+str(timestamp.month)+"_"+str(timestamp.day)+"_"+str(timestamp.hour)+"_"+str(timestamp.minute)+".csv"
+        filename=unique_filename("Stability_Lobe_Points_For_"+str(timestamp.month)+"_"+str(timestamp.day)+"_"+str(timestamp.hour)+"_"+str(timestamp.minute)+".csv")
         with open(filename, 'w',newline="") as csvfile:
             csvwriter = csv.writer(csvfile)
-            for reading in range(len(self.lobeRPM)):
-                csvwriter.writerow([self.lobeRPM[reading],self.lobeDepth[reading]])
+            for reading in range(len(lobeRPM)):
+                csvwriter.writerow([lobeRPM[reading],lobeDepth[reading]])
 
-        popt,pcov=curve_fit(self.long_function,np.array(self.lobeRPM),np.array(self.lobeDepth),maxfev=900000) #Fitting a curve, with a high maxfev value to give enough time for calculation.
+        popt,pcov=optimize.curve_fit(self.long_function,lobeRPM,lobeDepth,maxfev=900000) #Fitting a curve, with a high maxfev value to give enough time for calculation.
+        self.store.add_lobe_fit(self.machineName,popt,len(lobeRPM),first,last)
         yFit=self.long_function(np.array([k for k in range(1000,15000)]),*popt) #Getting the Y values of points on the fitted curve.
         plt.plot(np.array([k for k in range(1000,15000)]),yFit) #Plotting the curve fitted to the data.
-        plt.plot(self.lobeRPM,self.lobeDepth,"k.")
+        plt.plot(lobeRPM,lobeDepth,"k.")
+        if self.frfFile is not None:
+            rpmGrid,predictedDepth=self.PredictStabilityLobe(np.arange(1000,15000))
+            plt.plot(rpmGrid,predictedDepth,"r--",label="Predicted from tap test")
+            plt.legend()
         plt.show()
 
         timestamp=datetime.now()
-        filename="Stability_Lobe_Constants_For_"+str(timestamp.month)+"_"+str(timestamp.day)+"_"+str(timestamp.hour)+"_"+str(timestamp.minute)+".csv"
+        filename=unique_filename("Stability_Lobe_Constants_For_"+str(timestamp.month)+"_"+str(timestamp.day)+"_"+str(timestamp.hour)+"_"+str(timestamp.minute)+".csv")
         with open(filename, 'w',newline="") as csvfile:
             csvwriter = csv.writer(csvfile)
             csvwriter.writerow(list(popt))
     
+    def PredictStabilityLobe(self,rpmGrid):
+        #Critical depth of cut in inches over rpmGrid, from the tap test of the current tool.
+        if self.lobeCache is None:
+            self.lobeCache=LobeCache()
+        freqs,frf=load_frf(self.frfFile)
+        depth=self.lobeCache.load(self.machineName,self.toolName,freqs,frf,self.toolTeeth,self.cuttingCoefficient,rpmGrid,
+                                  mean_teeth_in_cut(self.toolTeeth,self.radialImmersion))
+        return rpmGrid,depth*1000/25.4
+
     def Ready(self):
         if self.interface.GetRapidPercentage()==0 and self.recording==False:
             self.recording=True
@@ -378,7 +613,9 @@ class ChatterDetector:
         if self.interface.IsStopped():
             self.recording=False
 
-    def InBounds(self):
+    def InBounds(self,t=None):
+        if t is not None and self.toolpath is not None and self.toolpath.IsAnchored():
+            return self.toolpath.InBoundsAtTime(t)
         toolPositionX=self.interface.GetMachinePositionX()
         if (self.MachineOffsetX+10)<=toolPositionX<=(self.MachineOffsetX+self.MaterialLengthX-10):
             return True
@@ -386,5 +623,10 @@ class ChatterDetector:
             return False
 
     def MachineShutdown(self):
+        #The dashboard is not a daemon process, so the program could not exit while its window is open.
+        if self.dashboard is not None:
+            self.dashboard.Stop()
+        if self.publisher is not None:
+            self.publisher.Stop()
         # Close connection with machine.
         self.interface.Shutdown()
\ No newline at end of file
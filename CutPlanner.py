@@ -0,0 +1,143 @@
+"""
+Plans the ramp cuts used to measure a stability lobe, so a confident lobe takes far fewer cuts than
+stepping through spindle speeds by hand.
+Every ramp cut brackets the critical depth at its spindle speed: the onset of chatter lies between the
+depth one indicator window before the first stable-to-chatter transition and the depth at it, and a cut
+without chatter shows the depth is stable up to the end of its ramp. The planner keeps the tightest
+bracket for every speed of its grid and proposes the next cut where the lobe is least certain:
+  - a measured speed is as uncertain as its bracket is wide,
+  - a speed between two measured ones close enough together may be anywhere within both their brackets,
+    so the range is bisected (ends first, then the middle, ...) and halves where the lobe is flat are not
+    cut any further,
+  - once the lobe model can be fitted with points to spare, a speed is never more uncertain than the
+    spread of the fitted lobe over parameter sets drawn from the fit's covariance, widened by the fit's
+    standard error.
+The ramp of the next cut spans the bracket with some room on both sides, so each cut at a speed narrows
+its bracket to about one indicator window of depth. Depths are in the units of the transitions given to
+AddCut, inches for ChatterDetector.
+"""
+
+import inspect
+import numpy as np
+from ToolpathModel import ToolpathModel
+
+
+class CutPlanner:
+    def __init__(self, minRPM, maxRPM, maxDepth, rpmStep=50, model=None, minSpan=0.01, samples=200, maxGap=4):
+        #model(rpm, *constants) is the lobe model fitted to the brackets, e.g. ChatterDetector.long_function.
+        #minSpan is the shortest depth range a planned ramp covers, and no two neighbouring measured speeds are
+        #left more than maxGap grid steps apart.
+        self.speeds=np.arange(minRPM,maxRPM+rpmStep/2,rpmStep,dtype=np.float64)
+        self.maxDepth=maxDepth
+        self.model=model
+        self.minSpan=minSpan
+        self.samples=samples
+        self.maxGap=maxGap
+        self.low=np.zeros(len(self.speeds)) #Deepest depth known to be stable at every speed.
+        self.high=np.full(len(self.speeds),np.inf) #Shallowest depth known to chatter at every speed.
+        self.measured=np.zeros(len(self.speeds),dtype=bool)
+        self.cuts=[] #(rpm, ramp start depth, ramp end depth, transitions) of every cut added.
+        self.constants=None
+        self.covariance=None
+        self.residual=None #Standard error of the fit, which is added to the spread of its prediction.
+
+    def _index(self, rpm):
+        return int(np.argmin(np.abs(self.speeds-rpm)))
+
+    def AddCut(self, rpm, startDepth, endDepth, transitions):
+        #transitions are (time, depth one window earlier, depth, chattering) as ChatterDetector.cutTransitions
+        #records them; startDepth and endDepth are the depths at the ends of the part of the ramp in bounds.
+        self.cuts.append((rpm,startDepth,endDepth,list(transitions)))
+        k=self._index(rpm)
+        self.measured[k]=True
+        onsets=[transition for transition in transitions if transition[3]]
+        if onsets:
+            _,before,depth,_=onsets[0]
+            self.high[k]=min(self.high[k],depth)
+            if before>=startDepth: #Chatter right at the start of the ramp says nothing about the depths below it.
+                self.low[k]=max(self.low[k],min(before,depth))
+        else:
+            self.low[k]=max(self.low[k],endDepth)
+        self._fit()
+
+    def _fit(self):
+        self.constants=self.covariance=self.residual=None
+        known=np.isfinite(self.high)
+        parameters=len(inspect.signature(self.model).parameters)-1 if self.model is not None else 0
+        if self.model is None or np.count_nonzero(known)<parameters+2: #A fit without spare points says nothing about its error.
+            return
+        from scipy import optimize #Imported here as only the fit needs SciPy.
+        import warnings
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                constants,covariance=optimize.curve_fit(self.model,self.speeds[known],0.5*(self.low[known]+self.high[known]),maxfev=900000)
+        except (RuntimeError,ValueError):
+            return
+        if np.all(np.isfinite(covariance)):
+            self.constants,self.covariance=constants,covariance
+            with np.errstate(all="ignore"):
+                residuals=self.model(self.speeds[known],*constants)-0.5*(self.low[known]+self.high[known])
+            self.residual=float(np.sqrt(np.sum(residuals**2)/(len(residuals)-parameters)))
+
+    def Uncertainty(self):
+        #Width of the range the critical depth may still be in at every speed of the grid.
+        width=np.where(np.isfinite(self.high),self.high,self.maxDepth)-self.low
+        if not self.measured.any():
+            return np.full(len(self.speeds),2.0*self.maxDepth)
+        #Between two measured speeds closer than maxGap grid steps, the depth is taken to be within the range of
+        #both brackets, so flat stretches of the lobe are not cut at every speed. Elsewhere speeds are more
+        #uncertain than any bracket, the more so the further they are from the measured ones.
+        measured=np.flatnonzero(self.measured)
+        right=np.searchsorted(measured,np.arange(len(self.speeds)))
+        left=np.clip(right-1,0,len(measured)-1)
+        right=np.clip(right,0,len(measured)-1)
+        top=np.maximum(self.low[measured]+width[measured],0)
+        spanned=np.maximum(top[left],top[right])-np.minimum(self.low[measured][left],self.low[measured][right])
+        distance=np.minimum(np.abs(np.arange(len(self.speeds))-measured[left]),np.abs(np.arange(len(self.speeds))-measured[right]))
+        inside=(measured[left]<np.arange(len(self.speeds)))&(np.arange(len(self.speeds))<measured[right])&(measured[right]-measured[left]<=self.maxGap)
+        uncertainty=np.where(inside,spanned,self.maxDepth*(1+distance/len(self.speeds)))
+        if self.constants is not None:
+            _,spread=self.Prediction()
+            uncertainty=np.minimum(uncertainty,4*spread) #Two standard deviations either side of the fitted lobe.
+        return np.where(self.measured,width,uncertainty)
+
+    def Prediction(self):
+        #Fitted critical depth at every speed and its spread over parameter sets drawn from the fit's covariance,
+        #combined with the fit's standard error.
+        rng=np.random.default_rng(0)
+        draws=rng.multivariate_normal(self.constants,self.covariance,size=self.samples,check_valid="ignore")
+        with np.errstate(all="ignore"):
+            curves=np.array([self.model(self.speeds,*draw) for draw in draws])
+            curves[~np.isfinite(curves)]=np.nan
+            return self.model(self.speeds,*self.constants),np.hypot(np.nanstd(curves,axis=0),self.residual)
+
+    def NextCut(self):
+        #(rpm, start depth, end depth) of the most informative cut to run next.
+        k=int(np.argmax(self.Uncertainty()))
+        low,high=self.low[k],self.high[k]
+        if np.isfinite(high):
+            room=0.25*(high-low)
+        else:
+            if self.constants is not None:
+                centre,spread=[value[k] for value in self.Prediction()]
+            else:
+                centre,spread=np.nan,np.nan
+            if np.isfinite(centre) and np.isfinite(spread) and centre>low:
+                high=centre+2*spread
+            else:
+                high=self.maxDepth
+            room=0.0
+        start=max(0.0,low-room)
+        end=min(self.maxDepth,max(high+room,start+self.minSpan))
+        return float(self.speeds[k]),float(start),float(end)
+
+    def Confident(self, tolerance):
+        #True once the critical depth is known to within tolerance at every speed of the grid.
+        return bool(np.all(self.Uncertainty()<=tolerance))
+
+    def RampToolpath(self, startDepth, endDepth, lengthX, feedRate, margin=10.0, scale=25.4):
+        #ToolpathModel of a straight ramp whose in-bounds part runs from startDepth to endDepth, given in the
+        #planner's units and converted to millimetres by scale. The tool enters the part at X=0.
+        slope=(endDepth-startDepth)/(lengthX-2*margin)
+        return ToolpathModel([0.0,lengthX],[scale*(startDepth-slope*margin),scale*(endDepth+slope*margin)],feedRate,margin,bounds=(0.0,lengthX))
@@ -0,0 +1,111 @@
+"""
+Validation report for decimating the readings before integration.
+Every recording is analyzed at its full rate and at each analysis rate in RATES, and the indicators are
+compared window by window:
+  - "classic" is ChatterDetector's live path, where every window is decimated, filtered (200/150 Hz) and
+    integrated on its own, and the time is what one window costs.
+  - "modified" is ChatterAnalysis on the whole recording with analysis_rate, and the time is the whole
+    preprocessing and indicator run. Its bisection points are the nearest decimated readings. It uses the
+    detector's 200/150 Hz filter too: the default 50/49 Hz design is so ill-conditioned that its indicator
+    changes more between runs on rounded inputs than with any analysis rate (see PrecisionReport.py).
+Agreement is the share of windows on the same side of the chatter threshold (0.9 for classic, 0.1 for
+modified), alongside the correlation and the median and largest absolute difference from the full rate
+indicator.
+
+Decimation only pays off where the acceleration above the new Nyquist frequency contributes little to the
+displacement, so check the report on recordings like the ones it will be used for before lowering the rate.
+For 0.3 s windows the per-window time is mostly fixed overhead, so the live path gains little.
+Rates that would not decimate a recording at all (factor 1) are skipped, so only recordings sampled well
+above the rates compare anything; the default is the 8 kHz recording taken with ChatterDetector.
+
+Usage: python DecimationReport.py [directory or recording ...]
+The rows are written to DecimationReport.csv and the mean over the recordings is printed.
+"""
+
+import sys
+import time
+import numpy as np
+from ChatterCore import LazyModule, ChatterAnalysis, highpass_sos, decimation_factor, classic_window_indicator, load_recording, window_starts
+from ParameterSweep import find_recordings, spindle_speed_from_name
+
+pd=LazyModule("pandas")
+
+RATES=[4000,2000,1000] #Analysis rates in Hz compared against the full rate.
+TIME_WINDOW=0.3
+STEP_SIZE=0.1
+THRESHOLDS={"classic":0.9,"modified":0.1}
+F_PASS,F_STOP=200,150 #Highpass of both indicators, as in ChatterDetector.
+DEFAULT_RECORDINGS=["VibrationData/HurcoVMX42SRTi/CutsAlongX/PCB_6000RPM_AirCut.csv"]
+
+
+def classic_series(times, accel, f_sample, spindle_speed, analysis_rate):
+    #Indicator and mean time per window of ChatterDetector's per-window processing.
+    decimation=decimation_factor(f_sample,analysis_rate)
+    sos=highpass_sos(f_sample/decimation,F_PASS,F_STOP)
+    w_length=int(f_sample*TIME_WINDOW)
+    starts=window_starts(len(times),w_length,int(f_sample*STEP_SIZE))
+    values=np.empty(len(starts))
+    began=time.perf_counter()
+    for k,start in enumerate(starts):
+        values[k]=classic_window_indicator(accel[:,start:start+w_length],times[start:start+w_length],sos,60/spindle_speed,decimation)
+    return values,(time.perf_counter()-began)/max(len(starts),1)
+
+
+def modified_series(filepath, spindle_speed, analysis_rate):
+    began=time.perf_counter()
+    helper=ChatterAnalysis(filepath,spindle_speed,f_pass=F_PASS,f_stop=F_STOP,analysis_rate=analysis_rate)
+    chatsT,chatsI=helper.calculate_chatter_indicator(TIME_WINDOW,STEP_SIZE)
+    return chatsI,time.perf_counter()-began
+
+
+def compare(reference, values, threshold):
+    #Windows may differ by one at the end of the recording, as the window lengths are rounded per rate.
+    n=min(len(reference),len(values))
+    reference=reference[:n]
+    values=values[:n]
+    both=~np.isnan(reference)&~np.isnan(values)
+    difference=np.abs(values[both]-reference[both])
+    return {"Windows":n,
+            "Correlation":float(np.corrcoef(reference[both],values[both])[0,1]) if np.count_nonzero(both)>1 else np.nan,
+            "Median Difference":float(np.median(difference)) if len(difference) else np.nan,
+            "Max Difference":float(difference.max()) if len(difference) else np.nan,
+            "Agreement":float(np.mean((reference[both]>threshold)==(values[both]>threshold))) if both.any() else np.nan}
+
+
+def validate(recordings, rates=RATES):
+    rows=[]
+    for filepath in recordings:
+        spindle_speed=spindle_speed_from_name(filepath)
+        if spindle_speed is None:
+            print("Skipping",filepath,"as its spindle speed is unknown.")
+            continue
+        times,accel=load_recording(filepath)
+        f_sample=int(len(times)/(times[-1]-times[0]))
+        decimating=[rate for rate in rates if decimation_factor(f_sample,rate)>1]
+        if not decimating:
+            print("Skipping",filepath,"as none of the rates decimates its",f_sample,"Hz readings.")
+            continue
+        for indicator in ("classic","modified"):
+            if indicator=="classic":
+                reference,referenceTime=classic_series(times,accel,f_sample,spindle_speed,None)
+            else:
+                reference,referenceTime=modified_series(filepath,spindle_speed,None)
+            for rate in decimating:
+                if indicator=="classic":
+                    values,elapsed=classic_series(times,accel,f_sample,spindle_speed,rate)
+                else:
+                    values,elapsed=modified_series(filepath,spindle_speed,rate)
+                row={"File":filepath,"Indicator":indicator,"Sampling Rate":f_sample,"Analysis Rate":f_sample/decimation_factor(f_sample,rate)}
+                row.update(compare(reference,values,THRESHOLDS[indicator]))
+                row.update({"Full Rate Time (s)":referenceTime,"Time (s)":elapsed,"Speedup":referenceTime/elapsed})
+                rows.append(row)
+    return pd.DataFrame(rows)
+
+
+if __name__=="__main__":
+    report=validate(find_recordings(sys.argv[1:] or DEFAULT_RECORDINGS))
+    if report.empty:
+        sys.exit("No recording was decimated by any of the rates "+", ".join(map(str,RATES))+" Hz.")
+    report.to_csv("DecimationReport.csv",index=False)
+    columns=["Correlation","Median Difference","Max Difference","Agreement","Speedup"]
+    print(report.groupby(["Indicator","Analysis Rate"])[columns].mean().to_string())
@@ -1,9 +1,8 @@
 import csv
-from scipy.integrate import cumtrapz
+import numpy as np
 from scipy import signal
 import matplotlib.pyplot as plt
-from scipy.signal import butter
-import statistics
+from ChatterCore import integrate_displacement, bisection_mask, classic_chatter_indicator
 
 f_sample=1600 #Sampling frequency of sensor in Hz.
 f_pass=200 #Pass frequency in Hz.
@@ -14,42 +13,27 @@ g_pass=3 #Pass loss in dB.
 g_stop=40 #Stop attenuation in dB.
 
 SPINDLE_RPM=3000
+CHANNELS=[1,2] #Columns of the acceleration channels that are analyzed together. Use [1,2,3] to include Z.
 
 N,Wn=signal.buttord(wp,ws,g_pass,g_stop)
 
-def butter_highpass(N, Wn): #Helper function to apply Butterworth filter to data.
-    return butter(N,Wn,'high',output="sos")
+sos=signal.butter(N,Wn,'high',output="sos")
 
-def butter_highpass_filter(data, N,Wn): #Function to apply Butterworth filter to data.
-    sos = butter_highpass(N,Wn)
-    y = signal.sosfilt(sos, data)
-    return y
-
-accelX=[]
 timeXF=[] #Stores the time at which sensor readings have been taken.
-accelY=[]
-timeYF=[] #Stores the time at which sensor readings have been taken.
+accel=[] #Stores the readings of every channel, one row per reading.
 
 filename="VibrationData/HurcoVMX42SRTi/CutsAlongX/UnalignedData/EBI_F18IN_T75_D0p25IN_3000RPM_5A_ON_TABLE.csv"
 with open(filename,mode="r") as file:
     csvFile = csv.reader(file)
     for lines in csvFile:
         try: #Skip the lines of data at the beginning that do not contain sensor readings.
-            timeXF.append(float(lines[0]))
-            accelX.append(float(lines[1]))
+            row=[float(lines[column]) for column in [0]+CHANNELS]
         except:
-            pass
-with open(filename,mode="r") as file:
-    csvFile = csv.reader(file)
-    for lines in csvFile:
-        try: #Skip the lines of data at the beginning that do not contain sensor readings.
-            timeYF.append(float(lines[0]))
-            accelY.append(float(lines[2]))
-        except:
-            pass
-
-accelX=signal.detrend(accelX,type="constant")
-accelY=signal.detrend(accelY,type="constant")
+            continue
+        timeXF.append(row[0])
+        accel.append(row[1:])
+timeXF=np.array(timeXF)
+accel=signal.detrend(np.array(accel).T,type="constant",axis=-1) #One row per channel.
 
 windowTime=0.3 #A range of 0.3 seconds of data will be analyzed at a time.
 revolutionTime=60/SPINDLE_RPM #Time it takes for the spindle to rotate a full term. Used to approximate bisection point timings.
@@ -69,62 +53,22 @@ while True:
         break
 
     timeX=timeXF[startW:endW] #Creating a new array that will temporarily store the times for the readings in the analysis window.
-    timeY=timeYF[startW:endW] #Creating a new array that will temporarily store the times for the readings in the analysis window.
 
-    filtaccelX=accelX[startW:endW]
-    filtaccelX=signal.detrend(filtaccelX, type="linear")
-    filtaccelX=butter_highpass_filter(filtaccelX,N,Wn)
-
-    filtaccelY=accelY[startW:endW]
-    filtaccelY=signal.detrend(filtaccelY, type="linear")
-    filtaccelY=butter_highpass_filter(filtaccelY,N,Wn)
-
-    veloX=cumtrapz(filtaccelX,timeX,initial=0.0)
-    veloY=cumtrapz(filtaccelY,timeY,initial=0.0)
-    veloX=signal.detrend(veloX, type="linear")
-    veloY=signal.detrend(veloY, type="linear")
-    dispX=cumtrapz(veloX,timeX,initial=0.0)
-    dispY=cumtrapz(veloY,timeY,initial=0.0)
-
-    prevTim=timeX[0]
-    bisX=[] #Stores X-value of bisection points.
-    bisY=[] #Stores Y-value of bisection points.
-    for tindex in range(len(timeX)):
-        if timeX[tindex]>=(prevTim+revolutionTime): #Checks to see if enough time has passed for a full rotation,
-            bisX.append(dispX[tindex])              #meaning that the bisection point would ideally be in the same position again.
-            bisY.append(dispY[tindex])
-            prevTim=timeX[tindex]
+    #Every channel is detrended, filtered and integrated twice in one batch. A bisection point is taken every time
+    #enough time has passed for a full rotation, meaning that the bisection point would ideally be in the same
+    #position again.
+    velo,disp=integrate_displacement(accel[:,startW:endW],timeX,sos,detrend_displacement=False)
+    mask=bisection_mask(timeX,revolutionTime)
     if windex==(poincare*10-windowTime/packageResolution):
-        """
-        plt.figure(1)
-        plt.clf()
-        plt.plot(timeX,filtaccelX,label="accelerationX")
-        plt.plot(timeY,filtaccelY,label="accelerationY")
-        plt.legend(facecolor = 'gray', title = 'Legend',loc = 'upper left')
-        plt.figure(2)
-        plt.clf()
-        plt.plot(timeX,veloX,label="velocityX")
-        plt.plot(timeY,veloY,label="velocityY")
-        plt.legend(facecolor = 'gray', title = 'Legend',loc = 'upper left')
-        plt.figure(3)
-        plt.clf()
-        plt.plot(timeX,dispX,label="displacementX")
-        plt.plot(timeY,dispY,label="displacementY")
-        plt.legend(facecolor = 'gray', title = 'Legend',loc = 'upper left')
-        """
         #Plots the overall trajectory in blue and the bisection points as red dots.
         plt.figure(4)
         plt.clf()
-        plt.plot(dispX,dispY)
-        plt.plot(bisX,bisY,"ro")
+        plt.plot(disp[0],disp[1])
+        plt.plot(disp[0,mask],disp[1,mask],"ro")
         plt.show()
 
-    #Taking the standard deviation of the bisection points and of the overall trajectory, then calculating the chatter indicator from them.
-    sX=statistics.stdev(bisX)
-    sY=statistics.stdev(bisY)
-    tX=statistics.stdev(dispX)
-    tY=statistics.stdev(dispY)
-    chatterIndicator=sX*sY/(tX*tY)
+    #The chatter indicator compares the spread of the bisection points with the spread of the overall trajectory.
+    chatterIndicator=classic_chatter_indicator(disp,mask)
     chatsT.append(windex*packageResolution+windowTime)
     chatsI.append(chatterIndicator)
 
@@ -138,6 +82,6 @@ plt.plot(chatsT,chatsI)
 plt.plot(chatsT,chatsI,"ro")
 plt.figure(2)
 plt.clf()
-plt.plot(timeXF,accelX)
-plt.plot(timeYF,accelY)
+for channel in accel:
+    plt.plot(timeXF,channel)
 plt.show()
\ No newline at end of file
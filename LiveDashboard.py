@@ -0,0 +1,258 @@
+"""
+Live view of a cut while it is being recorded.
+The window is drawn by a separate process that is fed through a bounded queue, so the acquisition
+loop in ChatterDetector only ever does a non-blocking put. When the queue is full the update is
+dropped instead of waiting for the plot. The plotting process redraws at most maxFPS times a second
+using blitting, and keeps a decimated history so that long sessions stay bounded in memory.
+"""
+
+import multiprocessing as mp
+import queue
+import time
+import numpy as np
+
+
+class DecimatedHistory:
+    #Stores (time, low, high) triples in a fixed amount of memory. Once the buffer is full, neighbouring
+    #points are merged pairwise (keeping the envelope) and the number of samples per stored point doubles.
+    def __init__(self, capacity=4000, fields=1):
+        self.capacity=capacity-capacity%2
+        self.fields=fields
+        self.t=np.empty(self.capacity)
+        self.lo=np.empty((self.capacity,fields))
+        self.hi=np.empty((self.capacity,fields))
+        self.count=0
+        self.stride=1 #Number of incoming points merged into one stored point.
+        self.pendingT=0.0
+        self.pendingLo=np.full(fields,np.inf)
+        self.pendingHi=np.full(fields,-np.inf)
+        self.pendingN=0
+
+    def append(self,t,lo,hi=None):
+        lo=np.asarray(lo,dtype=float).reshape(self.fields)
+        hi=lo if hi is None else np.asarray(hi,dtype=float).reshape(self.fields)
+        if self.pendingN==0:
+            self.pendingT=t
+        np.minimum(self.pendingLo,lo,out=self.pendingLo)
+        np.maximum(self.pendingHi,hi,out=self.pendingHi)
+        self.pendingN+=1
+        if self.pendingN>=self.stride:
+            self._commit()
+
+    def _commit(self):
+        self.t[self.count]=self.pendingT
+        self.lo[self.count]=self.pendingLo
+        self.hi[self.count]=self.pendingHi
+        self.count+=1
+        self.pendingLo.fill(np.inf)
+        self.pendingHi.fill(-np.inf)
+        self.pendingN=0
+        if self.count==self.capacity:
+            self._compress()
+
+    def _compress(self):
+        half=self.count//2
+        self.t[:half]=self.t[0:self.count:2]
+        self.lo[:half]=np.minimum(self.lo[0:self.count:2],self.lo[1:self.count:2])
+        self.hi[:half]=np.maximum(self.hi[0:self.count:2],self.hi[1:self.count:2])
+        self.count=half
+        self.stride*=2
+
+    def arrays(self):
+        #Returns the stored history, including the partially filled bucket at the end.
+        if self.pendingN==0:
+            return self.t[:self.count],self.lo[:self.count],self.hi[:self.count]
+        return (np.append(self.t[:self.count],self.pendingT),
+                np.vstack([self.lo[:self.count],self.pendingLo]),
+                np.vstack([self.hi[:self.count],self.pendingHi]))
+
+    def clear(self):
+        self.count=0
+        self.stride=1
+        self.pendingLo.fill(np.inf)
+        self.pendingHi.fill(-np.inf)
+        self.pendingN=0
+
+
+def _run_dashboard(updates,channelNames,maxFPS,historyCapacity,threshold):
+    #Runs in the dashboard process; matplotlib is only ever imported here.
+    import matplotlib.pyplot as plt
+
+    loadNames=["S","X","Y","Z"]
+    accelHistory=DecimatedHistory(historyCapacity,len(channelNames))
+    indicatorHistory=DecimatedHistory(historyCapacity,1)
+    loadHistory=DecimatedHistory(historyCapacity,len(loadNames))
+
+    fig,(axAccel,axCI,axLoad)=plt.subplots(3,sharex=True)
+    axAccel.set_ylabel("Acceleration (m/s^2)")
+    axCI.set_ylabel("Chatter Indicator")
+    axLoad.set_ylabel("Load (%)")
+    axLoad.set_xlabel("Time (s)")
+    accelLines=[]
+    for name in channelNames:
+        lowLine,=axAccel.plot([],[],animated=True,label=name)
+        highLine,=axAccel.plot([],[],animated=True,color=lowLine.get_color())
+        accelLines.append((lowLine,highLine))
+    axAccel.legend(loc="upper left")
+    ciLine,=axCI.plot([],[],"r.-",animated=True)
+    axCI.axhline(threshold,color="k",linestyle="--")
+    loadLines=[axLoad.plot([],[],animated=True,label=name)[0] for name in loadNames]
+    axLoad.legend(loc="upper left")
+    artists=[line for pair in accelLines for line in pair]+[ciLine]+loadLines
+    limits={axAccel:[0.0,1.0,-1.0,1.0],axCI:[0.0,1.0,0.0,1.5],axLoad:[0.0,1.0,0.0,100.0]}
+
+    plt.show(block=False)
+    fig.canvas.draw()
+    background=fig.canvas.copy_from_bbox(fig.bbox)
+    framePeriod=1.0/maxFPS
+    lastDraw=0.0
+    dirty=False
+
+    def fits(axis,t,lo,hi):
+        #Grows the axis limits with some headroom when data leaves the current view.
+        if len(t)==0:
+            return True
+        lim=limits[axis]
+        ok=True
+        if t[-1]>lim[1]:
+            lim[1]=t[0]+1.5*(t[-1]-t[0])+1.0
+            ok=False
+        yMin=np.nanmin(lo)
+        yMax=np.nanmax(hi)
+        if yMin<lim[2] or yMax>lim[3]:
+            span=max(yMax-yMin,1e-9)
+            lim[2]=min(lim[2],yMin-0.1*span)
+            lim[3]=max(lim[3],yMax+0.1*span)
+            ok=False
+        return ok
+
+    while plt.fignum_exists(fig.number):
+        try:
+            message=updates.get(timeout=framePeriod)
+        except queue.Empty:
+            message=None
+        while message is not None:
+            kind=message[0]
+            if kind=="stop":
+                plt.close(fig)
+                return
+            elif kind=="cut":
+                fig.suptitle(message[1])
+                accelHistory.clear()
+                indicatorHistory.clear()
+                loadHistory.clear()
+                for lim in limits.values():
+                    lim[0]=0.0
+                    lim[1]=1.0
+                fig.canvas.draw()
+                background=fig.canvas.copy_from_bbox(fig.bbox)
+            elif kind=="accel":
+                for t,lo,hi in zip(message[1],message[2],message[3]):
+                    accelHistory.append(t,lo,hi)
+            elif kind=="ci":
+                indicatorHistory.append(message[1],message[2])
+            elif kind=="load":
+                loadHistory.append(message[1],message[2])
+            dirty=True
+            try:
+                message=updates.get_nowait()
+            except queue.Empty:
+                message=None
+
+        now=time.monotonic()
+        if not dirty or now-lastDraw<framePeriod:
+            fig.canvas.flush_events()
+            continue
+        lastDraw=now
+        dirty=False
+
+        tA,loA,hiA=accelHistory.arrays()
+        for c,(lowLine,highLine) in enumerate(accelLines):
+            lowLine.set_data(tA,loA[:,c])
+            highLine.set_data(tA,hiA[:,c])
+        tC,vC,_=indicatorHistory.arrays()
+        ciLine.set_data(tC,vC[:,0])
+        tL,vL,_=loadHistory.arrays()
+        for c,line in enumerate(loadLines):
+            line.set_data(tL,vL[:,c])
+
+        rescale=not fits(axAccel,tA,loA,hiA)
+        rescale=(not fits(axCI,tC,vC,vC)) or rescale
+        rescale=(not fits(axLoad,tL,vL,vL)) or rescale
+        if rescale:
+            xMax=max(lim[1] for lim in limits.values())
+            for axis,lim in limits.items():
+                lim[1]=xMax
+                axis.set_xlim(lim[0],lim[1])
+                axis.set_ylim(lim[2],lim[3])
+            fig.canvas.draw()
+            background=fig.canvas.copy_from_bbox(fig.bbox)
+        fig.canvas.restore_region(background)
+        for artist in artists:
+            artist.axes.draw_artist(artist)
+        fig.canvas.blit(fig.bbox)
+        fig.canvas.flush_events()
+
+
+class LiveDashboard:
+    def __init__(self, channelNames=("X","Y"), maxFPS=10, historyCapacity=4000, queueSize=256, threshold=0.9, envelopeResolution=0.05):
+        self.channelNames=list(channelNames)
+        self.maxFPS=maxFPS #Upper bound on how often the window is redrawn.
+        self.historyCapacity=historyCapacity #Number of points kept per trace before the history is decimated.
+        self.queueSize=queueSize
+        self.threshold=threshold
+        self.envelopeResolution=envelopeResolution #Length, in seconds, of the blocks summarised by one min/max pair.
+        self.dropped=0 #Number of updates discarded because the dashboard fell behind.
+        self.updates=None
+        self.process=None
+
+    def Start(self):
+        context=mp.get_context("spawn") #A fresh interpreter, so no LabJack handle or socket is inherited.
+        self.updates=context.Queue(self.queueSize)
+        self.process=context.Process(target=_run_dashboard,
+                                     args=(self.updates,self.channelNames,self.maxFPS,self.historyCapacity,self.threshold),
+                                     name="LiveDashboard")
+        self.process.start()
+
+    def IsAlive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def Send(self, message):
+        #Never blocks the caller. Updates are thrown away when the dashboard is closed or behind.
+        if not self.IsAlive():
+            return False
+        try:
+            self.updates.put_nowait(message)
+            return True
+        except queue.Full:
+            self.dropped+=1
+            return False
+
+    def NewCut(self, title):
+        self.Send(("cut",title))
+
+    def PushAcceleration(self, startTime, samplingFrequency, channels):
+        #Reduces a block of readings to a min/max envelope before it crosses the process boundary.
+        data=np.asarray(channels,dtype=float)
+        step=max(1,int(self.envelopeResolution*samplingFrequency))
+        blocks=data.shape[1]//step
+        if blocks==0:
+            return
+        data=data[:,:blocks*step].reshape(data.shape[0],blocks,step)
+        times=startTime+np.arange(blocks)*step/samplingFrequency
+        self.Send(("accel",times,np.fmin.reduce(data,axis=2).T,np.fmax.reduce(data,axis=2).T)) #Missing readings (NaN) are ignored.
+
+    def PushIndicator(self, t, value):
+        self.Send(("ci",t,value))
+
+    def PushLoad(self, t, loads):
+        self.Send(("load",t,list(loads)))
+
+    def Stop(self):
+        if self.IsAlive():
+            try:
+                self.updates.put(("stop",),timeout=1.0)
+            except queue.Full:
+                self.process.terminate()
+            self.process.join(timeout=5.0)
+        self.process=None
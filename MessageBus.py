@@ -0,0 +1,231 @@
+"""
+Publishes detection results over UDP so other systems on the shop floor can react while a cut is running.
+Indicator values, chatter threshold events, spindle and axis loads and cut starts are queued by the
+acquisition loop and sent by a background thread in small batches. Each record is a type byte, a value
+count, a float64 time and float32 values, and each batch carries a sequence number and the publisher's
+running count of records dropped from its queue. A subscriber sees the batches it missed itself as a gap
+in the sequence numbers.
+
+Detection never waits for the bus. The queue between the acquisition loop and the sender thread is bounded
+and, once full, drops the oldest records ("drop-oldest") or the new ones ("drop-newest"); threshold events
+and cut starts always get in by pushing out the oldest record. The socket is non-blocking, so a subscriber
+that cannot be sent a batch at once misses it, which the publisher counts in sendFailures. Subscribers
+register by sending a datagram to the publisher's port and are forgotten when they have not renewed within
+subscriberTimeout seconds.
+
+Run "python MessageBus.py [host] [port]" to subscribe and print everything published, e.g. on localhost
+next to ChatterDetector.
+"""
+
+import collections
+import select
+import socket
+import struct
+import threading
+import time
+
+MAGIC=b"CHB1"
+BATCH_HEADER=struct.Struct("<4sIQ") #Magic, sequence number, records dropped by the publisher so far.
+RECORD_HEADER=struct.Struct("<BBd") #Record type, number of values, time.
+SUBSCRIBE=b"SUB"
+UNSUBSCRIBE=b"UNSUB"
+
+RECORD_TYPES={1:"indicator",2:"event",3:"load",4:"cut"}
+RECORD_CODES={name:code for code,name in RECORD_TYPES.items()}
+PRIORITY=("event","cut") #Records that are never the ones dropped when the queue is full.
+
+
+def encode_batch(sequence, dropped, records):
+    #records are (kind, time, values) triples.
+    parts=[BATCH_HEADER.pack(MAGIC,sequence,dropped)]
+    for kind,t,values in records:
+        parts.append(RECORD_HEADER.pack(RECORD_CODES[kind],len(values),t))
+        parts.append(struct.pack("<%df" % len(values),*values))
+    return b"".join(parts)
+
+
+def decode_batch(data):
+    #Returns (sequence, dropped, records) from a datagram made by encode_batch.
+    magic,sequence,dropped=BATCH_HEADER.unpack_from(data)
+    if magic!=MAGIC:
+        raise ValueError("Not a result batch")
+    records=[]
+    offset=BATCH_HEADER.size
+    while offset<len(data):
+        code,count,t=RECORD_HEADER.unpack_from(data,offset)
+        offset+=RECORD_HEADER.size
+        values=struct.unpack_from("<%df" % count,data,offset)
+        offset+=4*count
+        records.append((RECORD_TYPES[code],t,values))
+    return sequence,dropped,records
+
+
+class ResultPublisher:
+    def __init__(self, host="127.0.0.1", port=5005, queueSize=1024, policy="drop-oldest", maxBatch=64, flushInterval=0.05, subscriberTimeout=10.0):
+        if policy not in ("drop-oldest","drop-newest"):
+            raise ValueError("Unknown drop policy "+policy)
+        self.host=host
+        self.port=port
+        self.queueSize=queueSize
+        self.policy=policy
+        self.maxBatch=maxBatch #Records per datagram, which keeps datagrams well under the UDP size limit.
+        self.flushInterval=flushInterval #Longest time, in seconds, a record waits to be sent.
+        self.subscriberTimeout=subscriberTimeout
+        self.dropped=0 #Records discarded because the queue was full.
+        self.sent=0 #Records sent to at least one subscriber.
+        self.sendFailures=0 #Records a subscriber could not be sent, counted once for every such subscriber.
+        self.subscribers={} #Address of every subscriber and the time it last renewed.
+        self.records=collections.deque()
+        self.lock=threading.Lock()
+        self.wake=threading.Event()
+        self.sock=None
+        self.thread=None
+        self.running=False
+
+    def Start(self):
+        self.sock=socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
+        self.sock.bind((self.host,self.port))
+        self.sock.setblocking(False)
+        self.running=True
+        self.thread=threading.Thread(target=self._run,name="ResultPublisher",daemon=True)
+        self.thread.start()
+
+    def IsAlive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def Publish(self, kind, t, values):
+        #Never blocks the caller beyond a short lock.
+        with self.lock:
+            if len(self.records)>=self.queueSize:
+                if self.policy=="drop-newest" and kind not in PRIORITY:
+                    self.dropped+=1
+                    return False
+                self.records.popleft()
+                self.dropped+=1
+            self.records.append((kind,float(t),[float(value) for value in values]))
+            urgent=kind in PRIORITY or len(self.records)>=self.maxBatch
+        if urgent:
+            self.wake.set()
+        return True
+
+    def PublishIndicator(self, t, value):
+        self.Publish("indicator",t,[value])
+
+    def PublishEvent(self, t, value, threshold, chattering):
+        #Sent when the indicator crosses the threshold, in either direction.
+        self.Publish("event",t,[value,threshold,1.0 if chattering else 0.0])
+
+    def PublishLoad(self, t, loads):
+        self.Publish("load",t,loads)
+
+    def PublishCut(self, t, spindleSpeed):
+        self.Publish("cut",t,[spindleSpeed])
+
+    def _run(self):
+        sequence=0
+        while self.running or self.records:
+            self.wake.wait(self.flushInterval)
+            self.wake.clear()
+            self._serve_subscriptions()
+            while True:
+                with self.lock:
+                    batch=[self.records.popleft() for _ in range(min(self.maxBatch,len(self.records)))]
+                    dropped=self.dropped
+                if not batch:
+                    break
+                data=encode_batch(sequence,dropped,batch)
+                sequence+=1
+                delivered=False
+                for address in list(self.subscribers):
+                    try:
+                        self.sock.sendto(data,address)
+                        delivered=True
+                    except OSError: #A busy socket or an unreachable subscriber must not end the sender thread.
+                        self.sendFailures+=len(batch)
+                if delivered:
+                    self.sent+=len(batch)
+            if not self.running:
+                break
+
+    def _serve_subscriptions(self):
+        now=time.monotonic()
+        while True:
+            try:
+                message,address=self.sock.recvfrom(64)
+            except (BlockingIOError,ConnectionResetError):
+                break
+            if message==SUBSCRIBE:
+                self.subscribers[address]=now
+            elif message==UNSUBSCRIBE:
+                self.subscribers.pop(address,None)
+        for address,renewed in list(self.subscribers.items()):
+            if now-renewed>self.subscriberTimeout:
+                del self.subscribers[address]
+
+    def Stop(self):
+        #Sends what is still queued, then closes the socket.
+        if self.IsAlive():
+            self.running=False
+            self.wake.set()
+            self.thread.join(timeout=5.0)
+        if self.sock is not None:
+            self.sock.close()
+        self.thread=None
+        self.sock=None
+
+
+class ResultSubscriber:
+    #Client for a ResultPublisher. Subscriptions are renewed automatically while Receive is being called.
+    def __init__(self, host="127.0.0.1", port=5005, renewInterval=2.0):
+        self.address=(host,port)
+        self.renewInterval=renewInterval
+        self.sock=socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
+        self.sock.bind(("",0))
+        self.lastRenewal=None
+        self.lastSequence=None
+        self.lost=0 #Batches that never arrived, from gaps in the sequence numbers.
+        self.publisherDropped=0
+
+    def Subscribe(self):
+        self.sock.sendto(SUBSCRIBE,self.address)
+        self.lastRenewal=time.monotonic()
+
+    def Receive(self, timeout=1.0):
+        #Returns the records of every batch that arrives within timeout seconds, oldest first.
+        if self.lastRenewal is None or time.monotonic()-self.lastRenewal>=self.renewInterval:
+            self.Subscribe()
+        records=[]
+        deadline=time.monotonic()+timeout
+        while True:
+            remaining=max(0.0,deadline-time.monotonic())
+            if not select.select([self.sock],[],[],remaining if not records else 0.0)[0]:
+                break
+            try:
+                data,_=self.sock.recvfrom(65536)
+                sequence,dropped,batch=decode_batch(data)
+            except (ValueError,struct.error,ConnectionResetError):
+                continue
+            if self.lastSequence is not None and sequence>self.lastSequence+1:
+                self.lost+=sequence-self.lastSequence-1
+            self.lastSequence=sequence
+            self.publisherDropped=dropped
+            records+=batch
+        return records
+
+    def Close(self):
+        try:
+            self.sock.sendto(UNSUBSCRIBE,self.address)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+if __name__=="__main__":
+    import sys
+    subscriber=ResultSubscriber(sys.argv[1] if len(sys.argv)>1 else "127.0.0.1",int(sys.argv[2]) if len(sys.argv)>2 else 5005)
+    try:
+        while True:
+            for kind,t,values in subscriber.Receive():
+                print("%-9s %8.3f s  %s" % (kind,t,", ".join("%g" % value for value in values)))
+    except KeyboardInterrupt:
+        subscriber.Close()
@@ -0,0 +1,172 @@
+"""
+Brings raw sensor exports into the layout the analysis expects, replacing the one-off Rearrange.py,
+removeTimeOffset.py and the rewrite at the end of Splitter.py.
+The transforms for each sensor are declared in SENSOR_TRANSFORMS and are applied to raw exports, which are
+the files without a header row; files that already have a header are left alone unless a time shift is
+asked for. Files are read and written in chunks, so their size does not matter, and the result is
+written to a temporary file that replaces the original only once it is complete.
+
+Every file gets a _Transforms.json record next to it listing the transforms applied to it. A transform
+that is already in the record is not applied again, so running the tool twice never scales or shifts a
+file twice. The record is updated in two steps around the rename, so an interrupted run is recognized
+from the file's contents the next time.
+
+Usage: python NormalizeCorpus.py [--shift-time=SECONDS] [--dry-run] [--force] [directory or recording ...]
+--shift-time adds SECONDS to every time, as Splitter.py does after aligning an EBI recording with a PCB one.
+--force applies transforms even if the record says they were applied.
+"""
+
+import json
+import os
+import sys
+import time
+import numpy as np
+from ChatterCore import LazyModule, parse_recording_path
+
+pd=LazyModule("pandas")
+
+ACCEL_HEADER=["Time (s)","Accel X (m/s^2)","Accel Y (m/s^2)","Accel Z (m/s^2)"]
+
+#Steps applied, in order, to the raw exports of every sensor. Column numbers count from 0 and refer to the
+#columns as they are at that step.
+SENSOR_TRANSFORMS={
+    "EBI":[("reorder",[0,3,1,2]), #The EBI export stores Y, Z, X.
+           ("scale",[1,2,3],0.001), #Raw readings are a thousand times too large.
+           ("zero_time",),
+           ("header",ACCEL_HEADER)],
+    "SKF":[("zero_time",),
+           ("header",["Time (s)","Accel Y (m/s^2)","Accel Z (m/s^2)"])],
+}
+
+
+def record_filename(recording):
+    #The transform record of a recording is stored next to it, e.g. EBI_T25_0p25IN_6900RPM_Transforms.json.
+    return os.path.splitext(recording)[0]+"_Transforms.json"
+
+
+def has_header(path):
+    with open(path,mode="r") as file:
+        first=file.readline().split(",")[0]
+    try:
+        float(first)
+        return False
+    except ValueError:
+        return True
+
+
+def _digest(path):
+    import hashlib #Imported here as only the rename check needs it.
+    sha=hashlib.sha1()
+    with open(path,"rb") as file:
+        for block in iter(lambda: file.read(1<<20),b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _write_json(path, content):
+    partial=path+"."+str(os.getpid())+".tmp"
+    with open(partial,"w") as file:
+        json.dump(content,file,indent=1)
+    os.replace(partial,path)
+
+
+def load_record(recording):
+    #The transforms applied to a recording. A rewrite that was interrupted after the rename but before the
+    #record was completed is recognized by the file's size and hash.
+    path=record_filename(recording)
+    if not os.path.exists(path):
+        return {"applied":[]}
+    with open(path,mode="r") as file:
+        record=json.load(file)
+    pending=record.pop("pending",None)
+    if pending and os.path.getsize(recording)==pending["size"] and _digest(recording)==pending["sha1"]:
+        record["applied"]+=pending["transforms"]
+    return record
+
+
+def _apply(frame, steps, state):
+    for step in steps:
+        kind=step[0]
+        if kind=="reorder":
+            frame=frame.iloc[:,step[1]]
+        elif kind=="scale":
+            frame.iloc[:,step[1]]=frame.iloc[:,step[1]]*step[2]
+        elif kind=="zero_time":
+            if "firstTime" not in state:
+                state["firstTime"]=float(frame.iat[0,0])
+            frame.iloc[:,0]=frame.iloc[:,0]-state["firstTime"]
+        elif kind=="shift_time":
+            frame.iloc[:,0]=frame.iloc[:,0]+step[1]
+        elif kind=="header":
+            frame.columns=step[1]
+        else:
+            raise ValueError("Unknown transform "+kind)
+    return frame
+
+
+def normalize_file(recording, steps, force=False, dry_run=False, chunk_rows=1<<18):
+    #Applies the steps that are not in the recording's record yet and returns their names.
+    record=load_record(recording)
+    applied={entry["transform"] for entry in record["applied"]}
+    steps=[step for step in steps if force or step[0] not in applied]
+    if not steps or dry_run:
+        return [step[0] for step in steps]
+    header=has_header(recording)
+    partial=recording+"."+str(os.getpid())+".tmp"
+    state={}
+    writeHeader=header or any(step[0]=="header" for step in steps)
+    first=True
+    for frame in pd.read_csv(recording,header=0 if header else None,chunksize=chunk_rows,dtype=np.float64):
+        frame=_apply(frame,steps,state)
+        frame.to_csv(partial,mode="w" if first else "a",header=writeHeader and first,index=False)
+        first=False
+    done=[{"transform":step[0],"parameters":list(step[1:]),"time":time.strftime("%Y-%m-%d %H:%M:%S")} for step in steps]
+    _write_json(record_filename(recording),dict(record,pending={"transforms":done,"size":os.path.getsize(partial),"sha1":_digest(partial)}))
+    os.replace(partial,recording)
+    record["applied"]+=done
+    _write_json(record_filename(recording),record)
+    return [step[0] for step in steps]
+
+
+def transforms_for(recording, shift_time=None):
+    #The sensor's steps for a raw export, plus the time shift if one is given.
+    steps=[]
+    if not has_header(recording):
+        steps+=SENSOR_TRANSFORMS.get(parse_recording_path(recording)["sensor"] or os.path.basename(recording).split("_")[0],[])
+    if shift_time is not None:
+        steps.append(("shift_time",shift_time))
+    return steps
+
+
+def _normalize_job(job):
+    recording,shiftTime,force,dryRun=job
+    return recording,normalize_file(recording,transforms_for(recording,shiftTime),force,dryRun)
+
+
+def normalize_paths(paths, shift_time=None, force=False, dry_run=False, max_workers=None):
+    #Normalizes every CSV recording under the given directories and files in parallel. Returns
+    #{recording: names of the transforms applied}.
+    recordings=[]
+    for path in paths:
+        if os.path.isdir(path):
+            recordings+=sorted(os.path.join(directory,name) for directory,_,names in os.walk(path) for name in names
+                               if name.endswith(".csv") and not name.endswith("_Gaps.csv"))
+        else:
+            recordings.append(path)
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return dict(pool.map(_normalize_job,[(recording,shift_time,force,dry_run) for recording in recordings]))
+
+
+if __name__=="__main__":
+    options={argument.split("=")[0]:argument.partition("=")[2] for argument in sys.argv[1:] if argument.startswith("--")}
+    paths=[argument for argument in sys.argv[1:] if not argument.startswith("--")]
+    if not paths:
+        print(__doc__)
+        sys.exit(1)
+    results=normalize_paths(paths,float(options["--shift-time"]) if "--shift-time" in options else None,
+                            "--force" in options,"--dry-run" in options)
+    for recording,transforms in results.items():
+        if transforms:
+            print(("Would apply " if "--dry-run" in options else "Applied ")+", ".join(transforms)+" to "+recording)
+    print(sum(1 for transforms in results.values() if transforms),"of",len(results),"recordings changed.")
@@ -0,0 +1,177 @@
+"""
+Sweeps the chatter indicator parameters over a set of recordings and scores every combination.
+The grid covers the highpass filter (f_pass, f_stop pairs), the analysis window (time_window, step_size), the
+indicator ("modified" from Chatter.py or "classic" from ChatterDetector.py) and the chatter threshold.
+Filtering and integration only depend on the recording and the filter, so they run once per recording
+and filter pair and are kept in a PreprocessCache; every window setting and threshold reuses them. The
+recording and filter pairs are evaluated in parallel worker processes.
+
+Windows are labeled from VibrationData/ChatterIndicatorTests/Transitions.csv when a recording is listed
+there (one row per chatter interval: File, Start (s), End (s)). Otherwise the "CI Value" column written by
+CI_Generator.py is used, with readings above REFERENCE_CI counted as chatter. Recordings with neither are
+still analyzed but left unscored.
+
+Usage: python ParameterSweep.py [directory, recording or catalog filter ...]
+Catalog filters select recordings from ChatterCore.Catalog, e.g. material=4140%Steel rpm=3000-4000.
+The tidy results, one row per recording and parameter combination, are written to SweepResults.csv and
+the best combinations by mean F1 score are printed.
+"""
+
+import csv
+import itertools
+import os
+import re
+import sys
+import numpy as np
+from ChatterCore import LazyModule, ChatterAnalysis, PreprocessCache, RecordingCatalog, bisection_mask, classic_chatter_indicator, window_starts, load_column
+from ChatterCore.Catalog import parse_filters
+
+pd=LazyModule("pandas")
+
+TRANSITIONS="VibrationData/ChatterIndicatorTests/Transitions.csv"
+REFERENCE_CI=0.9 #Chatter limit used by ChatterDetector.py, applied to the CI Value column when there are no transitions.
+
+DEFAULT_GRID={"filter":[(50,49),(200,150)], #(f_pass, f_stop) pairs in Hz.
+              "time_window":[0.2,0.3,0.5],
+              "step_size":[0.1],
+              "indicator":["modified","classic"],
+              "threshold":{"modified":[0.05,0.1,0.2],"classic":[0.7,0.8,0.9,1.0]}}
+
+
+def spindle_speed_from_name(filepath):
+    #Spindle speed written in the file name, e.g. 4000 for EBI_F20IN_T50_D0p125IN_4000RPM.csv.
+    match=re.search(r"(\d+)RPM",os.path.basename(filepath))
+    return int(match.group(1)) if match else None
+
+
+def load_transitions(path=TRANSITIONS):
+    #Returns {file name: [(start, end), ...]} of labeled chatter intervals.
+    intervals={}
+    if not os.path.exists(path):
+        return intervals
+    with open(path,mode="r") as file:
+        for row in csv.DictReader(file):
+            intervals.setdefault(os.path.basename(row["File"]),[]).append((float(row["Start (s)"]),float(row["End (s)"])))
+    return intervals
+
+
+def chatter_labels(filepath, times, transitions):
+    #True where a reading is labeled as chatter, or None when the recording has no labels.
+    name=os.path.basename(filepath)
+    if name in transitions:
+        labels=np.zeros(len(times),dtype=bool)
+        for start,end in transitions[name]:
+            labels|=(times>=start)&(times<=end)
+        return labels
+    ci=load_column(filepath,"CI Value") #The first reading is dropped, as it is on load.
+    if ci is None:
+        return None
+    return ci>REFERENCE_CI
+
+
+def classic_indicator_series(helper, w_length, starts):
+    #ChatterDetector's indicator on windows of the whole-recording displacement, one bisection sequence per window.
+    disp=helper.disp
+    values=np.empty(len(starts))
+    for k,start in enumerate(starts):
+        mask=bisection_mask(helper.timeF[start:start+w_length],helper.revolution_time)
+        values[k]=classic_chatter_indicator(disp[:,start:start+w_length],mask) if np.count_nonzero(mask)>1 else np.nan
+    return values
+
+
+def score(predicted, actual, times):
+    #Confusion counts and summary scores of one indicator series; NaN windows count as not chattering.
+    tp=int(np.count_nonzero(predicted&actual))
+    fp=int(np.count_nonzero(predicted&~actual))
+    fn=int(np.count_nonzero(~predicted&actual))
+    tn=int(np.count_nonzero(~predicted&~actual))
+    precision=tp/(tp+fp) if tp+fp else np.nan
+    recall=tp/(tp+fn) if tp+fn else np.nan
+    f1=2*tp/(2*tp+fp+fn) if tp+fp+fn else np.nan
+    delay=np.nan #Time from the first labeled chatter window to the first detection at or after it.
+    if actual.any():
+        onset=times[np.argmax(actual)]
+        detected=times[predicted&(times>=onset)]
+        if len(detected):
+            delay=float(detected[0]-onset)
+    return {"TP":tp,"FP":fp,"FN":fn,"TN":tn,"Accuracy":(tp+tn)/len(actual) if len(actual) else np.nan,
+            "Precision":precision,"Recall":recall,"F1":f1,"Detection Delay (s)":delay}
+
+
+def _sweep_recording(job):
+    filepath,spindle_speed,column_order,f_pass,f_stop,grid,cacheDir,transitions,channels,dtype=job
+    helper=ChatterAnalysis(filepath,spindle_speed,column_order,f_pass,f_stop,cache=PreprocessCache(cacheDir,memory_entries=0),channels=channels,dtype=dtype)
+    labels=chatter_labels(filepath,helper.timeF,transitions)
+    rows=[]
+    for time_window,step_size,indicator in itertools.product(grid["time_window"],grid["step_size"],grid["indicator"]):
+        w_length=int(helper.f_sample*time_window)
+        if indicator=="modified":
+            chatsT,chatsI=helper.calculate_chatter_indicator(time_window,step_size)
+        else:
+            starts=window_starts(len(helper.timeF),w_length,int(helper.f_sample*step_size))
+            chatsT=helper.timeF[starts+int(0.5*w_length)]
+            chatsI=classic_indicator_series(helper,w_length,starts)
+        actual=labels[np.searchsorted(helper.timeF,chatsT)] if labels is not None else None
+        thresholds=grid["threshold"][indicator] if isinstance(grid["threshold"],dict) else grid["threshold"]
+        for threshold in thresholds:
+            row={"File":filepath,"Spindle Speed":spindle_speed,"f_pass":f_pass,"f_stop":f_stop,"time_window":time_window,
+                 "step_size":step_size,"indicator":indicator,"threshold":threshold,"Windows":len(chatsI)}
+            if actual is not None:
+                row.update(score(chatsI>threshold,actual,chatsT))
+            rows.append(row)
+    return rows
+
+
+def run_sweep(recordings, grid=DEFAULT_GRID, max_workers=None, cache_dir="ChatterCache", column_order="TXYZ", channels="XY", dtype=np.float64):
+    #recordings are file paths, (file path, spindle speed) pairs when the speed is not in the file name, or
+    #(file path, spindle speed, column order) as RecordingCatalog.recordings returns them. dtype np.float32
+    #halves the cached signals; see PrecisionReport.py for which filters it is accurate with.
+    transitions=load_transitions()
+    jobs=[]
+    for recording in recordings:
+        if isinstance(recording,str):
+            recording=(recording,spindle_speed_from_name(recording))
+        filepath,spindle_speed=recording[0],recording[1]
+        order=recording[2] if len(recording)>2 else column_order
+        if spindle_speed is None:
+            print("Skipping",filepath,"as its spindle speed is unknown.")
+            continue
+        for f_pass,f_stop in grid["filter"]:
+            jobs.append((filepath,spindle_speed,order,f_pass,f_stop,grid,cache_dir,transitions,channels,dtype))
+    PreprocessCache(cache_dir) #Creates the directory before the workers race to.
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        rows=[row for result in pool.map(_sweep_recording,jobs) for row in result]
+    return pd.DataFrame(rows)
+
+
+def summarize(results):
+    #Mean scores of every parameter combination over the recordings, best F1 first.
+    parameters=["f_pass","f_stop","time_window","step_size","indicator","threshold"]
+    scored=results.dropna(subset=["F1"]) if "F1" in results else results.iloc[0:0]
+    summary=scored.groupby(parameters)[["Precision","Recall","F1","Detection Delay (s)"]].mean()
+    return summary.sort_values("F1",ascending=False).reset_index()
+
+
+def find_recordings(paths):
+    recordings=[]
+    for path in paths:
+        if os.path.isdir(path):
+            recordings+=sorted(os.path.join(path,name) for name in os.listdir(path) if name.endswith(".csv"))
+        else:
+            recordings.append(path)
+    return recordings
+
+
+if __name__=="__main__":
+    filters=[argument for argument in sys.argv[1:] if "=" in argument]
+    paths=[argument for argument in sys.argv[1:] if "=" not in argument]
+    if filters:
+        catalog=RecordingCatalog()
+        catalog.update()
+        recordings=catalog.recordings(**parse_filters(filters))+find_recordings(paths)
+    else:
+        recordings=find_recordings(paths or ["VibrationData/HurcoVMX42SRTi/4140SteelCutsAlongX"])
+    results=run_sweep(recordings)
+    results.to_csv("SweepResults.csv",index=False)
+    print(summarize(results).head(10).to_string(index=False))
@@ -0,0 +1,160 @@
+"""
+Opt-in real-time profile for the acquisition loop on Linux, and a monitor of how well the loop keeps up.
+Streaming keeps working when the loop falls behind, as LJM buffers the scans, but every late block delays
+the chatter indicators and a backlog that keeps growing ends in lost scans. During a cut the profile
+  - pins the thread running RecordCut, which reads the stream and computes the indicators, to its own
+    cores and moves the dashboard process and the publisher thread to the others,
+  - runs that thread under SCHED_FIFO, or failing that at a raised priority (lower niceness),
+  - locks the process's memory, including the buffers RecordCut allocated, so it is never paged out,
+  - disables the garbage collector, or freezes everything allocated so far out of its reach, and
+    collects between cuts instead.
+Every setting is undone when the cut ends, before the recording is exported. Settings the process is not
+permitted to make (SCHED_FIFO, negative niceness and memory locking usually need root, CAP_SYS_NICE or
+CAP_IPC_LOCK, and a high enough "ulimit -l") are skipped and listed by Describe.
+
+JitterMonitor is used for every cut, with or without the profile, so the two can be compared under load.
+"""
+
+import ctypes
+import ctypes.util
+import gc
+import os
+import time
+import numpy as np
+
+MCL_CURRENT=1 #mlockall flag from <sys/mman.h>: lock every page mapped now.
+
+
+class JitterMonitor:
+    #Arrival time of every block read from the stream, the time the loop spent on it and the scans still
+    #buffered when it arrived. A block's deadline is the arrival of the next one, one hop later: a loop that
+    #takes longer than the hop falls behind and the buffered backlog grows.
+    def __init__(self, hop):
+        self.hop=hop
+        self.arrivals=[]
+        self.work=[]
+        self.backlogs=[]
+        self.pending=None
+
+    def BlockRead(self, backlog):
+        self.pending=time.perf_counter()
+        self.arrivals.append(self.pending)
+        self.backlogs.append(backlog)
+
+    def BlockDone(self):
+        if self.pending is not None:
+            self.work.append(time.perf_counter()-self.pending)
+            self.pending=None
+
+    def Report(self):
+        #Summary in milliseconds and scans; intervals are measured between consecutive blocks.
+        jitter=np.abs(np.diff(self.arrivals)-self.hop)*1000 if len(self.arrivals)>1 else np.zeros(1)
+        work=np.array(self.work)*1000 if self.work else np.zeros(1)
+        backlogs=np.array(self.backlogs) if self.backlogs else np.zeros(1)
+        return {"Blocks":len(self.arrivals),"Hop (ms)":self.hop*1000,
+                "Median Jitter (ms)":float(np.median(jitter)),"99th Percentile Jitter (ms)":float(np.percentile(jitter,99)),
+                "Max Jitter (ms)":float(jitter.max()),"Median Work (ms)":float(np.median(work)),
+                "Max Work (ms)":float(work.max()),"Missed Deadlines":int(np.count_nonzero(work>self.hop*1000)),
+                "Max Backlog":int(backlogs.max()),"Backlog Growth":int(backlogs[-1]-backlogs[0])}
+
+    def Print(self):
+        report=self.Report()
+        print("Block interval jitter = %0.2f ms median, %0.2f ms 99th percentile, %0.2f ms max" %
+              (report["Median Jitter (ms)"],report["99th Percentile Jitter (ms)"],report["Max Jitter (ms)"]))
+        print("Processing time per block = %0.2f ms median, %0.2f ms max, %i of %i blocks over the %0.0f ms hop" %
+              (report["Median Work (ms)"],report["Max Work (ms)"],report["Missed Deadlines"],report["Blocks"],report["Hop (ms)"]))
+        print("Scan backlog = %i max, grew by %i over the cut" % (report["Max Backlog"],report["Backlog Growth"]))
+
+
+class RealTimeProfile:
+    def __init__(self, cores=None, fifoPriority=50, niceness=-10, lockMemory=True, gcMode="disable"):
+        #cores is the set of CPUs for the acquisition thread, by default the last one the process may use.
+        #fifoPriority is the SCHED_FIFO priority (1-99); None skips SCHED_FIFO and only applies niceness.
+        #gcMode is "disable", "freeze" or None to leave the garbage collector alone.
+        if gcMode not in ("disable","freeze",None):
+            raise ValueError("Unknown garbage collector mode "+repr(gcMode))
+        self.cores=cores
+        self.fifoPriority=fifoPriority
+        self.niceness=niceness
+        self.lockMemory=lockMemory
+        self.gcMode=gcMode
+        self.applied=[] #Settings in effect during the last cut.
+        self.skipped=[] #Settings that could not be made, with the reason.
+        self.saved=None
+
+    def BeginCut(self, helperThreads=(), helperProcesses=()):
+        #Applies the profile to the calling thread. helperThreads are native thread ids and helperProcesses
+        #process ids that are kept off the acquisition cores.
+        self.applied=[]
+        self.skipped=[]
+        thread=0 #The calling thread, for the Linux scheduling calls.
+        self.saved={"affinity":os.sched_getaffinity(thread),"policy":os.sched_getscheduler(thread),
+                    "param":os.sched_getparam(thread),"niceness":os.getpriority(os.PRIO_PROCESS,thread),
+                    "gc":gc.isenabled(),"helpers":[]}
+        available=self.saved["affinity"]
+        cores=set(self.cores) if self.cores else ({max(available)} if len(available)>1 else set(available))
+        self._try("affinity to CPUs "+",".join(map(str,sorted(cores))),os.sched_setaffinity,thread,cores)
+        others=available-cores
+        if others:
+            for helper in list(helperThreads)+list(helperProcesses):
+                try:
+                    self.saved["helpers"].append((helper,os.sched_getaffinity(helper)))
+                    os.sched_setaffinity(helper,others)
+                except OSError as error:
+                    self.skipped.append(("helper "+str(helper)+" affinity",str(error)))
+        if self.fifoPriority is None or not self._try("SCHED_FIFO priority "+str(self.fifoPriority),os.sched_setscheduler,thread,os.SCHED_FIFO,os.sched_param(self.fifoPriority)):
+            self._try("niceness "+str(self.niceness),os.setpriority,os.PRIO_PROCESS,thread,self.niceness)
+        if self.lockMemory:
+            libc=ctypes.CDLL(ctypes.util.find_library("c"),use_errno=True)
+            if libc.mlockall(MCL_CURRENT)==0:
+                self.applied.append("memory locked")
+            else:
+                self.skipped.append(("memory locking",os.strerror(ctypes.get_errno())))
+        if self.gcMode=="disable":
+            gc.disable()
+            self.applied.append("garbage collector disabled")
+        elif self.gcMode=="freeze":
+            gc.freeze() #Everything allocated before the cut is never scanned again.
+            self.applied.append("garbage collector frozen")
+
+    def EndCut(self):
+        #Undoes BeginCut and collects the garbage of the cut, outside the time-critical part.
+        if self.saved is None:
+            return
+        thread=0
+        try:
+            os.sched_setscheduler(thread,self.saved["policy"],self.saved["param"])
+        except OSError:
+            pass #Returning to the saved policy only lowers the priority, which is always permitted.
+        try:
+            os.setpriority(os.PRIO_PROCESS,thread,self.saved["niceness"])
+        except OSError:
+            pass #Raising niceness back is always permitted; lowering it below the saved value needs privilege.
+        os.sched_setaffinity(thread,self.saved["affinity"])
+        for helper,affinity in self.saved["helpers"]:
+            try:
+                os.sched_setaffinity(helper,affinity)
+            except OSError:
+                pass #The dashboard may have been closed during the cut.
+        if self.lockMemory:
+            ctypes.CDLL(ctypes.util.find_library("c"),use_errno=True).munlockall()
+        if self.gcMode=="freeze":
+            gc.unfreeze()
+        if self.saved["gc"]:
+            gc.enable()
+        gc.collect()
+        self.saved=None
+
+    def Describe(self):
+        lines=["Real-time profile: "+(", ".join(self.applied) or "nothing applied")]
+        lines+=["  not applied: "+setting+" ("+reason+")" for setting,reason in self.skipped]
+        return "\n".join(lines)
+
+    def _try(self, setting, function, *arguments):
+        try:
+            function(*arguments)
+        except OSError as error:
+            self.skipped.append((setting,error.strerror or str(error)))
+            return False
+        self.applied.append(setting)
+        return True
@@ -0,0 +1,181 @@
+"""
+Renders review plots for a batch of recordings without opening a single window, for unattended nightly
+reviews instead of running GraphChatter.py, CI_Generator.py or main.py on one file at a time.
+Every recording gets one PNG with its acceleration, the modified chatter indicator against its threshold,
+and the Poincare section (the displacement at every bisection point, coloured by time) next to the
+trajectory of the window with the highest indicator. Figures are drawn with matplotlib's Agg canvas in
+worker processes, and the filtered and integrated signals come from a PreprocessCache, so recordings
+analyzed before are not processed again. An image is only redrawn when its recording is newer than it.
+
+index.html in the output directory lists every recording with its spindle speed, peak indicator and
+share of windows above the threshold, worst first, and links to the figures.
+
+Usage: python ReportGenerator.py [--output=DIRECTORY] [--workers=N] [--force] [directory, recording or catalog filter ...]
+Catalog filters select recordings from ChatterCore.Catalog as in ParameterSweep.py, e.g. rpm=3000-4000.
+"""
+
+import html
+import os
+import sys
+import time
+import numpy as np
+from ChatterCore import ChatterAnalysis, PreprocessCache, RecordingCatalog
+from ChatterCore.Catalog import parse_filters
+from ParameterSweep import find_recordings, spindle_speed_from_name
+
+DEFAULT_OUTPUT="Reports"
+TIME_WINDOW=0.3
+STEP_SIZE=0.1
+MAX_PLOT_POINTS=20000 #Readings drawn per channel; longer recordings are plotted as a min/max envelope.
+
+
+def common_root(filepaths):
+    #Deepest directory holding every recording, which image names are taken relative to.
+    return os.path.commonpath([os.path.dirname(os.path.abspath(filepath)) for filepath in filepaths]) if filepaths else ""
+
+
+def image_name(filepath, root):
+    #Flat, unique file name for a recording's figure relative to root, e.g. CutsAlongX__EBI_..._3000RPM.png
+    #for the recordings of VibrationData/HurcoVMX42SRTi.
+    relative=os.path.relpath(os.path.splitext(os.path.abspath(filepath))[0],root)
+    return relative.replace(os.sep,"__")+".png"
+
+
+def envelope(times, values, points=MAX_PLOT_POINTS):
+    #Times and values at most 2*points long that keep every peak, for plotting long recordings quickly.
+    if len(times)<=points:
+        return times,values
+    stride=int(np.ceil(len(times)/points))
+    usable=len(times)//stride*stride
+    blocks=values[:usable].reshape(-1,stride)
+    t=times[:usable:stride]
+    return np.repeat(t,2),np.column_stack((blocks.min(axis=1),blocks.max(axis=1))).ravel()
+
+
+def render_recording(filepath, spindle_speed, column_order, image, cache_dir):
+    #Draws the figure of one recording and returns its summary row.
+    from matplotlib.figure import Figure #Imported here so only the workers load matplotlib.
+    helper=ChatterAnalysis(filepath,spindle_speed,column_order,cache=PreprocessCache(cache_dir,memory_entries=0))
+    chatsT,chatsI=helper.calculate_chatter_indicator(TIME_WINDOW,STEP_SIZE)
+    threshold=float(helper.threshold[0]) if len(helper.threshold) else np.nan
+    worst=int(np.nanargmax(chatsI)) if np.any(~np.isnan(chatsI)) else None
+
+    figure=Figure(figsize=(14,9),layout="constrained")
+    axes=figure.subplot_mosaic([["accel","accel"],["indicator","indicator"],["poincare","trajectory"]])
+    figure.suptitle(os.path.basename(filepath)+" at "+str(int(spindle_speed))+" RPM")
+    for name,accel in zip(helper.channels,helper.accel):
+        axes["accel"].plot(*envelope(helper.timeF,accel),linewidth=0.5,label=name)
+    axes["accel"].set_title("Acceleration Time Series")
+    axes["accel"].set_ylabel("Acceleration (m/s^2)")
+    axes["accel"].legend(loc="upper right")
+    axes["indicator"].plot(chatsT,chatsI,"b.-")
+    axes["indicator"].plot(chatsT,helper.threshold,"r--")
+    axes["indicator"].set_title("Modified Chatter Indicator Time Series")
+    axes["indicator"].set_xlabel("Time (s)")
+    bisections=np.flatnonzero(helper.bisectionTimes)
+    section=axes["poincare"].scatter(helper.dispX[bisections],helper.dispY[bisections],c=helper.timeF[bisections],s=4)
+    figure.colorbar(section,ax=axes["poincare"],label="Time (s)")
+    axes["poincare"].set_title("Poincare Section")
+    axes["poincare"].set_xlabel("Displacement X")
+    axes["poincare"].set_ylabel("Displacement Y")
+    if worst is not None:
+        w_length=int(helper.f_sample*TIME_WINDOW)
+        w_start=int(np.searchsorted(helper.timeF,chatsT[worst]))-w_length//2
+        w_start=max(w_start,0)
+        bis=helper.window_bisections(w_start,w_start+w_length)
+        axes["trajectory"].plot(helper.dispX[w_start:w_start+w_length],helper.dispY[w_start:w_start+w_length],linewidth=0.5)
+        axes["trajectory"].plot(helper.dispX[bis],helper.dispY[bis],"ro",markersize=3)
+        axes["trajectory"].set_title("Trajectory at %0.1f s (highest indicator)" % chatsT[worst])
+    partial=image[:-4]+"."+str(os.getpid())+".tmp.png"
+    figure.savefig(partial,dpi=80)
+    os.replace(partial,image)
+    valid=chatsI[~np.isnan(chatsI)]
+    return {"File":filepath,"Image":os.path.basename(image),"Spindle Speed":spindle_speed,"Windows":len(chatsI),
+            "Peak Indicator":float(valid.max()) if len(valid) else np.nan,"Threshold":threshold,
+            "Above Threshold":float(np.mean(valid>threshold)) if len(valid) else np.nan}
+
+
+def _render_job(job):
+    filepath,spindle_speed,column_order,image,cache_dir,summary=job
+    try:
+        if summary is not None:
+            return summary
+        return render_recording(filepath,spindle_speed,column_order,image,cache_dir)
+    except Exception as error: #One bad recording must not stop a nightly run.
+        return {"File":filepath,"Image":None,"Spindle Speed":spindle_speed,"Error":str(error)}
+
+
+def _load_summaries(output):
+    #Summary rows of the previous run, so unchanged recordings keep their row without being analyzed.
+    import json #Imported here as only the index needs it.
+    path=os.path.join(output,"summary.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path,mode="r") as file:
+        return {row["File"]:row for row in json.load(file)}
+
+
+def write_index(rows, output):
+    import json #Imported here as only the index needs it.
+    with open(os.path.join(output,"summary.json"),"w") as file:
+        json.dump(rows,file,indent=1)
+    ordered=sorted(rows,key=lambda row: -np.nan_to_num(row.get("Above Threshold",np.nan),nan=-1.0))
+    lines=["<!DOCTYPE html>","<html><head><meta charset='utf-8'><title>Chatter Report</title>",
+           "<style>body{font-family:sans-serif} td,th{padding:2px 8px;text-align:left} img{width:320px}</style></head><body>",
+           "<h1>Chatter Report</h1><p>"+str(len(rows))+" recordings, generated "+time.strftime("%Y-%m-%d %H:%M:%S")+".</p>",
+           "<table><tr><th>Figure</th><th>Recording</th><th>RPM</th><th>Windows</th><th>Peak Indicator</th><th>Above Threshold</th></tr>"]
+    for row in ordered:
+        if row.get("Image") is None:
+            lines.append("<tr><td></td><td>"+html.escape(row["File"])+"</td><td colspan='4'>Failed: "+html.escape(row.get("Error",""))+"</td></tr>")
+            continue
+        link=html.escape(row["Image"])
+        lines.append("<tr><td><a href='"+link+"'><img src='"+link+"' loading='lazy'></a></td><td>"+html.escape(row["File"])+"</td>"
+                     +"<td>%d</td><td>%d</td><td>%0.3f</td><td>%0.0f%%</td></tr>" % (row["Spindle Speed"],row["Windows"],row["Peak Indicator"],100*row["Above Threshold"]))
+    lines.append("</table></body></html>")
+    with open(os.path.join(output,"index.html"),"w") as file:
+        file.write("\n".join(lines))
+
+
+def generate_report(recordings, output=DEFAULT_OUTPUT, cache_dir="ChatterCache", max_workers=None, force=False):
+    #recordings are file paths or (file path, spindle speed[, column order]) as RecordingCatalog.recordings
+    #returns them. Returns the summary rows and writes the figures and index.html to output.
+    os.makedirs(output,exist_ok=True)
+    PreprocessCache(cache_dir) #Creates the directory before the workers race to.
+    previous={} if force else _load_summaries(output)
+    recordings=[(recording,spindle_speed_from_name(recording)) if isinstance(recording,str) else recording for recording in recordings]
+    root=common_root([recording[0] for recording in recordings])
+    jobs=[]
+    for recording in recordings:
+        filepath,spindle_speed=recording[0],recording[1]
+        if spindle_speed is None:
+            print("Skipping",filepath,"as its spindle speed is unknown.")
+            continue
+        image=os.path.join(output,image_name(filepath,root))
+        summary=previous.get(filepath)
+        #Only a row with this figure is reused, so recordings that failed last time are tried again.
+        current=(summary is not None and summary.get("Image")==os.path.basename(image) and os.path.exists(image)
+                 and os.path.getmtime(image)>=os.path.getmtime(filepath))
+        jobs.append((filepath,spindle_speed,recording[2] if len(recording)>2 else "TXYZ",image,cache_dir,
+                     summary if current else None))
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        rows=list(pool.map(_render_job,jobs))
+    write_index(rows,output)
+    return rows
+
+
+if __name__=="__main__":
+    options={argument.split("=")[0]:argument.partition("=")[2] for argument in sys.argv[1:] if argument.startswith("--")}
+    arguments=[argument for argument in sys.argv[1:] if not argument.startswith("--")]
+    filters=[argument for argument in arguments if "=" in argument]
+    paths=[argument for argument in arguments if "=" not in argument]
+    if filters:
+        catalog=RecordingCatalog()
+        catalog.update()
+        recordings=catalog.recordings(**parse_filters(filters))+find_recordings(paths)
+    else:
+        recordings=find_recordings(paths or ["VibrationData/HurcoVMX42SRTi/4140SteelCutsAlongX"])
+    began=time.perf_counter()
+    rows=generate_report(recordings,options.get("--output") or DEFAULT_OUTPUT,max_workers=int(options["--workers"]) if options.get("--workers") else None,force="--force" in options)
+    failed=sum(1 for row in rows if row.get("Image") is None)
+    print(len(rows),"recordings reported in %0.1f s," % (time.perf_counter()-began),failed,"failed. Open",os.path.join(options.get("--output") or DEFAULT_OUTPUT,"index.html"))
@@ -191,23 +191,10 @@ if __name__ == '__main__':
     app = MyApp()
     app.MainLoop()
     print("Done!")
-    timesEBI=[]
-    col1EBI=[]
-    col2EBI=[]
-    col3EBI=[]
-    with open(filenameEBI,mode="r") as file:
-        csvFile = csv.reader(file)
-        for lines in csvFile:
-            try:
-                timesEBI.append(float(lines[0]))
-                col1EBI.append(float(lines[1]))
-                col2EBI.append(float(lines[2]))
-                col3EBI.append(float(lines[3]))
-            except:
-                pass
-    with open(filenameEBI,'w',newline="") as csvfile:
-        csvwriter = csv.writer(csvfile)
-        for reading in range(len(timesEBI)):
-            if reading==0:
-                csvwriter.writerow(["Time (s)","Accel X (m/s^2)","Accel Y (m/s^2)","Accel Z (m/s^2)"])
-            csvwriter.writerow([timesEBI[reading]+offset,col1EBI[reading],col2EBI[reading],col3EBI[reading]])
\ No newline at end of file
+    #The EBI recording is shifted onto the PCB timeline. NormalizeCorpus rewrites it atomically and records the
+    #shift, so running the aligner again cannot shift the same file twice.
+    from NormalizeCorpus import normalize_file
+    if normalize_file(filenameEBI,[("shift_time",offset)]):
+        print("Shifted",filenameEBI,"by",offset,"s.")
+    else:
+        print(filenameEBI,"was already shifted; run NormalizeCorpus.py with --force to shift it again.")
\ No newline at end of file
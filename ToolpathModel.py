@@ -0,0 +1,194 @@
+"""
+Depth of cut and in-bounds status from a precomputed model of the cut, so ChatterDetector no longer asks
+the controller for the tool position every time it needs them.
+A model is a lookup table along the cut: for every position X (mm from the part zero) the depth of cut in
+mm and whether the tool is far enough inside the workpiece, plus the programmed feed that turns the time
+since the cut started into a position. It is built from
+  - the ramp geometry ChatterDetector has always used (FromRamp): a straight pass whose depth grows by
+    tan(inclineAngle) per mm of travel, as in Miscellaneous/Ramp1.pdf,
+  - the part program (FromPartProgram): the G0/G1 moves are followed and the depth is the stock top minus
+    the tool's Z, or
+  - a JSON file (FromConfig) holding either of those, or a list of [X, depth] points and a feed rate.
+Only single passes in +X are modelled, which is how every test cut is run.
+
+Positions are looked up directly, or from the time since the cut started once the model is anchored, so a
+chatter event costs no controller round-trip at all. A model also holds a schedule of X against time. For a
+part program it times every move, rapids and plunges included, and every dwell, so the model can be
+anchored at cycle start (AnchorStart). Otherwise the tool is taken to move at the programmed feed, and the
+model is anchored with a position reading (Anchor). Either way the schedule cannot know about acceleration
+or feed override, so ChatterDetector re-anchors it with a position reading at the first window it puts
+inside the part.
+"""
+
+import json
+import os
+import re
+import numpy as np
+
+INCH=25.4
+RAPID_RATE=24000.0 #Rapid traverse rate, in mm/min, used to time G0 moves.
+
+
+def parse_part_program(path):
+    #Tool positions of the linear moves in a G-code program as (x, z, feed, rapid, dwell) rows, in mm and
+    #mm/min. Absolute (G90) and incremental (G91) moves and inch (G20) and millimetre (G21) units are followed.
+    #A dwell (G4 with P in milliseconds or X in seconds) is a row that stays where the tool is for dwell seconds.
+    x=z=0.0
+    feed=0.0
+    rapid=True
+    scale=1.0
+    incremental=False
+    moves=[]
+    with open(path,mode="r") as file:
+        for line in file:
+            line=re.sub(r"\(.*?\)","",line).split(";")[0].upper()
+            words={letter:float(value) for letter,value in re.findall(r"([A-Z])\s*([-+]?\d*\.?\d+)",line)}
+            codes=[int(code) for code in re.findall(r"G\s*(\d+)",line)]
+            if 4 in codes:
+                moves.append((x,z,feed,False,words["P"]/1000 if "P" in words else words.get("X",0.0)))
+                continue
+            for code in codes:
+                if code in (0,1):
+                    rapid=code==0
+                elif code in (20,21):
+                    scale=INCH if code==20 else 1.0
+                elif code in (90,91):
+                    incremental=code==91
+            if "F" in words:
+                feed=words["F"]*scale
+            if "X" not in words and "Z" not in words:
+                continue
+            newX=words.get("X",0.0 if incremental else x/scale)*scale
+            newZ=words.get("Z",0.0 if incremental else z/scale)*scale
+            x,z=(x+newX,z+newZ) if incremental else (newX,newZ)
+            moves.append((x,z,feed,rapid,0.0))
+    return moves
+
+
+class ToolpathModel:
+    def __init__(self, positions, depths, feedRate, margin=10.0, step=0.1, bounds=None, schedule=None, cutTimes=None):
+        #positions and depths describe the cut as a polyline, positions increasing. feedRate is in mm/min.
+        #The tool counts as in bounds when it is at least margin mm inside the part, which spans bounds
+        #(entry, exit) or, by default, the positions where the depth is above zero.
+        #schedule is (times, positions) of the tool in seconds from cycle start and mm, and cutTimes the part of
+        #it where X increases along the cut. By default the tool moves along the polyline at feedRate.
+        positions=np.asarray(positions,dtype=np.float64)
+        depths=np.asarray(depths,dtype=np.float64)
+        if np.any(np.diff(positions)<=0):
+            raise ValueError("Toolpath positions must increase along the cut")
+        self.feedRate=feedRate
+        self.margin=margin
+        self.positions=np.linspace(positions[0],positions[-1],int(np.ceil((positions[-1]-positions[0])/step))+1) #The lookup table.
+        self.step=self.positions[1]-self.positions[0]
+        self.depths=np.interp(self.positions,positions,depths)
+        if bounds is None:
+            cutting=np.flatnonzero(self.depths>0)
+            bounds=(self.positions[cutting[0]],self.positions[cutting[-1]]) if len(cutting) else (np.nan,np.nan)
+        self.entry,self.exit=bounds
+        self.inside=(self.positions>=self.entry+margin-self.step/2)&(self.positions<=self.exit-margin+self.step/2)
+        self.programmed=schedule is not None #Whether the schedule times the whole program from cycle start.
+        if schedule is None:
+            schedule=((positions-positions[0])/(feedRate/60),positions)
+        self.scheduleTimes=np.asarray(schedule[0],dtype=np.float64)
+        self.schedulePositions=np.asarray(schedule[1],dtype=np.float64)
+        if cutTimes is None:
+            cutTimes=(self.scheduleTimes[0],self.scheduleTimes[-1])
+        self.cutWindow=cutTimes
+        #Time at every position of the cut, for Anchor. Where X stands still, e.g. in a plunge, the tool is taken
+        #to arrive at the start of it.
+        cut=np.flatnonzero((self.scheduleTimes>=cutTimes[0])&(self.scheduleTimes<=cutTimes[-1]))
+        ahead=np.concatenate(([True],self.schedulePositions[cut][1:]>np.maximum.accumulate(self.schedulePositions[cut])[:-1]))
+        self.cutPositions=self.schedulePositions[cut][ahead]
+        self.cutTimes=self.scheduleTimes[cut][ahead]
+        self.timeOffset=None #Schedule time at cut time 0, set by Anchor or AnchorStart.
+
+    @classmethod
+    def FromRamp(cls, lengthX, inclineAngle, feedRate, margin=10.0, step=0.1):
+        #A pass along the whole workpiece whose depth grows linearly from 0 at the part zero.
+        return cls([0.0,lengthX],[0.0,np.tan(np.radians(inclineAngle))*lengthX],feedRate,margin,step,(0.0,lengthX))
+
+    @classmethod
+    def FromPartProgram(cls, path, stockTop=0.0, margin=10.0, step=0.1, rapidRate=RAPID_RATE):
+        #Depth is stockTop minus the tool's Z along the feed moves that go below the stock top, in part coordinates.
+        #Every move is timed from the end of the first one, feed moves at their feed and rapids at rapidRate.
+        moves=parse_part_program(path)
+        cutting=[k for k,move in enumerate(moves) if not move[3] and move[1]<stockTop]
+        if not cutting:
+            raise ValueError("No feed move in "+path+" goes below the stock top")
+        times=[0.0]
+        for previous,move in zip(moves[:-1],moves[1:]):
+            rate=rapidRate if move[3] else move[2]
+            length=np.hypot(move[0]-previous[0],move[1]-previous[1])
+            times.append(times[-1]+move[4]+(length/(rate/60) if rate>0 else 0.0))
+        #The cut runs from where the first move below the stock top starts to where the move after the last one ends.
+        first,last=max(cutting[0]-1,0),min(cutting[-1]+1,len(moves)-1)
+        section=moves[first:last+1]
+        positions=np.array([move[0] for move in section])
+        keep=np.concatenate(([True],np.diff(positions)>0)) #Plunges and retracts at one X keep their deepest point.
+        depths=np.maximum(stockTop-np.array([move[1] for move in section]),0.0)
+        for k in np.flatnonzero(~keep):
+            depths[k-1]=max(depths[k-1],depths[k])
+        feeds=[move[2] for move in section if move[2]>0 and not move[3]]
+        return cls(positions[keep],depths[keep],feeds[len(feeds)//2] if feeds else 1.0,margin,step,
+                   schedule=(times,[move[0] for move in moves]),cutTimes=(times[first],times[last]))
+
+    @classmethod
+    def FromConfig(cls, path):
+        #JSON with "program" (a part program next to it, plus optional "stockTop" and "rapidRate"), "ramp"
+        #({"lengthX", "inclineAngle", "feedRate"}) or "profile" ([[X, depth], ...] with "feedRate"), and an
+        #optional "margin" in mm.
+        with open(path,mode="r") as file:
+            config=json.load(file)
+        margin=config.get("margin",10.0)
+        if "program" in config:
+            return cls.FromPartProgram(os.path.join(os.path.dirname(path),config["program"]),config.get("stockTop",0.0),margin,
+                                       rapidRate=config.get("rapidRate",RAPID_RATE))
+        if "ramp" in config:
+            ramp=config["ramp"]
+            return cls.FromRamp(ramp["lengthX"],ramp["inclineAngle"],ramp["feedRate"],margin)
+        profile=np.array(config["profile"],dtype=np.float64)
+        return cls(profile[:,0],profile[:,1],config["feedRate"],margin)
+
+    def Anchor(self, position, t=0.0):
+        #Ties cut time t to the tool being at position along the cut, from a position reading. Positions off the
+        #cut are reached at the programmed feed.
+        if position<self.cutPositions[0]:
+            scheduleTime=self.cutTimes[0]-(self.cutPositions[0]-position)/(self.feedRate/60)
+        elif position>self.cutPositions[-1]:
+            scheduleTime=self.cutTimes[-1]+(position-self.cutPositions[-1])/(self.feedRate/60)
+        else:
+            scheduleTime=np.interp(position,self.cutPositions,self.cutTimes)
+        self.timeOffset=scheduleTime-t
+
+    def AnchorStart(self, t=0.0):
+        #Ties cut time t to cycle start, the beginning of a programmed schedule.
+        self.timeOffset=self.scheduleTimes[0]-t
+
+    def IsAnchored(self):
+        return self.timeOffset is not None
+
+    def PositionAt(self, t):
+        #Position at cut time t, following the schedule and moving at the programmed feed past its ends.
+        scheduleTime=t+self.timeOffset
+        if scheduleTime<self.scheduleTimes[0]:
+            return self.schedulePositions[0]+(scheduleTime-self.scheduleTimes[0])*(self.feedRate/60)
+        if scheduleTime>self.scheduleTimes[-1]:
+            return self.schedulePositions[-1]+(scheduleTime-self.scheduleTimes[-1])*(self.feedRate/60)
+        return float(np.interp(scheduleTime,self.scheduleTimes,self.schedulePositions))
+
+    def DepthAt(self, position):
+        return np.interp(position,self.positions,self.depths,left=0.0,right=0.0)
+
+    def InBoundsAt(self, position):
+        index=int(round((position-self.positions[0])/self.step))
+        return 0<=index<len(self.positions) and bool(self.inside[index])
+
+    def Cutting(self, t):
+        #False while a programmed schedule is before or after the cut, e.g. in the approach or the rapid back.
+        return not self.programmed or self.cutWindow[0]<=t+self.timeOffset<=self.cutWindow[1]
+
+    def DepthAtTime(self, t):
+        return self.DepthAt(self.PositionAt(t)) if self.Cutting(t) else 0.0
+
+    def InBoundsAtTime(self, t):
+        return self.Cutting(t) and self.InBoundsAt(self.PositionAt(t))
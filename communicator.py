@@ -1,11 +1,44 @@
+import numpy as np
 import ChatterDetector as CD
+from CutPlanner import CutPlanner
 #D0.05IN for first batch.
-detector=CD.ChatterDetector()
-detector.ConnectMachine()
-POINTS_TO_COLLECT=8
-while len(detector.lobeRPM)<POINTS_TO_COLLECT:
-    print(detector.lobeDepth)
-    print(detector.lobeRPM)
-    detector.RecordCut()
-detector.MachineShutdown()
-detector.CreateStabilityLobe()
\ No newline at end of file
+MAX_CUTS=20
+TOLERANCE=0.02 #Stops once the critical depth is known to within this many inches at every planned speed.
+RAMP_TOLERANCE=0.05 #Largest difference in mm between the part program in toolpathFile and the planned ramp.
+
+
+def ramp_mismatch(loaded, planned):
+    #Largest depth difference in mm between two toolpath models where the planned one is in bounds.
+    positions=planned.positions[planned.inside]
+    return float(np.max(np.abs(loaded.DepthAt(positions)-planned.DepthAt(positions))))
+
+
+#Guarded because the live dashboard is started with "spawn", which re-imports this script in the new process.
+if __name__=="__main__":
+    detector=CD.ChatterDetector()
+    detector.ConnectMachine()
+    planner=CutPlanner(minRPM=2500,maxRPM=3500,maxDepth=0.5,model=detector.long_function)
+    while len(planner.cuts)<MAX_CUTS and not planner.Confident(TOLERANCE):
+        rpm,startDepth,endDepth=planner.NextCut()
+        print("Next cut: %d RPM, ramp from %0.3f in to %0.3f in inside the part." % (rpm,startDepth,endDepth))
+        planned=planner.RampToolpath(startDepth,endDepth,detector.MaterialLengthX,detector.feedRate)
+        #The machine runs whatever program the operator loaded, so the planned ramp is only used once it is confirmed.
+        if input("Load this cut on the machine, then press Enter to record it or type q to stop: ").strip().lower()=="q":
+            break
+        if detector.toolpathFile is None:
+            detector.toolpath=planned
+        else:
+            detector.toolpath=None #Read again, as the program may have changed since the last cut.
+            mismatch=ramp_mismatch(detector.LoadToolpath(),planned)
+            if mismatch>RAMP_TOLERANCE:
+                print("%s differs from the planned ramp by up to %0.2f mm, stopping." % (detector.toolpathFile,mismatch))
+                break
+        detector.RecordCut()
+        if detector.cutRPM is None:
+            print("The cut was not recorded, stopping.")
+            break
+        planner.AddCut(detector.cutRPM,startDepth,endDepth,detector.cutTransitions) #The measured speed, not the planned one.
+        print(detector.lobeDepth)
+        print(detector.lobeRPM)
+    detector.MachineShutdown()
+    detector.CreateStabilityLobe()
@@ -10,7 +10,7 @@ chatsT,chatsI=ChatterHelper.calculate_chatter_indicator(time_window=0.3,step_siz
 #ChatterHelper.show_raw_accelerations(figure_number=2)
 #ChatterHelper.show_trajectory(given_time=6.9,time_window=0.3,figure_number=3)
 #ChatterHelper.output_trajectory_gif(time_window=0.3, step_size=0.1)
-CAE=ChatterAutoEncoder()
+CAE=ChatterAutoEncoder() #Needs a model trained with ChatterAutoEncoder.train on stable recordings.
 CAE.load_data(filename,"TZXY",200)
 CAE.predict_chatter(0.10)
 lossV=CAE.plot_chatter()